@@ -45,7 +45,8 @@ setuptools.setup(
     packages=setuptools.find_packages(where="src"),
     python_requires=">=3.5.0",
     extras_require={
-        "DEV": ["psutil", "pytest", "pytest-cov", "pytest-order"]
+        "DEV": ["psutil", "pytest", "pytest-cov", "pytest-order"],
+        "ORJSON": ["orjson"]
     },
     entry_points={
         'console_scripts': ['ghidra-pipe=scripts.ghidra_pipe:main']
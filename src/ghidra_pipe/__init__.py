@@ -24,9 +24,19 @@ from .pipe_default_conf import PIPE_IP
 from .pipe_client import PipeClient
 from .pipe_client import PipeClientJsonRpc
 from .pipe_client import TcpJsonCom
+from .pipe_client import TcpClientPool
+from .pipe_client import FileTransferStats
+from .pipe_client import RemoteIterator
+from .pipe_client import RemoteSequenceProxy
+from .pipe_client import RemoteMappingProxy
 
 from .pipe_client import TcpNetIoError
 from .pipe_client import PipeServerInternalErr
+from .pipe_client import PipeServerMethodNotFound
 from .pipe_client import PipeServerRemoteCodeExecErr
 from .pipe_client import PipeFileTransferErr
 from .pipe_client import PipeCustomComNotFound
+
+from .pipe_async_client import AsyncPipeClient
+from .pipe_async_client import AsyncPipeClientJsonRpc
+from .pipe_async_client import AsyncTcpClientPool
@@ -0,0 +1,546 @@
+################################################################################
+#
+# Copyright 2022 Vincent Dary
+#
+# This file is part of ghidra-pipe.
+#
+# ghidra-pipe is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# ghidra-pipe is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# ghidra-pipe. If not, see <https://www.gnu.org/licenses/>.
+#
+################################################################################
+
+from typing import Tuple, Any, Union
+import asyncio
+import socket
+import inspect
+import sys
+import os
+import struct
+import hashlib
+import textwrap
+import time
+import uuid
+
+from .pipe_client import PIPE_PORT, PIPE_IP
+from .pipe_client import PIPE_KEEP_ALIVE_TIMEOUT, PIPE_POOL_SIZE
+from .pipe_client import PIPE_UNIX_SOCKET, PIPE_IO_BUFFER_SIZE
+from .pipe_client import PIPE_ATTACHMENTS, FRAME_LENGTH_MASK
+from .pipe_client import TcpNetIoError, frame_encode, frame_decode
+from .pipe_client import PipeFileTransferErr, PipeCustomComNotFound
+from .pipe_client import PipeServerMethodNotFound
+from .pipe_client import PipeClientJsonRpc, attach_proxy_meta
+from .pipe_client import FileTransferStats
+
+
+class AsyncTcpNetIo:
+    def __init__(self, reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def sendall(self, data: bytes):
+        self.writer.write(data)
+        await self.writer.drain()
+
+    async def recvall(self, data_len: int) -> bytes:
+        try:
+            return await self.reader.readexactly(data_len)
+        except asyncio.IncompleteReadError:
+            raise TcpNetIoError("socket connection broken")
+
+    async def recvall_to_file(self, data_len, filename) -> int:
+        count = 0
+
+        with open(filename, 'wb') as file:
+            while count < data_len:
+                recv_bytes = await self.reader.read(
+                    min(data_len-count, PIPE_IO_BUFFER_SIZE))
+                if not recv_bytes:
+                    raise TcpNetIoError("socket connection broken")
+                file.write(recv_bytes)
+                count += len(recv_bytes)
+
+        return count
+
+    async def sendall_from_file(self, filename):
+        count = 0
+        data_len = os.path.getsize(filename)
+        # Python 3.7+, the loop running the coroutine
+        loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)()
+
+        with open(filename, 'rb') as file:
+            if hasattr(loop, 'sendfile'):
+                # Python 3.7+, kernel zero-copy when the transport supports it
+                await self.writer.drain()
+                await loop.sendfile(self.writer.transport, file, 0, data_len)
+                return
+            while count < data_len:
+                read_bytes = file.read(min(data_len-count, PIPE_IO_BUFFER_SIZE))
+                self.writer.write(read_bytes)
+                await self.writer.drain()
+                count += len(read_bytes)
+
+
+class AsyncTcpJsonCom:
+    def __init__(self, io: AsyncTcpNetIo, attachments=False):
+        self.io = io
+        # attachments negotiated on the connection, see AsyncTcpClient
+        self.attachments = attachments
+
+    async def send(self, data: dict):
+        flags, buffers = frame_encode(data, self.attachments)
+        body_len = sum(len(buffer) for buffer in buffers)
+        if body_len > FRAME_LENGTH_MASK:
+            raise TcpNetIoError('frame too large')
+        self.io.writer.writelines(
+            [struct.pack('!I', body_len | flags)] + buffers)
+        await self.io.writer.drain()
+
+    async def recv(self) -> dict:
+        json_len = struct.unpack('!I', await self.io.recvall(4))[0]
+        body = await self.io.recvall(json_len & FRAME_LENGTH_MASK)
+        return frame_decode(body, json_len & ~FRAME_LENGTH_MASK)
+
+
+class AsyncTcpClient:
+    def __init__(self, ip_address: str, port: int, unix_socket: str = None):
+        self.ip_address = ip_address
+        self.port = port
+        self.unix_socket = unix_socket
+        self.io = None
+        # the bytearrays are sent as attachments once the server accepted them
+        self.attachments = False
+
+    async def create_connection(self):
+        if self.unix_socket:
+            reader, writer = await asyncio.open_unix_connection(
+                self.unix_socket)
+            self.io = AsyncTcpNetIo(reader, writer)
+            return
+        reader, writer = await asyncio.open_connection(
+            self.ip_address, self.port)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.io = AsyncTcpNetIo(reader, writer)
+
+    async def negotiate_attachments(self):
+        # the server sends its bytearrays as attachments on this connection
+        # once accepted
+        tcp_json_com = AsyncTcpJsonCom(self.io)
+        await tcp_json_com.send({'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                                 'method': 'set_attachments', 'params': {}})
+        response = await tcp_json_com.recv()
+        # an error response leaves the attachments disabled
+        self.attachments = bool(
+            response.get('result', {}).get('attachments'))
+
+    def close_connection(self):
+        self.io.writer.close()
+        self.io = None
+
+    def is_connection_dropped(self) -> bool:
+        return self.io.reader.at_eof()
+
+
+# pool of keep-alive connections to one pipe server, bound to the event loop
+# of its first use, the coroutines of a same loop share it without lock
+class AsyncTcpClientPool:
+    def __init__(self, ip_address: str, port: int, max_idle=PIPE_POOL_SIZE,
+                 idle_timeout=PIPE_KEEP_ALIVE_TIMEOUT / 2,
+                 unix_socket: str = None):
+        self.ip_address = ip_address
+        self.port = port
+        self.unix_socket = unix_socket
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = []
+
+    async def _acquire(self) -> AsyncTcpClient:
+        while self._idle:
+            tcp_client, last_used = self._idle.pop()
+            if (time.monotonic() - last_used < self.idle_timeout
+                    and not tcp_client.is_connection_dropped()):
+                return tcp_client
+            tcp_client.close_connection()
+
+        tcp_client = AsyncTcpClient(self.ip_address, self.port,
+                                    self.unix_socket)
+        await tcp_client.create_connection()
+        if PIPE_ATTACHMENTS:
+            try:
+                await tcp_client.negotiate_attachments()
+            except BaseException:
+                tcp_client.close_connection()
+                raise
+        return tcp_client
+
+    def _release(self, tcp_client: AsyncTcpClient):
+        if len(self._idle) < self.max_idle:
+            self._idle.append((tcp_client, time.monotonic()))
+        else:
+            tcp_client.close_connection()
+
+    def connection(self) -> '_AsyncPoolConnection':
+        return _AsyncPoolConnection(self)
+
+    def clear(self):
+        idle, self._idle = self._idle, []
+        for tcp_client, _ in idle:
+            tcp_client.close_connection()
+
+
+class _AsyncPoolConnection:
+    def __init__(self, pool: AsyncTcpClientPool):
+        self.pool = pool
+        self.tcp_client = None
+
+    async def __aenter__(self) -> AsyncTcpClient:
+        self.tcp_client = await self.pool._acquire()
+        return self.tcp_client
+
+    async def __aexit__(self, exc_type, exc_value, exc_trace):
+        if exc_type is None:
+            self.pool._release(self.tcp_client)
+        else:
+            # the connection state is unknown, never give it back to the pool
+            self.tcp_client.close_connection()
+
+
+class _AsyncRpcNotification:
+    def __init__(self, pool: AsyncTcpClientPool, notification: dict):
+        self.connection = pool.connection()
+        self.notification = notification
+
+    async def __aenter__(self) -> AsyncTcpJsonCom:
+        tcp_client = await self.connection.__aenter__()
+        tcp_json_com = AsyncTcpJsonCom(tcp_client.io, tcp_client.attachments)
+        try:
+            await tcp_json_com.send(self.notification)
+        except BaseException:
+            await self.connection.__aexit__(*sys.exc_info())
+            raise
+        return tcp_json_com
+
+    async def __aexit__(self, exc_type, exc_value, exc_trace):
+        await self.connection.__aexit__(exc_type, exc_value, exc_trace)
+
+
+class AsyncPipeClientJsonRpc:
+    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT,
+                 pool: AsyncTcpClientPool = None,
+                 unix_socket=PIPE_UNIX_SOCKET):
+        self.ip_address = ip_address
+        self.port = port
+        self.unix_socket = unix_socket
+        self.pool = pool or AsyncTcpClientPool(ip_address, port,
+                                               unix_socket=unix_socket)
+
+    _check_response_error = staticmethod(
+        PipeClientJsonRpc._check_response_error)
+    _format_rpc_notification = staticmethod(
+        PipeClientJsonRpc._format_rpc_notification)
+
+    async def _rpc_request(self, method: str, args: {}) -> Union[dict, None]:
+        params = dict(args)
+
+        if 'self' in params:
+            params.pop('self')
+
+        request = {'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                   'method': method, 'params': params}
+
+        async with self.pool.connection() as tcp_client:
+            tcp_json_com = AsyncTcpJsonCom(tcp_client.io,
+                                           tcp_client.attachments)
+            await tcp_json_com.send(request)
+
+            while True:
+                response = await tcp_json_com.recv()
+                if 'id' in response and response['id'] == request['id']:
+                    if 'result' in response:
+                        return response['result']
+                    elif 'error' in response:
+                        self._check_response_error(response['error'])
+                    else:
+                        return
+                elif 'live_stdout' in response:
+                    sys.stdout.write(response['live_stdout'])
+                elif 'live_stderr' in response:
+                    sys.stderr.write(response['live_stderr'])
+
+    def _rpc_notification(self, method: str, args: {}
+                          ) -> _AsyncRpcNotification:
+        params = dict(args)
+
+        if 'self' in params:
+            params.pop('self')
+
+        return _AsyncRpcNotification(
+            self.pool, self._format_rpc_notification(method, params))
+
+    async def server_remote_shutdown(self):
+        await self._rpc_request('remote_shutdown', {})
+
+    async def get_server_banner(self) -> str:
+        return (await self._rpc_request('get_server_banner', {}))['banner']
+
+    async def exec(self, code: str, std_cap=False, std_forward=True
+                   ) -> Union[None, str]:
+        return (await self._rpc_request('code_exec', locals()))['output']
+
+    async def func_exec(self, name: str, args: Tuple, kwargs: dict,
+                        std_forward=True) -> Any:
+        return (await self._rpc_request('func_exec', locals()))['return']
+
+    async def object_proxy_new(self, class_name: str, args: Tuple,
+                               kwargs: dict, std_forward=True) -> str:
+        res = await self._rpc_request('object_proxy_new', locals())
+        return res['object_name']
+
+    async def object_proxy_getattr(self, object_name: str, name: str) -> Any:
+        res = await self._rpc_request('object_proxy_getattr', locals())
+        return res['value'], res['type']
+
+    async def object_proxy_setattr(self, object_name: str, name: str,
+                                   value: Any):
+        await self._rpc_request('object_proxy_setattr', locals())
+
+    async def register_custom_communicator(self, communicator_name: str,
+                                           code: str):
+        await self._rpc_request('register_custom_communicator', locals())
+
+    async def register_code(self, name: str, code: str, communicator=False,
+                            std_forward=True):
+        # see PipeClientJsonRpc.register_code
+        code_hash = hashlib.sha256(code.encode()).hexdigest()
+        params = {'name': name, 'hash': code_hash, 'code': None,
+                  'communicator': communicator, 'std_forward': std_forward}
+        try:
+            res = await self._rpc_request('register_code', params)
+        except PipeServerMethodNotFound:
+            # an older server without register_code
+            if communicator:
+                await self.register_custom_communicator(name, code)
+            else:
+                await self.exec(code, std_forward=std_forward)
+            return
+        if not res['registered']:
+            params['code'] = code
+            await self._rpc_request('register_code', params)
+
+    async def execute_custom_communicator(
+            self, func_name: str, com_type='binary'
+    ) -> Union[AsyncTcpNetIo, AsyncTcpJsonCom]:
+        if com_type not in ['binary', 'json']:
+            raise NotImplementedError('Communication type not supported.')
+
+        req = self._format_rpc_notification(
+            'execute_custom_communicator',
+            {'communicator_name': func_name, 'com_type': com_type})
+        tcp_client = AsyncTcpClient(self.ip_address, self.port,
+                                    self.unix_socket)
+        await tcp_client.create_connection()
+        tcp_json_com = AsyncTcpJsonCom(tcp_client.io)
+        await tcp_json_com.send(req)
+        communicator_found = await tcp_json_com.io.recvall(1)
+        if communicator_found == b'\x00':
+            if com_type == 'binary':
+                return tcp_client.io
+            elif com_type == 'json':
+                return tcp_json_com
+        else:
+            tcp_client.close_connection()
+            raise PipeCustomComNotFound('Custom communicator not found.')
+
+    @staticmethod
+    async def _file_transfer_to_client_len(tcp_json_com: AsyncTcpJsonCom,
+                                           src_file: str) -> int:
+        file_found = await tcp_json_com.io.recvall(1)
+        if file_found == b'\x00':
+            return struct.unpack('!Q', await tcp_json_com.io.recvall(8))[0]
+        raise PipeFileTransferErr("File '{}' not found.".format(src_file))
+
+    async def file_bytes_transfer_to_client(self, src_file: str) -> bytes:
+        async with self._rpc_notification(
+                'file_transfer_to_client', {'src_file': src_file}) as (
+                tcp_json_com):
+            f_len = await self._file_transfer_to_client_len(
+                tcp_json_com, src_file)
+            return await tcp_json_com.io.recvall(f_len)
+
+    async def file_transfer_to_client(self, src_file: str, dst_file: str
+                                      ) -> FileTransferStats:
+        start = time.monotonic()
+        async with self._rpc_notification(
+                'file_transfer_to_client', {'src_file': src_file}) as (
+                tcp_json_com):
+            f_len = await self._file_transfer_to_client_len(
+                tcp_json_com, src_file)
+            count = await tcp_json_com.io.recvall_to_file(f_len, dst_file)
+        return FileTransferStats(count, time.monotonic() - start)
+
+    async def file_bytes_transfer_to_server(self, file_bytes: bytes,
+                                            dst_file: str):
+        params = {'dst_file': dst_file, 'data_len': len(file_bytes)}
+        async with self._rpc_notification(
+                'file_transfer_to_server', params) as tcp_json_com:
+            await tcp_json_com.io.sendall(file_bytes)
+            await tcp_json_com.io.recvall(1)
+
+    async def file_transfer_to_server(self, src_file: str, dst_file: str
+                                      ) -> FileTransferStats:
+        start = time.monotonic()
+        params = {'dst_file': dst_file,
+                  'data_len': os.path.getsize(src_file)}
+        async with self._rpc_notification(
+                'file_transfer_to_server', params) as tcp_json_com:
+            await tcp_json_com.io.sendall_from_file(src_file)
+            await tcp_json_com.io.recvall(1)
+        return FileTransferStats(params['data_len'], time.monotonic() - start)
+
+
+# remote attribute of an async object proxy, awaited it returns the attribute
+# value, called it executes the remote method, set() assigns the attribute
+class AsyncProxyAttr:
+    def __init__(self, gpc: AsyncPipeClientJsonRpc, object_name: str,
+                 name: str, std_forward=True):
+        self._gpc = gpc
+        self._object_name = object_name
+        self._name = name
+        self._std_forward = std_forward
+
+    async def _get(self) -> Any:
+        v_value, _ = await self._gpc.object_proxy_getattr(
+            self._object_name, self._name)
+        return v_value
+
+    def __await__(self):
+        return self._get().__await__()
+
+    def __call__(self, *args, **kwargs):
+        return self._gpc.func_exec(self._object_name + '.' + self._name,
+                                   args, kwargs, self._std_forward)
+
+    def set(self, value: Any):
+        return self._gpc.object_proxy_setattr(
+            self._object_name, self._name, value)
+
+
+class AsyncObjProxy(object):
+    def __init__(self, object_name: str, class_name: str,
+                 pipe_client_rpc: AsyncPipeClientJsonRpc, src: str = None,
+                 std_forward=True):
+        self.__PROXY_IP__ = pipe_client_rpc.ip_address
+        self.__PROXY_PORT__ = pipe_client_rpc.port
+        self.__PROXY_OBJECT_NAME__ = object_name
+        self.__PROXY_SRC__ = src
+        self.__GPC__ = pipe_client_rpc
+        self.__PROXY_CLASS_NAME__ = class_name
+        self.__STD_FORWARD__ = std_forward
+
+    def __getattr__(self, name: str) -> AsyncProxyAttr:
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return AsyncProxyAttr(self.__GPC__, self.__PROXY_OBJECT_NAME__, name,
+                              self.__STD_FORWARD__)
+
+
+class AsyncClassProxy(AsyncObjProxy):
+    async def __call__(self, *args, **kwargs) -> AsyncObjProxy:
+        obj_name = await self.__GPC__.object_proxy_new(
+            self.__PROXY_OBJECT_NAME__, args, kwargs)
+        return AsyncObjProxy(obj_name, self.__PROXY_CLASS_NAME__,
+                             self.__GPC__, self.__PROXY_SRC__,
+                             self.__STD_FORWARD__)
+
+
+class AsyncPipeClient:
+    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT, std_forward=True,
+                 unix_socket=PIPE_UNIX_SOCKET):
+        self.ip_address = ip_address
+        self.port = port
+        self.std_forward = std_forward
+        self.pipe_client_rpc = AsyncPipeClientJsonRpc(
+            self.ip_address, self.port, unix_socket=unix_socket)
+        # direct RPC method binding
+        pcrpc = self.pipe_client_rpc
+        self.get_server_banner = pcrpc.get_server_banner
+        self.server_remote_shutdown = pcrpc.server_remote_shutdown
+        self.file_bytes_transfer_to_client = pcrpc.file_bytes_transfer_to_client
+        self.file_transfer_to_client = pcrpc.file_transfer_to_client
+        self.file_bytes_transfer_to_server = pcrpc.file_bytes_transfer_to_server
+        self.file_transfer_to_server = pcrpc.file_transfer_to_server
+
+    async def exec(self, code: str, std_cap=False) -> Union[None, str]:
+        return await self.pipe_client_rpc.exec(code, std_cap, self.std_forward)
+
+    def obj_proxy_factory(self, object_name: str, class_name: str = None,
+                          src: str = None) -> AsyncObjProxy:
+        return AsyncObjProxy(object_name, class_name, self.pipe_client_rpc,
+                             src, self.std_forward)
+
+    def class_proxy_factory(self, class_name: str, src: str
+                            ) -> AsyncClassProxy:
+        return AsyncClassProxy(class_name, class_name, self.pipe_client_rpc,
+                               src, self.std_forward)
+
+    async def register_class(self, class_obj: Any) -> AsyncClassProxy:
+        if not inspect.isclass(class_obj):
+            raise ValueError("'{}' object must be a class.".format(
+                class_obj.__name__))
+        src = textwrap.dedent(inspect.getsource(class_obj))
+        await self.pipe_client_rpc.register_code(class_obj.__name__, src,
+                                                 std_forward=self.std_forward)
+        return self.class_proxy_factory(class_obj.__name__, src)
+
+    def func_proxy_factory(self, func_name: str, src: str = None) -> callable:
+        json_rpc_client = self.pipe_client_rpc
+
+        async def func_proxy(*args, **kwargs) -> Any:
+            return await json_rpc_client.func_exec(func_name, args, kwargs,
+                                                   self.std_forward)
+
+        attach_proxy_meta(func_proxy, func_name, self.ip_address, self.port,
+                          src)
+        return func_proxy
+
+    async def register_func(self, func: callable) -> callable:
+        if not inspect.isfunction(func):
+            raise ValueError("'{}' object must be a function.".format(
+                func.__name__))
+        src = textwrap.dedent(inspect.getsource(func))
+        await self.pipe_client_rpc.register_code(func.__name__, src,
+                                                 std_forward=self.std_forward)
+        return self.func_proxy_factory(func.__name__, src)
+
+    def communicator_proxy_factory(self, func_name: str, com_type: str,
+                                   src: str = None) -> callable:
+        json_rpc_client = self.pipe_client_rpc
+
+        async def communicator_proxy() -> Union[AsyncTcpNetIo,
+                                                AsyncTcpJsonCom]:
+            return await json_rpc_client.execute_custom_communicator(
+                func_name, com_type)
+
+        attach_proxy_meta(communicator_proxy, func_name, self.ip_address,
+                          self.port, src)
+        return communicator_proxy
+
+    async def register_custom_communicator(self, func: callable,
+                                           com_type='binary') -> callable:
+        if not inspect.isfunction(func):
+            raise ValueError("'{}' must be a function.".format(func.__name__))
+        src = textwrap.dedent(inspect.getsource(func))
+        await self.pipe_client_rpc.register_code(func.__name__, src, True,
+                                                 self.std_forward)
+        return self.communicator_proxy_factory(func.__name__, com_type, src)
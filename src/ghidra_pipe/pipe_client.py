@@ -20,26 +20,137 @@
 
 from typing import Tuple, Any, Union, Iterator, List
 import socket
+import select
 import inspect
+import ast
+import importlib
+import io
+import zipfile
+import types
 import sys
 import os
+import re
 import struct
 import json
 import base64
+import hashlib
+import zlib
 import textwrap
+import tokenize
 import contextlib
+import collections
+import collections.abc
+import weakref
+import threading
+import time
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from .pipe_default_conf import PIPE_PORT, PIPE_IP
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-PIPE_PORT = os.getenv('PIPE_PORT', PIPE_PORT)
+from .pipe_default_conf import PIPE_PORT, PIPE_IP
+from .pipe_default_conf import PIPE_KEEP_ALIVE_TIMEOUT, PIPE_POOL_SIZE
+from .pipe_default_conf import PIPE_MULTIPLEX, PIPE_UNIX_SOCKET
+from .pipe_default_conf import PIPE_IO_BUFFER_SIZE, PIPE_SOCKET_BUFFER_SIZE
+from .pipe_default_conf import PIPE_COMPRESSION, PIPE_COMPRESSION_THRESHOLD
+from .pipe_default_conf import PIPE_COMPRESSION_LEVEL
+from .pipe_default_conf import PIPE_TRANSFER_CHUNK_SIZE, PIPE_TRANSFER_RETRIES
+from .pipe_default_conf import PIPE_TRANSFER_STREAMS, PIPE_DEDUP
+from .pipe_default_conf import PIPE_ATTACHMENTS, PIPE_CODEC, PIPE_ORJSON
+from .pipe_default_conf import PIPE_ITER_BATCH_SIZE, PIPE_HANDLE_THRESHOLD
+from .pipe_default_conf import PIPE_PAGE_SIZE, PIPE_PAGE_CACHE
+from .pipe_codec import msgpack_dumps, msgpack_loads
+
+PIPE_PORT = int(os.getenv('PIPE_PORT', PIPE_PORT))
 PIPE_IP = os.getenv('PIPE_IP', PIPE_IP)
+PIPE_KEEP_ALIVE_TIMEOUT = int(os.getenv('PIPE_KEEP_ALIVE_TIMEOUT',
+                                        PIPE_KEEP_ALIVE_TIMEOUT))
+PIPE_POOL_SIZE = int(os.getenv('PIPE_POOL_SIZE', PIPE_POOL_SIZE))
+PIPE_MULTIPLEX = os.getenv('PIPE_MULTIPLEX', str(PIPE_MULTIPLEX)) == 'True'
+PIPE_UNIX_SOCKET = os.getenv('PIPE_UNIX_SOCKET', PIPE_UNIX_SOCKET) or None
+PIPE_IO_BUFFER_SIZE = int(os.getenv('PIPE_IO_BUFFER_SIZE', PIPE_IO_BUFFER_SIZE))
+PIPE_SOCKET_BUFFER_SIZE = int(os.getenv('PIPE_SOCKET_BUFFER_SIZE',
+                                        PIPE_SOCKET_BUFFER_SIZE))
+PIPE_COMPRESSION = os.getenv('PIPE_COMPRESSION',
+                             str(PIPE_COMPRESSION)) == 'True'
+PIPE_COMPRESSION_THRESHOLD = int(os.getenv('PIPE_COMPRESSION_THRESHOLD',
+                                           PIPE_COMPRESSION_THRESHOLD))
+PIPE_COMPRESSION_LEVEL = int(os.getenv('PIPE_COMPRESSION_LEVEL',
+                                       PIPE_COMPRESSION_LEVEL))
+PIPE_TRANSFER_CHUNK_SIZE = int(os.getenv('PIPE_TRANSFER_CHUNK_SIZE',
+                                         PIPE_TRANSFER_CHUNK_SIZE))
+PIPE_TRANSFER_RETRIES = int(os.getenv('PIPE_TRANSFER_RETRIES',
+                                      PIPE_TRANSFER_RETRIES))
+PIPE_TRANSFER_STREAMS = int(os.getenv('PIPE_TRANSFER_STREAMS',
+                                      PIPE_TRANSFER_STREAMS))
+PIPE_DEDUP = os.getenv('PIPE_DEDUP', str(PIPE_DEDUP)) == 'True'
+PIPE_ATTACHMENTS = os.getenv('PIPE_ATTACHMENTS',
+                             str(PIPE_ATTACHMENTS)) == 'True'
+PIPE_CODEC = os.getenv('PIPE_CODEC', PIPE_CODEC)
+PIPE_ORJSON = os.getenv('PIPE_ORJSON', str(PIPE_ORJSON)) == 'True' and \
+    orjson is not None
+PIPE_ITER_BATCH_SIZE = int(os.getenv('PIPE_ITER_BATCH_SIZE',
+                                     PIPE_ITER_BATCH_SIZE))
+PIPE_HANDLE_THRESHOLD = os.getenv('PIPE_HANDLE_THRESHOLD',
+                                  PIPE_HANDLE_THRESHOLD) or None
+if PIPE_HANDLE_THRESHOLD is not None:
+    PIPE_HANDLE_THRESHOLD = int(PIPE_HANDLE_THRESHOLD)
+PIPE_PAGE_SIZE = int(os.getenv('PIPE_PAGE_SIZE', PIPE_PAGE_SIZE))
+PIPE_PAGE_CACHE = int(os.getenv('PIPE_PAGE_CACHE', PIPE_PAGE_CACHE))
+
+# high bit of the frame length, the frame body is zlib compressed
+FRAME_COMPRESSED = 0x80000000
+# the JSON text of the frame body is followed by raw binary segments
+FRAME_ATTACHMENTS = 0x40000000
+FRAME_LENGTH_MASK = 0x3FFFFFFF
+
+# entry types of the stream of a multi-file transfer
+FILE_ENTRY_END = 0
+FILE_ENTRY_FILE = 1
+FILE_ENTRY_DIR = 2
 
 
 class TcpNetIoError(Exception):
     pass
 
 
+def dir_entries(src_dir: str) -> Iterator[Tuple[str, Union[str, None]]]:
+    # (name, filename) of the sub directories and files of src_dir, the names
+    # are relative paths with '/' separators, filename is None for a directory
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        if root != src_dir:
+            yield os.path.relpath(root, src_dir).replace(os.sep, '/'), None
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            if os.path.isfile(filename):
+                yield os.path.relpath(filename, src_dir).replace(
+                    os.sep, '/'), filename
+
+
+def file_sha256(filename: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        while True:
+            chunk = file.read(PIPE_IO_BUFFER_SIZE)
+            if not chunk:
+                return file_hash.hexdigest()
+            file_hash.update(chunk)
+
+
+def file_entry_path(root: str, name: str) -> str:
+    # the entries can not be written outside of the destination directory
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, *name.split('/')))
+    if not path.startswith(root + os.sep):
+        raise TcpNetIoError(
+            "file entry '{}' outside of '{}'".format(name, root))
+    return path
+
+
 class TcpNetIo:
     def __init__(self, sock: socket.socket):
         self.sock = sock
@@ -47,49 +158,204 @@ class TcpNetIo:
     def sendall(self, data: bytes):
         self.sock.sendall(data)
 
-    def recvall(self, data_len: int) -> bytes:
-        data = bytearray()
+    def sendall_buffers(self, *buffers: bytes):
+        # the buffers (e.g. frame header and body) are sent in one syscall
+        # without joining them, sendmsg is not available on Windows
+        if not hasattr(self.sock, 'sendmsg'):
+            self.sock.sendall(b''.join(buffers))
+            return
+
+        views = [memoryview(buffer) for buffer in buffers]
+        while views:
+            sent = self.sock.sendmsg(views)
+            while views and sent >= len(views[0]):
+                sent -= len(views.pop(0))
+            if views:
+                views[0] = views[0][sent:]
+
+    def recvall(self, data_len: int) -> bytearray:
+        # the data is received in place, without intermediate chunks
+        data = bytearray(data_len)
         count = 0
 
-        while count < data_len:
-            recv_bytes = self.sock.recv(min(data_len-count, 4096))
-            if not recv_bytes:
-                raise TcpNetIoError("socket connection broken")
-            data.extend(recv_bytes)
-            count += len(recv_bytes)
+        with memoryview(data) as view:
+            while count < data_len:
+                n_recv = self.sock.recv_into(view[count:], data_len-count)
+                if not n_recv:
+                    raise TcpNetIoError("socket connection broken")
+                count += n_recv
 
         return data
 
     def recvall_to_file(self, data_len, filename) -> int:
+        buffer = bytearray(PIPE_IO_BUFFER_SIZE)
         count = 0
 
-        with open(filename, 'wb') as file:
+        with open(filename, 'wb') as file, memoryview(buffer) as view:
             while count < data_len:
-                recv_bytes = self.sock.recv(min(data_len - count, 4096))
-                if not recv_bytes:
+                n_recv = self.sock.recv_into(
+                    view, min(data_len-count, len(buffer)))
+                if not n_recv:
                     raise TcpNetIoError("socket connection broken")
-                file.write(recv_bytes)
-                count += len(recv_bytes)
+                file.write(view[:n_recv])
+                count += n_recv
 
         return count
 
     def sendall_from_file(self, filename):
+        with open(filename, 'rb') as file:
+            self._sendall_from_file_obj(file, os.fstat(file.fileno()).st_size)
+
+    def _sendall_from_file_obj(self, file, data_len: int):
+        if hasattr(os, 'sendfile'):
+            # kernel zero-copy, the file is never read in user space
+            self.sock.sendfile(file, file.tell(), data_len)
+            return
+
+        buffer = bytearray(PIPE_IO_BUFFER_SIZE)
+        count = 0
+
+        with memoryview(buffer) as view:
+            while count < data_len:
+                n_read = file.readinto(view[:min(data_len-count, len(buffer))])
+                if not n_read:
+                    break  # file truncated while sent
+                self.sock.sendall(view[:n_read])
+                count += n_read
+
+    def sendall_files(self, entries: Iterator[Tuple[str, Union[str, None]]]
+                      ) -> int:
+        # tar-like stream, each entry is its type, its name and for a file its
+        # size and bytes, a small file is sent with its header in one syscall
+        count = 0
+
+        for name, filename in entries:
+            name_b = name.encode('utf-8')
+            if filename is None:
+                self.sendall_buffers(
+                    struct.pack('!BI', FILE_ENTRY_DIR, len(name_b)), name_b)
+                continue
+            with open(filename, 'rb') as file:
+                data_len = os.fstat(file.fileno()).st_size
+                header = (struct.pack('!BI', FILE_ENTRY_FILE, len(name_b)),
+                          name_b, struct.pack('!Q', data_len))
+                if data_len < PIPE_IO_BUFFER_SIZE:
+                    data = file.read(data_len)
+                    if len(data) != data_len:
+                        raise TcpNetIoError('file truncated while sent')
+                    self.sendall_buffers(*header, data)
+                else:
+                    self.sendall_buffers(*header)
+                    self._sendall_from_file_obj(file, data_len)
+            count += data_len
+
+        self.sendall(struct.pack('!BI', FILE_ENTRY_END, 0))
+        return count
+
+    def recv_files(self, dst_dir: str) -> int:
+        # each file is written as soon as it is received
+        count = 0
+
+        while True:
+            entry_type, name_len = struct.unpack('!BI', self.recvall(5))
+            if entry_type == FILE_ENTRY_END:
+                return count
+            path = file_entry_path(
+                dst_dir, self.recvall(name_len).decode('utf-8'))
+            if entry_type == FILE_ENTRY_DIR:
+                os.makedirs(path, exist_ok=True)
+                continue
+            data_len = struct.unpack('!Q', self.recvall(8))[0]
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            count += self.recvall_to_file(data_len, path)
+
+    def sendall_compressed(self, chunks: Iterator[bytes],
+                           level=PIPE_COMPRESSION_LEVEL):
+        # zlib stream sent as length prefixed chunks, ended by an empty chunk
+        compressor = zlib.compressobj(level)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                self.sendall_buffers(struct.pack('!I', len(data)), data)
+        data = compressor.flush()
+        if data:
+            self.sendall_buffers(struct.pack('!I', len(data)), data)
+        self.sendall(struct.pack('!I', 0))
+
+    def recv_compressed(self) -> Iterator[bytes]:
+        decompressor = zlib.decompressobj()
+        while True:
+            chunk_len = struct.unpack('!I', self.recvall(4))[0]
+            if not chunk_len:
+                return
+            data = decompressor.decompress(self.recvall(chunk_len))
+            if data:
+                yield data
+
+    def recv_compressed_to_file(self, filename) -> int:
+        count = 0
+
+        with open(filename, 'wb') as file:
+            for data in self.recv_compressed():
+                file.write(data)
+                count += len(data)
+
+        return count
+
+    def recv_checked_chunks(self, data_len: int,
+                            chunk_size: int) -> Iterator[bytearray]:
+        # each chunk is followed by its CRC32, a chunk is only yielded once
+        # verified
+        count = 0
+        while count < data_len:
+            chunk = self.recvall(min(chunk_size, data_len - count))
+            chunk_crc = struct.unpack('!I', self.recvall(4))[0]
+            if zlib.crc32(chunk) != chunk_crc:
+                raise TcpNetIoError('chunk checksum mismatch')
+            yield chunk
+            count += len(chunk)
+
+    def sendall_checked_chunks(self, filename: str, offset: int, data_len: int,
+                               chunk_size: int) -> int:
         count = 0
-        data_len = os.path.getsize(filename)
 
         with open(filename, 'rb') as file:
+            file.seek(offset)
             while count < data_len:
-                read_bytes = file.read(min(data_len-count, 4096))
-                self.sock.sendall(read_bytes)
-                count += len(read_bytes)
+                chunk = file.read(min(chunk_size, data_len - count))
+                if not chunk:
+                    raise TcpNetIoError('file truncated while sent')
+                self.sendall_buffers(
+                    chunk, struct.pack('!I', zlib.crc32(chunk)))
+                count += len(chunk)
+
+        return count
+
+    @staticmethod
+    def file_chunks(filename: str) -> Iterator[bytes]:
+        with open(filename, 'rb') as file:
+            while True:
+                chunk = file.read(PIPE_IO_BUFFER_SIZE)
+                if not chunk:
+                    return
+                yield chunk
 
 
 class TcpClient:
-    def __init__(self, ip_address: str, port: int):
+    def __init__(self, ip_address: str, port: int, unix_socket: str = None):
         self.ip_address = ip_address
         self.port = port
+        # a same host server is reached through its Unix domain socket path
+        self.unix_socket = unix_socket
         self.sock = None
         self.io = None
+        # frame size above which the frames are compressed, None if the
+        # compression has not been negotiated on the connection
+        self.compress_threshold = None
+        # the bytearrays are sent as attachments once the server accepted them
+        self.attachments = False
+        # frame codec accepted by the server on the connection
+        self.codec = 'json'
 
     def __enter__(self):
         self.create_connection()
@@ -99,46 +365,298 @@ class TcpClient:
         self.close_connection()
 
     def create_connection(self):
+        if self.unix_socket:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._set_buffer_size()
+            self.io = TcpNetIo(self.sock)
+            self.sock.connect(self.unix_socket)
+            return
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._set_buffer_size()
         self.io = TcpNetIo(self.sock)
         self.sock.connect((self.ip_address, self.port))
 
+    def negotiate_compression(self, threshold=PIPE_COMPRESSION_THRESHOLD,
+                              level=PIPE_COMPRESSION_LEVEL):
+        # the server compresses its frames on this connection once accepted
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.set_socket(self.sock)
+        tcp_json_com.send({'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                           'method': 'set_compression',
+                           'params': {'algorithm': 'zlib',
+                                      'threshold': threshold,
+                                      'level': level}})
+        response = tcp_json_com.recv()
+        # an error response, the method is unknown to an older server, leaves
+        # the compression disabled
+        if response.get('result', {}).get('algorithm') == 'zlib':
+            self.compress_threshold = threshold
+
+    def negotiate_attachments(self):
+        # the server sends its bytearrays as attachments on this connection
+        # once accepted
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.set_socket(self.sock)
+        tcp_json_com.send({'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                           'method': 'set_attachments', 'params': {}})
+        response = tcp_json_com.recv()
+        # an error response leaves the attachments disabled
+        self.attachments = bool(
+            response.get('result', {}).get('attachments'))
+
+    def negotiate_codec(self, codec=PIPE_CODEC):
+        # the frames following the response use the codec chosen by the
+        # server, JSON if it does not know the requested one
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.set_tcp_client(self)
+        tcp_json_com.send({'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                           'method': 'set_codec',
+                           'params': {'codecs': [codec]}})
+        response = tcp_json_com.recv()
+        # an error response keeps the JSON codec
+        self.codec = response.get('result', {}).get('codec', 'json')
+
+    def _set_buffer_size(self):
+        # set before connect, the TCP window scaling is negotiated on connect
+        if PIPE_SOCKET_BUFFER_SIZE > 0:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF,
+                                 PIPE_SOCKET_BUFFER_SIZE)
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                 PIPE_SOCKET_BUFFER_SIZE)
+
     def close_connection(self):
         self.sock.close()
         self.sock = None
         self.io = None
 
+    def is_connection_dropped(self) -> bool:
+        # an idle connection must have nothing to read, a readable socket
+        # means the server closed it (e.g. keep-alive timeout)
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+
+# thread safe pool of keep-alive connections to one pipe server, an idle
+# connection is dropped well before the keep-alive timeout of the server, it
+# is never closed by the server while a request is sent on it
+class TcpClientPool:
+    _shared_pools = {}
+    _shared_pools_lock = threading.Lock()
+
+    def __init__(self, ip_address: str, port: int, max_idle=PIPE_POOL_SIZE,
+                 idle_timeout=PIPE_KEEP_ALIVE_TIMEOUT / 2,
+                 unix_socket: str = None, compression=False, codec='json'):
+        self.ip_address = ip_address
+        self.port = port
+        self.unix_socket = unix_socket
+        self.compression = compression
+        self.codec = codec
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, ip_address: str, port: int, unix_socket: str = None,
+               compression=False, codec='json') -> 'TcpClientPool':
+        key = (ip_address, port, unix_socket, compression, codec)
+        with cls._shared_pools_lock:
+            if key not in cls._shared_pools:
+                cls._shared_pools[key] = cls(
+                    ip_address, port, unix_socket=unix_socket,
+                    compression=compression, codec=codec)
+            return cls._shared_pools[key]
+
+    def _acquire(self) -> TcpClient:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                tcp_client, last_used = self._idle.pop()
+            if (time.monotonic() - last_used < self.idle_timeout
+                    and not tcp_client.is_connection_dropped()):
+                return tcp_client
+            tcp_client.close_connection()
+
+        tcp_client = TcpClient(self.ip_address, self.port, self.unix_socket)
+        tcp_client.create_connection()
+        if self.compression or PIPE_ATTACHMENTS or self.codec != 'json':
+            try:
+                if self.compression:
+                    tcp_client.negotiate_compression()
+                if PIPE_ATTACHMENTS:
+                    tcp_client.negotiate_attachments()
+                if self.codec != 'json':
+                    tcp_client.negotiate_codec(self.codec)
+            except BaseException:
+                tcp_client.close_connection()
+                raise
+        return tcp_client
+
+    def _release(self, tcp_client: TcpClient):
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append((tcp_client, time.monotonic()))
+                return
+        tcp_client.close_connection()
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[TcpClient]:
+        tcp_client = self._acquire()
+        try:
+            yield tcp_client
+        except BaseException:
+            # the connection state is unknown, never give it back to the pool
+            tcp_client.close_connection()
+            raise
+        self._release(tcp_client)
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for tcp_client, _ in idle:
+            tcp_client.close_connection()
+
 
 class JsonComEncoder(json.JSONEncoder):
+    # with an attachments list, the bytearrays are referenced by their offset
+    # and length in the raw segments following the JSON text, else they are
+    # base64 encoded
+    def __init__(self, *args, attachments: list = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.attachments = attachments
+        self.attachments_len = 0
+
     def default(self, obj: Any):
         if isinstance(obj, bytearray):
+            if self.attachments is not None:
+                ref = {'__bytearray__': True, 'offset': self.attachments_len,
+                       'length': len(obj)}
+                self.attachments.append(obj)
+                self.attachments_len += len(obj)
+                return ref
             return {'__bytearray__': True,
                     'data': base64.b64encode(obj).decode('utf-8')}
         return json.JSONEncoder.default(self, obj)
 
 
-def json_com_decoder(obj: Any):
+def json_com_decoder(obj: Any, attachments: memoryview = None):
     if type(obj) == dict and '__bytearray__' in obj:
-        return bytearray(base64.b64decode(obj['data']))
+        if 'data' in obj:
+            return bytearray(base64.b64decode(obj['data']))
+        offset = obj['offset']
+        return bytearray(attachments[offset:offset + obj['length']])
     return obj
 
 
+# tag of the bytearrays encoded in the JSON text
+BYTEARRAY_TAG = b'"__bytearray__"'
+# orjson decodes the integers beyond 64 bits as float, the texts holding 19
+# digits in a row are decoded by the json module, the frame body is searched
+# in place without copy
+LONG_NUMBER = re.compile(rb'\d{19}')
+
+
+def json_com_resolve(obj: Any, attachments: memoryview = None) -> Any:
+    # replaces the bytearray tags in place, a faster post-pass than an
+    # object_hook called for every dict of the frames
+    if type(obj) is dict:
+        if '__bytearray__' in obj:
+            return json_com_decoder(obj, attachments)
+        for key, value in obj.items():
+            if type(value) in (dict, list):
+                obj[key] = json_com_resolve(value, attachments)
+    elif type(obj) is list:
+        for i, value in enumerate(obj):
+            if type(value) in (dict, list):
+                obj[i] = json_com_resolve(value, attachments)
+    return obj
+
+
+def json_loads(body: bytearray, start: int, end: int,
+               attachments: memoryview = None) -> Any:
+    # the frames without bytearray tag are never walked
+    text = memoryview(body)[start:end]
+    if PIPE_ORJSON and not LONG_NUMBER.search(body, start, end):
+        try:
+            obj = orjson.loads(text)
+        except orjson.JSONDecodeError:  # NaN, Infinity
+            obj = json.loads(str(text, 'utf-8'))
+    else:
+        obj = json.loads(str(text, 'utf-8'))
+    if body.find(BYTEARRAY_TAG, start, end) != -1:
+        obj = json_com_resolve(obj, attachments)
+    return obj
+
+
+def frame_encode(data: Any, attachments=False,
+                 codec='json') -> Tuple[int, List[bytes]]:
+    # flags and buffers of a frame body, the attachments are sent without
+    # copy with the JSON text, the MessagePack bin values replace them
+    if codec == 'msgpack':
+        return 0, [msgpack_dumps(data)]
+    if not attachments:
+        return 0, [bytes(json.dumps(data, cls=JsonComEncoder), 'utf-8')]
+    segments = []
+    json_bytes = bytes(json.dumps(
+        data, cls=JsonComEncoder, attachments=segments), 'utf-8')
+    # the flag is only set on the frames holding bytearrays
+    if not segments:
+        return 0, [json_bytes]
+    return FRAME_ATTACHMENTS, \
+        [struct.pack('!I', len(json_bytes)), json_bytes] + segments
+
+
+def frame_decode(body: bytes, flags: int, codec='json') -> Any:
+    if flags & FRAME_COMPRESSED:
+        body = zlib.decompress(body)
+    if codec == 'msgpack':
+        return msgpack_loads(body)
+    if not flags & FRAME_ATTACHMENTS:
+        return json_loads(body, 0, len(body))
+    json_len = struct.unpack_from('!I', body)[0]
+    return json_loads(body, 4, 4 + json_len,
+                      memoryview(body)[4 + json_len:])
+
+
 class TcpJsonCom:
     def __init__(self):
         self.io = None
-        self.json_bytes = None
         self.json = None
+        self.flags = 0
+        self.buffers = None
+        self.compress_threshold = None
+        # attachments negotiated on the connection, see set_tcp_client
+        self.attachments = False
+        self.codec = 'json'
 
     def set_socket(self, sock: socket.socket):
         self.io = TcpNetIo(sock)
 
+    def set_tcp_client(self, tcp_client: TcpClient):
+        self.set_socket(tcp_client.sock)
+        self.compress_threshold = tcp_client.compress_threshold
+        self.attachments = tcp_client.attachments
+        self.codec = tcp_client.codec
+
     def prepare_json(self, data: dict):
         self.json = data
-        self.json_bytes = bytes(json.dumps(data, cls=JsonComEncoder), 'utf-8')
+        self.flags, self.buffers = frame_encode(data, self.attachments,
+                                                self.codec)
 
     def send_prepare(self):
-        json_len = struct.pack('!I', len(self.json_bytes))
-        self.io.sendall(json_len + self.json_bytes)
+        buffers, flags = self.buffers, self.flags
+        body_len = sum(len(buffer) for buffer in buffers)
+        if self.compress_threshold is not None and \
+                body_len >= self.compress_threshold:
+            buffers = [zlib.compress(b''.join(buffers),
+                                     PIPE_COMPRESSION_LEVEL)]
+            body_len = len(buffers[0])
+            flags |= FRAME_COMPRESSED
+        if body_len > FRAME_LENGTH_MASK:
+            raise TcpNetIoError('frame too large')
+        self.io.sendall_buffers(struct.pack('!I', body_len | flags), *buffers)
 
     def send(self, data: dict):
         self.prepare_json(data)
@@ -147,14 +665,120 @@ class TcpJsonCom:
     def recv(self) -> dict:
         json_len = self.io.recvall(4)
         json_len = struct.unpack('!I', json_len)[0]
-        json_bytes = self.io.recvall(json_len).decode('utf-8')
-        return json.loads(json_bytes, object_hook=json_com_decoder)
+        body = self.io.recvall(json_len & FRAME_LENGTH_MASK)
+        return frame_decode(body, json_len & ~FRAME_LENGTH_MASK, self.codec)
+
+
+# one connection shared by many callers, the requests are written back to
+# back and a reader thread routes the responses and live frames by id
+class MultiplexConnection:
+    def __init__(self, ip_address: str, port: int, unix_socket: str = None,
+                 compression=False, codec='json'):
+        self.tcp_client = TcpClient(ip_address, port, unix_socket)
+        self.tcp_client.create_connection()
+        if compression:
+            self.tcp_client.negotiate_compression()
+        if PIPE_ATTACHMENTS:
+            self.tcp_client.negotiate_attachments()
+        if codec != 'json':
+            self.tcp_client.negotiate_codec(codec)
+        self.tcp_json_com = TcpJsonCom()
+        self.tcp_json_com.set_tcp_client(self.tcp_client)
+        self.is_closed = False
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_responses)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def request(self, request: dict) -> Future:
+        future = Future()
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.io = self.tcp_json_com.io
+        tcp_json_com.compress_threshold = self.tcp_client.compress_threshold
+        tcp_json_com.attachments = self.tcp_client.attachments
+        tcp_json_com.codec = self.tcp_client.codec
+        tcp_json_com.prepare_json(request)
+
+        with self._lock:
+            if self.is_closed:
+                raise TcpNetIoError("socket connection broken")
+            self._pending[request['id']] = future
+
+        try:
+            with self._send_lock:
+                tcp_json_com.send_prepare()
+        except OSError:
+            self.close()
+            raise TcpNetIoError("socket connection broken")
+        return future
+
+    def _read_responses(self):
+        try:
+            while True:
+                response = self.tcp_json_com.recv()
+                if 'id' in response:
+                    with self._lock:
+                        future = self._pending.pop(response['id'], None)
+                    if future:
+                        future.set_result(response)
+                elif response.get('request_id') in self._pending:
+                    if 'live_stdout' in response:
+                        sys.stdout.write(response['live_stdout'])
+                    elif 'live_stderr' in response:
+                        sys.stderr.write(response['live_stderr'])
+        except (TcpNetIoError, OSError):
+            self.close()
+        except BaseException as ex:
+            # an undecodable frame fails the pending requests, they would
+            # wait forever on a connection without reader
+            self.close(ex)
+            if not isinstance(ex, Exception):
+                raise
+
+    def close(self, error: BaseException = None):
+        with self._lock:
+            if self.is_closed:
+                return
+            self.is_closed = True
+            pending, self._pending = self._pending, {}
+        try:
+            self.tcp_client.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.tcp_client.sock.close()
+        for future in pending.values():
+            future.set_exception(
+                error or TcpNetIoError("socket connection broken"))
 
 
 class PipeFileTransferErr(Exception):
     pass
 
 
+# number of bytes of a file transfer, with its duration in seconds,
+# deduplicated if the upload was skipped, the server had the content
+class FileTransferStats(int):
+    def __new__(cls, size: int, duration: float, deduplicated=False):
+        stats = super().__new__(cls, size)
+        stats.duration = duration
+        stats.deduplicated = deduplicated
+        return stats
+
+    @property
+    def throughput(self) -> float:
+        # bytes per second
+        return self / self.duration if self.duration else float('inf')
+
+    def __repr__(self):
+        return 'FileTransferStats(size={}, duration={:.3f}, ' \
+               'throughput={:.0f})'.format(int(self), self.duration,
+                                          self.throughput)
+
+    __str__ = int.__repr__
+
+
 class PipeCustomComNotFound(Exception):
     pass
 
@@ -163,6 +787,11 @@ class PipeServerInternalErr(Exception):
     pass
 
 
+# the RPC method is unknown to the server, e.g. an older pipe server
+class PipeServerMethodNotFound(Exception):
+    pass
+
+
 class PipeServerRemoteCodeExecErr(Exception):
     def __init__(self, stacktrace, code, ip, port):
         super().__init__(stacktrace)
@@ -173,21 +802,325 @@ class PipeServerRemoteCodeExecErr(Exception):
         super().__init__(stacktrace)
 
 
+# lazy iterator over the items of a remote generator or java Iterator, the
+# next batch is requested while the current one is consumed, the server never
+# runs more than one batch ahead of the client
+class RemoteIterator:
+    def __init__(self, pipe_client_rpc: 'PipeClientJsonRpc', iterator: dict,
+                 batch_size=PIPE_ITER_BATCH_SIZE, std_forward=True):
+        self.pipe_client_rpc = pipe_client_rpc
+        self.iterator_id = iterator['id']
+        self.batch_size = batch_size
+        self.std_forward = std_forward
+        self._items = collections.deque(iterator['items'])
+        self._done = iterator['done']
+        self._next_batch = None
+        self._prefetch()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_trace):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> Any:
+        while not self._items:
+            if self._next_batch is None:
+                raise StopIteration
+            next_batch, self._next_batch = self._next_batch, None
+            try:
+                batch = next_batch.result()
+            except BaseException:
+                # the server dropped the iterator
+                self._done = True
+                raise
+            self._items.extend(batch['items'])
+            self._done = batch['done']
+            self._prefetch()
+        return self._items.popleft()
+
+    def _prefetch(self):
+        if not self._done:
+            self._next_batch = self.pipe_client_rpc._rpc_request_background(
+                'iter_next', {'iterator': self.iterator_id,
+                              'count': self.batch_size,
+                              'std_forward': self.std_forward})
+
+    def close(self):
+        # the remaining items of the remote iterator are discarded
+        self._items.clear()
+        if self._done:
+            return
+        self._done = True
+        if self._next_batch is not None:
+            next_batch, self._next_batch = self._next_batch, None
+            try:
+                if next_batch.result()['done']:
+                    return
+            except Exception:
+                return
+        self.pipe_client_rpc._rpc_request(
+            'iter_close', {'iterator': self.iterator_id})
+
+
+# large remote sequence or mapping read by pages, the last pages read are kept
+# in a LRU cache and the next page is fetched in the background when the pages
+# are read in order, the remote value is released once the proxy is collected
+class _RemotePagedProxy:
+    def __init__(self, pipe_client_rpc: 'PipeClientJsonRpc', handle: dict,
+                 page_size=PIPE_PAGE_SIZE, cache_pages=PIPE_PAGE_CACHE):
+        self.pipe_client_rpc = pipe_client_rpc
+        self.handle_id = handle['id']
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self._length = handle['length']
+        self._pages = collections.OrderedDict()
+        self._last_page = -1
+        self._lock = threading.Lock()
+        self._release = weakref.finalize(
+            self, pipe_client_rpc._released_handles.append, self.handle_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_trace):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __repr__(self) -> str:
+        return '<{} {} of {} items>'.format(
+            type(self).__name__, self.handle_id, self._length)
+
+    def _page_future(self, page: int) -> Future:
+        # the lock is held
+        future = self._pages.get(page)
+        if future is not None:
+            self._pages.move_to_end(page)
+            return future
+
+        start = page * self.page_size
+        future = self.pipe_client_rpc._rpc_request_background(
+            'handle_page', {'handle': self.handle_id, 'start': start,
+                            'stop': start + self.page_size})
+        self._pages[page] = future
+        if len(self._pages) > self.cache_pages:
+            self._pages.popitem(last=False)
+        return future
+
+    def _page(self, page: int) -> list:
+        with self._lock:
+            future = self._page_future(page)
+            if page == self._last_page + 1 and \
+                    (page + 1) * self.page_size < self._length:
+                self._page_future(page + 1)
+            self._last_page = page
+        try:
+            return future.result()['items']
+        except BaseException:
+            with self._lock:
+                if self._pages.get(page) is future:
+                    del self._pages[page]
+            raise
+
+    def _pages_items(self) -> Iterator[Any]:
+        for page in range(0, -(-self._length // self.page_size)):
+            yield from self._page(page)
+
+    def close(self):
+        if self._release.detach() is not None:
+            self.pipe_client_rpc._rpc_request(
+                'handle_release', {'handles': [self.handle_id]})
+
+
+class RemoteSequenceProxy(_RemotePagedProxy, collections.abc.Sequence):
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            indexes = range(*index.indices(self._length))
+            if not indexes:
+                return []
+            first = min(indexes) // self.page_size
+            items = []
+            for page in range(first, max(indexes) // self.page_size + 1):
+                items.extend(self._page(page))
+            offset = first * self.page_size
+            return [items[i - offset] for i in indexes]
+
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError('remote sequence index out of range')
+        return self._page(index // self.page_size)[index % self.page_size]
+
+    def __iter__(self) -> Iterator[Any]:
+        return self._pages_items()
+
+
+# the items are read by pages of [key, value] pairs, a key lookup is a request
+class RemoteMappingProxy(_RemotePagedProxy, collections.abc.Mapping):
+    def __getitem__(self, key: Any) -> Any:
+        res = self.pipe_client_rpc._rpc_request(
+            'handle_getitem', {'handle': self.handle_id, 'key': key})
+        if not res['found']:
+            raise KeyError(key)
+        return res['value']
+
+    def __iter__(self) -> Iterator[Any]:
+        return (key for key, _ in self._pages_items())
+
+    def items(self) -> Iterator[Tuple[Any, Any]]:
+        return (tuple(item) for item in self._pages_items())
+
+    def values(self) -> Iterator[Any]:
+        return (value for _, value in self._pages_items())
+
+
+# RPC requests collected by PipeClientJsonRpc.batch(), each call returns a
+# future resolved when the batch response is received
+class PipeRpcBatch:
+    def __init__(self, pipe_client_rpc: 'PipeClientJsonRpc'):
+        self.pipe_client_rpc = pipe_client_rpc
+        self.requests = []
+        self._futures = {}
+
+    def _add(self, method: str, args: {}, result_handler: callable) -> Future:
+        params = dict(args)
+
+        if 'self' in params:
+            params.pop('self')
+
+        request = {'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                   'method': method, 'params': params}
+        future = Future()
+        self.requests.append(request)
+        self._futures[request['id']] = (future, result_handler)
+        return future
+
+    def set_response(self, response: dict):
+        if response.get('id') not in self._futures:
+            self.pipe_client_rpc._check_response(response)
+            return
+        future, result_handler = self._futures.pop(response['id'])
+        try:
+            future.set_result(result_handler(
+                self.pipe_client_rpc._check_response(response)))
+        except Exception as ex:
+            future.set_exception(ex)
+
+    def set_missing_responses(self):
+        for future, _ in self._futures.values():
+            future.set_exception(PipeServerInternalErr(
+                'No response to the batch request.'))
+        self._futures = {}
+
+    def get_server_banner(self) -> Future:
+        return self._add('get_server_banner', {}, lambda res: res['banner'])
+
+    def get_file_size(self, file: str) -> Future:
+        return self._add('get_file_size', locals(), lambda res: res['size'])
+
+    def get_file_hash(self, file: str, algorithm='sha256') -> Future:
+        return self._add('get_file_hash', locals(), lambda res: res['hash'])
+
+    def exec(self, code: str, std_cap=False, std_forward=True) -> Future:
+        return self._add('code_exec', locals(), lambda res: res['output'])
+
+    def func_exec(self, name: str, args: Tuple, kwargs: dict,
+                  std_forward=True) -> Future:
+        return self._add('func_exec', locals(), lambda res: res['return'])
+
+    def object_proxy_new(self, class_name: str, args: Tuple, kwargs: dict,
+                         std_forward=True) -> Future:
+        return self._add('object_proxy_new', locals(),
+                         lambda res: res['object_name'])
+
+    def object_proxy_getattr(self, object_name: str, name: str) -> Future:
+        return self._add('object_proxy_getattr', locals(),
+                         lambda res: (res['value'], res['type']))
+
+    def object_proxy_setattr(self, object_name: str, name: str,
+                             value: Any) -> Future:
+        return self._add('object_proxy_setattr', locals(), lambda res: None)
+
+
 class PipeClientJsonRpc:
-    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT):
+    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT,
+                 pool: TcpClientPool = None, multiplex=PIPE_MULTIPLEX,
+                 unix_socket=PIPE_UNIX_SOCKET, compression=PIPE_COMPRESSION,
+                 codec=PIPE_CODEC):
         self.ip_address = ip_address
         self.port = port
+        self.unix_socket = unix_socket
+        # the frames and the files above PIPE_COMPRESSION_THRESHOLD bytes are
+        # zlib compressed, the frame compression is negotiated per connection
+        self.compression = compression
+        # 'json' or 'msgpack', the frame codec is negotiated per connection
+        self.codec = codec
+        self.pool = pool or TcpClientPool.shared(ip_address, port, unix_socket,
+                                                 compression, codec)
+        self.multiplex = multiplex
+        self._multiplex_connection = None
+        self._multiplex_lock = threading.Lock()
+        # requests sent in the background (e.g. the batches prefetched by the
+        # remote iterators) without multiplexed connection
+        self._background = None
+        self._background_lock = threading.Lock()
+        # the handles of the paged proxies collected, released before the
+        # next request
+        self._released_handles = []
+        # the sources registered before the next request, see defer_codes
+        self._deferred_codes = []
+        self._deferred_lock = threading.Lock()
+        self._deferred_owner = None
 
     @staticmethod
     def _check_response_error(json_err: dict):
         if json_err['code'] == -32603:
             raise PipeServerInternalErr(json_err['data']['stacktrace'])
+        elif json_err['code'] == -32601:
+            raise PipeServerMethodNotFound(json_err['message'])
         elif json_err['code'] == -32000:
             raise PipeServerRemoteCodeExecErr(
                 json_err['data']['stacktrace'], json_err['data']['code'],
                 json_err['data']['ip'], json_err['data']['port'])
 
+    def _check_response(self, response: dict) -> Union[dict, None]:
+        if 'result' in response:
+            return response['result']
+        elif 'error' in response:
+            self._check_response_error(response['error'])
+
+    def _get_multiplex_connection(self) -> MultiplexConnection:
+        with self._multiplex_lock:
+            if self._multiplex_connection is None or \
+                    self._multiplex_connection.is_closed:
+                self._multiplex_connection = MultiplexConnection(
+                    self.ip_address, self.port, self.unix_socket,
+                    self.compression, self.codec)
+            return self._multiplex_connection
+
+    def _rpc_request_future(self, method: str, args: {}) -> Future:
+        # the future result is the raw response, see _check_response
+        params = dict(args)
+
+        if 'self' in params:
+            params.pop('self')
+
+        request = {'jsonrpc': '2.0', 'id': str(uuid.uuid4()),
+                   'method': method, 'params': params}
+        return self._get_multiplex_connection().request(request)
+
     def _rpc_request(self, method: str, args: {}) -> Union[dict, None]:
+        self._release_handles()
+        self._register_deferred()
+        if self.multiplex and method != 'remote_shutdown':
+            response = self._rpc_request_future(method, args).result()
+            return self._check_response(response)
+
         params = dict(args)
 
         if 'self' in params:
@@ -199,24 +1132,74 @@ class PipeClientJsonRpc:
         tcp_json_com = TcpJsonCom()
         tcp_json_com.prepare_json(request)
 
-        with TcpClient(self.ip_address, self.port) as tcp_client:
-            tcp_json_com.set_socket(tcp_client.sock)
+        with self.pool.connection() as tcp_client:
+            tcp_json_com.set_tcp_client(tcp_client)
             tcp_json_com.send_prepare()
 
             while True:
                 response = tcp_json_com.recv()
                 if 'id' in response and response['id'] == request['id']:
-                    if 'result' in response:
-                        return response['result']
-                    elif 'error' in response:
-                        self._check_response_error(response['error'])
-                    else:
-                        return
+                    return self._check_response(response)
                 elif 'live_stdout' in response:
                     sys.stdout.write(response['live_stdout'])
                 elif 'live_stderr' in response:
                     sys.stderr.write(response['live_stderr'])
 
+    def _rpc_request_background(self, method: str, args: {}) -> Future:
+        # the future result is the checked result, see _check_response
+        if not self.multiplex:
+            with self._background_lock:
+                if self._background is None:
+                    self._background = ThreadPoolExecutor(PIPE_POOL_SIZE)
+            return self._background.submit(self._rpc_request, method, args)
+
+        future = Future()
+
+        def set_result(response: Future):
+            try:
+                future.set_result(self._check_response(response.result()))
+            except BaseException as ex:
+                future.set_exception(ex)
+
+        self._rpc_request_future(method, args).add_done_callback(set_result)
+        return future
+
+    @contextlib.contextmanager
+    def batch(self) -> Iterator[PipeRpcBatch]:
+        # the requests collected in the block are sent in one round trip
+        # when it exits
+        rpc_batch = PipeRpcBatch(self)
+        yield rpc_batch
+        if rpc_batch.requests:
+            self._rpc_batch_request(rpc_batch)
+
+    def _rpc_batch_request(self, rpc_batch: PipeRpcBatch):
+        self._release_handles()
+        self._register_deferred()
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.prepare_json(rpc_batch.requests)
+
+        try:
+            with self.pool.connection() as tcp_client:
+                tcp_json_com.set_tcp_client(tcp_client)
+                tcp_json_com.send_prepare()
+
+                while True:
+                    response = tcp_json_com.recv()
+                    if type(response) == list:
+                        for res in response:
+                            rpc_batch.set_response(res)
+                        return
+                    elif 'id' in response:
+                        rpc_batch.set_response(response)
+                        return
+                    elif 'live_stdout' in response:
+                        sys.stdout.write(response['live_stdout'])
+                    elif 'live_stderr' in response:
+                        sys.stderr.write(response['live_stderr'])
+        finally:
+            rpc_batch.set_missing_responses()
+
     @staticmethod
     def _format_rpc_notification(method_name: str, params: dict):
         return {'jsonrpc': '2.0', 'method': method_name, 'params': params}
@@ -231,11 +1214,20 @@ class PipeClientJsonRpc:
         tcp_json_com = TcpJsonCom()
         tcp_json_com.prepare_json(self._format_rpc_notification(method, params))
 
-        with TcpClient(self.ip_address, self.port) as tcp_client:
-            tcp_json_com.set_socket(tcp_client.sock)
+        with self.pool.connection() as tcp_client:
+            tcp_json_com.set_tcp_client(tcp_client)
             tcp_json_com.send_prepare()
             yield tcp_json_com
 
+    def close_multiplex_connection(self):
+        if self._multiplex_connection is not None and \
+                not self._multiplex_connection.is_closed:
+            self._release_handles()
+        with self._multiplex_lock:
+            if self._multiplex_connection is not None:
+                self._multiplex_connection.close()
+                self._multiplex_connection = None
+
     def server_remote_shutdown(self):
         self._rpc_request('remote_shutdown', {})
 
@@ -246,17 +1238,50 @@ class PipeClientJsonRpc:
              ) -> Union[None, str]:
         return self._rpc_request('code_exec', locals())['output']
 
-    def func_exec(self, name: str, args: Tuple, kwargs: dict, std_forward=True
-                  ) -> Any:
-        return self._rpc_request('func_exec', locals())['return']
+    def _release_handles(self):
+        released = []
+        while self._released_handles:
+            released.append(self._released_handles.pop())
+        if released:
+            self._rpc_request('handle_release', {'handles': released})
+
+    def _handle_proxy(self, handle: dict
+                      ) -> Union[RemoteSequenceProxy, RemoteMappingProxy]:
+        if handle['type'] == 'mapping':
+            return RemoteMappingProxy(self, handle)
+        return RemoteSequenceProxy(self, handle)
+
+    def func_exec(self, name: str, args: Tuple, kwargs: dict, std_forward=True,
+                  handle=PIPE_HANDLE_THRESHOLD) -> Any:
+        # a remote generator or java Iterator is streamed by batches, a list
+        # or dict of at least handle items is paged
+        res = self._rpc_request('func_exec', {
+            'name': name, 'args': args, 'kwargs': kwargs,
+            'std_forward': std_forward, 'handle': handle,
+            'stream': PIPE_ITER_BATCH_SIZE})
+        if 'iterator' in res:
+            return RemoteIterator(self, res['iterator'], PIPE_ITER_BATCH_SIZE,
+                                  std_forward)
+        elif 'handle' in res:
+            return self._handle_proxy(res['handle'])
+        return res['return']
+
+    def iter_exec(self, name: str, args: Tuple, kwargs: dict, std_forward=True,
+                  batch_size=PIPE_ITER_BATCH_SIZE) -> RemoteIterator:
+        # the items of any remote iterable are streamed by batches
+        res = self._rpc_request('iter_exec', locals())
+        return RemoteIterator(self, res['iterator'], batch_size, std_forward)
 
     def object_proxy_new(self, class_name: str, args: Tuple, kwargs: dict,
                          std_forward=True) -> str:
         res = self._rpc_request('object_proxy_new', locals())
         return res['object_name']
 
-    def object_proxy_getattr(self, object_name: str, name: str) -> Any:
+    def object_proxy_getattr(self, object_name: str, name: str,
+                             handle=PIPE_HANDLE_THRESHOLD) -> Any:
         res = self._rpc_request('object_proxy_getattr', locals())
+        if 'handle' in res:
+            return self._handle_proxy(res['handle']), res['type']
         return res['value'], res['type']
 
     def object_proxy_setattr(self, object_name: str, name: str, value: Any):
@@ -265,6 +1290,86 @@ class PipeClientJsonRpc:
     def register_custom_communicator(self, communicator_name: str, code: str):
         self._rpc_request('register_custom_communicator', locals())
 
+    def register_code(self, name: str, code: str, communicator=False,
+                      std_forward=True):
+        # the source is sent and executed only if the server does not hold
+        # this version of name
+        code_hash = hashlib.sha256(code.encode()).hexdigest()
+        params = {'name': name, 'hash': code_hash, 'code': None,
+                  'communicator': communicator, 'std_forward': std_forward}
+        try:
+            res = self._rpc_request('register_code', params)
+        except PipeServerMethodNotFound:
+            self._register_code_legacy(name, code, communicator, std_forward)
+            return
+        if not res['registered']:
+            params['code'] = code
+            self._rpc_request('register_code', params)
+
+    def _register_code_legacy(self, name: str, code: str, communicator: bool,
+                              std_forward: bool):
+        # an older server without register_code executes the source each time
+        if communicator:
+            self.register_custom_communicator(name, code)
+        else:
+            self.exec(code, std_forward=std_forward)
+
+    def register_codes(self, codes: List[Tuple[str, str]], std_forward=True):
+        # register_code of several (name, source) in one request, a second
+        # request sends the sources not held by the server
+        entries = [{'name': name, 'code': None,
+                    'hash': hashlib.sha256(code.encode()).hexdigest()}
+                   for name, code in codes]
+        try:
+            res = self._rpc_request('register_codes', {
+                'codes': entries, 'std_forward': std_forward})
+        except PipeServerMethodNotFound:
+            for name, code in codes:
+                self._register_code_legacy(name, code, False, std_forward)
+            return
+        if res['missing']:
+            sources = dict(codes)
+            entries = [dict(entry, code=sources[entry['name']])
+                       for entry in entries if entry['name'] in res['missing']]
+            self._rpc_request('register_codes', {
+                'codes': entries, 'std_forward': std_forward})
+
+    def register_package(self, name: str, bundle: bytes):
+        # the bundle is sent only if the server does not hold it
+        params = {'name': name, 'hash': hashlib.sha256(bundle).hexdigest(),
+                  'bundle': None}
+        if not self._rpc_request('register_package', params)['registered']:
+            params['bundle'] = bytearray(bundle)
+            self._rpc_request('register_package', params)
+
+    def defer_codes(self, codes: List[Tuple[str, str]]):
+        self._deferred_codes.extend(codes)
+
+    def clear_deferred_codes(self) -> List[Tuple[str, str]]:
+        # the deferred sources not registered yet are dropped and returned
+        with self._deferred_lock:
+            codes = list(self._deferred_codes)
+            del self._deferred_codes[:len(codes)]
+        return codes
+
+    def _register_deferred(self):
+        # the deferred sources are taken off the queue and registered before
+        # the next request, the requests of the other threads wait for their
+        # registration, a failed registration is raised once by this request
+        if not self._deferred_codes or \
+                self._deferred_owner == threading.get_ident():
+            return
+        with self._deferred_lock:
+            codes = list(self._deferred_codes)
+            if not codes:
+                return
+            del self._deferred_codes[:len(codes)]
+            self._deferred_owner = threading.get_ident()
+            try:
+                self.register_codes(codes)
+            finally:
+                self._deferred_owner = None
+
     def execute_custom_communicator(self, func_name: str, com_type='binary'
                                     ) -> Union[TcpNetIo, TcpJsonCom]:
         if com_type not in ['binary', 'json']:
@@ -273,7 +1378,7 @@ class PipeClientJsonRpc:
         req = self._format_rpc_notification(
             self.execute_custom_communicator.__name__,
             {'communicator_name': func_name, 'com_type': com_type})
-        tcp_client = TcpClient(self.ip_address, self.port)
+        tcp_client = TcpClient(self.ip_address, self.port, self.unix_socket)
         tcp_client.create_connection()
         tcp_json_com = TcpJsonCom()
         tcp_json_com.set_socket(tcp_client.sock)
@@ -288,53 +1393,341 @@ class PipeClientJsonRpc:
             raise PipeCustomComNotFound('Custom communicator not found.')
 
     @contextlib.contextmanager
-    def _file_transfer_to_client(self, src_file: str
-                                 ) -> Iterator[Tuple[TcpJsonCom, int]]:
-        with self._rpc_notification('file_transfer_to_client', locals()) as (
+    def _file_transfer_to_client(self, src_file: str, offset: int = None,
+                                 length: int = None
+                                 ) -> Iterator[Tuple[TcpJsonCom, int, bool]]:
+        params = {'src_file': src_file}
+        if offset is not None:
+            # byte range sent as CRC32 checked chunks, never compressed
+            params.update(offset=offset, length=length,
+                          chunk_size=PIPE_TRANSFER_CHUNK_SIZE)
+        elif self.compression:
+            params['compression'] = {'threshold': PIPE_COMPRESSION_THRESHOLD,
+                                     'level': PIPE_COMPRESSION_LEVEL}
+
+        with self._rpc_notification('file_transfer_to_client', params) as (
                 tcp_json_com):
             file_found = tcp_json_com.io.recvall(1)
             if file_found == b'\x00':
                 file_len = struct.unpack('!Q', tcp_json_com.io.recvall(8))[0]
-                yield tcp_json_com, file_len
+                compressed = False
+                if 'compression' in params:
+                    compressed = tcp_json_com.io.recvall(1) == b'\x01'
+                yield tcp_json_com, file_len, compressed
             else:
                 raise PipeFileTransferErr("File '{}' not found.".format(
                     src_file))
 
     @contextlib.contextmanager
-    def _file_transfer_to_server(self, dst_file: str, data_len: int
+    def _file_transfer_to_server(self, dst_file: str, data_len: int,
+                                 compressed=False, sha256: str = None
                                  ) -> Iterator[Tuple[TcpJsonCom, int]]:
         with self._rpc_notification('file_transfer_to_server', locals()) as (
                 tcp_json_com):
             yield tcp_json_com
             tcp_json_com.io.recvall(1)
 
-    def file_bytes_transfer_to_client(self, src_file) -> bytes:
-        with self._file_transfer_to_client(src_file) as (tcp_json_com, f_len):
+    def _compress_file_transfer(self, data_len: int) -> bool:
+        return self.compression and data_len >= PIPE_COMPRESSION_THRESHOLD
+
+    def _file_range_transfer_to_client(self, src_file: str, offset: int,
+                                       length: Union[int, None],
+                                       write: callable) -> int:
+        # the verified chunks are passed to write, an interrupted transfer is
+        # resumed from the last verified chunk
+        count = 0
+        for attempt in range(PIPE_TRANSFER_RETRIES + 1):
+            try:
+                with self._file_transfer_to_client(
+                        src_file, offset + count,
+                        None if length is None else length - count) as (
+                        tcp_json_com, f_len, _):
+                    for chunk in tcp_json_com.io.recv_checked_chunks(
+                            f_len, PIPE_TRANSFER_CHUNK_SIZE):
+                        write(chunk)
+                        count += len(chunk)
+                return count
+            except (TcpNetIoError, ConnectionError, socket.timeout):
+                if attempt == PIPE_TRANSFER_RETRIES:
+                    raise
+
+    def _file_range_upload(self, src_file: str, dst_file: str, offset: int,
+                           data_len: int, truncate=True):
+        params = {'dst_file': dst_file, 'data_len': data_len,
+                  'offset': offset, 'chunk_size': PIPE_TRANSFER_CHUNK_SIZE,
+                  'truncate': truncate}
+        with self._rpc_notification('file_transfer_to_server', params) as (
+                tcp_json_com):
+            tcp_json_com.io.sendall_checked_chunks(
+                src_file, offset, data_len, PIPE_TRANSFER_CHUNK_SIZE)
+            tcp_json_com.io.recvall(1)
+
+    def _file_range_transfer_to_server(self, src_file: str, dst_file: str,
+                                       data_len: int) -> int:
+        # the server only writes the verified chunks, the size of dst_file is
+        # the offset from which an interrupted transfer is resumed
+        first_offset = None
+        for attempt in range(PIPE_TRANSFER_RETRIES + 1):
+            try:
+                offset = self.get_file_size(dst_file) or 0
+                if offset > data_len:
+                    offset = 0
+                if first_offset is None:
+                    first_offset = offset
+                self._file_range_upload(
+                    src_file, dst_file, offset, data_len - offset)
+                return data_len - first_offset
+            except (TcpNetIoError, ConnectionError, socket.timeout):
+                if attempt == PIPE_TRANSFER_RETRIES:
+                    raise
+
+    @staticmethod
+    def _split_ranges(data_len: int, streams: int) -> List[Tuple[int, int]]:
+        # the ranges are aligned on the chunks
+        chunks = -(-data_len // PIPE_TRANSFER_CHUNK_SIZE)
+        range_len = -(-chunks // streams) * PIPE_TRANSFER_CHUNK_SIZE
+        return [(offset, min(range_len, data_len - offset))
+                for offset in range(0, data_len, range_len or 1)]
+
+    @staticmethod
+    def _run_ranges(transfer: callable, ranges: List[Tuple[int, int]]):
+        if not ranges:
+            return
+        with ThreadPoolExecutor(len(ranges)) as executor:
+            futures = [executor.submit(transfer, offset, data_len)
+                       for offset, data_len in ranges]
+            for future in futures:
+                future.result()
+
+    def _check_file_hash(self, remote_file: str, local_file: str):
+        # the remote file is hashed while the local one is
+        with ThreadPoolExecutor(1) as executor:
+            remote_hash = executor.submit(
+                self.get_file_hash, remote_file, 'sha256')
+            if remote_hash.result() != file_sha256(local_file):
+                raise PipeFileTransferErr(
+                    "Integrity check of '{}' failed.".format(local_file))
+
+    def _parallel_transfer_to_client(self, src_file: str, dst_file: str,
+                                     streams: int) -> int:
+        # the ranges are received on their own connection and written at
+        # their offset in dst_file
+        file_size = self.get_file_size(src_file)
+        if file_size is None:
+            raise PipeFileTransferErr("File '{}' not found.".format(src_file))
+        with open(dst_file, 'wb') as file:
+            file.truncate(file_size)
+
+        def transfer(offset, data_len):
+            with open(dst_file, 'r+b') as range_file:
+                range_file.seek(offset)
+                self._file_range_transfer_to_client(
+                    src_file, offset, data_len, range_file.write)
+
+        self._run_ranges(transfer, self._split_ranges(file_size, streams))
+        self._check_file_hash(src_file, dst_file)
+        return file_size
+
+    def _parallel_transfer_to_server(self, src_file: str, dst_file: str,
+                                     streams: int) -> int:
+        data_len = os.path.getsize(src_file)
+        # an empty range at the end of dst_file sets its size, the ranges
+        # are then written at their offset without truncating it
+        self._file_range_upload(src_file, dst_file, data_len, 0)
+
+        def transfer(offset, range_len):
+            for attempt in range(PIPE_TRANSFER_RETRIES + 1):
+                try:
+                    self._file_range_upload(
+                        src_file, dst_file, offset, range_len, truncate=False)
+                    return
+                except (TcpNetIoError, ConnectionError, socket.timeout):
+                    if attempt == PIPE_TRANSFER_RETRIES:
+                        raise
+
+        self._run_ranges(transfer, self._split_ranges(data_len, streams))
+        self._check_file_hash(dst_file, src_file)
+        return data_len
+
+    @contextlib.contextmanager
+    def _files_transfer_to_client(self, params: dict
+                                  ) -> Iterator[TcpJsonCom]:
+        with self._rpc_notification('files_transfer_to_client', params) as (
+                tcp_json_com):
+            if tcp_json_com.io.recvall(1) != b'\x00':
+                raise PipeFileTransferErr('Files {} not found.'.format(
+                    params.get('src_dir') or params.get('src_files')))
+            yield tcp_json_com
+
+    def _files_transfer_to_server(self, entries: Iterator[Tuple[str, str]],
+                                  dst_dir: str) -> int:
+        with self._rpc_notification(
+                'files_transfer_to_server', {'dst_dir': dst_dir}) as (
+                tcp_json_com):
+            count = tcp_json_com.io.sendall_files(entries)
+            tcp_json_com.io.recvall(1)
+        return count
+
+    def _file_dedup_to_server(self, sha256: str, dst_file: str) -> bool:
+        # the server copies dst_file from its content addressed store, the
+        # upload is skipped
+        return self._rpc_request('file_dedup_to_server', locals())['found']
+
+    def get_file_size(self, file: str) -> Union[int, None]:
+        return self._rpc_request('get_file_size', locals())['size']
+
+    def get_file_hash(self, file: str, algorithm='sha256') -> Union[str, None]:
+        return self._rpc_request('get_file_hash', locals())['hash']
+
+    def file_bytes_transfer_to_client(self, src_file, offset=0, length=None
+                                      ) -> bytes:
+        if offset or length is not None:
+            data = bytearray()
+            self._file_range_transfer_to_client(
+                src_file, offset, length, data.extend)
+            return data
+
+        with self._file_transfer_to_client(src_file) as (
+                tcp_json_com, f_len, compressed):
+            if compressed:
+                return bytearray(b''.join(tcp_json_com.io.recv_compressed()))
             return tcp_json_com.io.recvall(f_len)
 
-    def file_transfer_to_client(self, src_file: str, dst_file: str) -> int:
-        with self._file_transfer_to_client(src_file) as (tcp_json_com, f_len):
-            return tcp_json_com.io.recvall_to_file(f_len, dst_file)
+    def file_transfer_to_client(self, src_file: str, dst_file: str, offset=0,
+                                length=None, resume=False,
+                                streams=PIPE_TRANSFER_STREAMS
+                                ) -> FileTransferStats:
+        start = time.monotonic()
+        if streams > 1:
+            if offset or length is not None or resume:
+                raise ValueError('A parallel transfer copies the whole file.')
+            count = self._parallel_transfer_to_client(
+                src_file, dst_file, streams)
+            return FileTransferStats(count, time.monotonic() - start)
+        if offset or length is not None or resume:
+            # with resume, the bytes of dst_file are the verified chunks of a
+            # previous transfer of the same range
+            done = 0
+            if resume and os.path.isfile(dst_file):
+                done = os.path.getsize(dst_file)
+                if length is not None:
+                    done = min(done, length)
+            with open(dst_file, 'r+b' if done else 'wb') as file:
+                file.truncate(done)
+                file.seek(done)
+                count = self._file_range_transfer_to_client(
+                    src_file, offset + done,
+                    None if length is None else length - done, file.write)
+            return FileTransferStats(count, time.monotonic() - start)
+
+        with self._file_transfer_to_client(src_file) as (
+                tcp_json_com, f_len, compressed):
+            if compressed:
+                count = tcp_json_com.io.recv_compressed_to_file(dst_file)
+            else:
+                count = tcp_json_com.io.recvall_to_file(f_len, dst_file)
+        return FileTransferStats(count, time.monotonic() - start)
+
+    def file_bytes_transfer_to_server(self, file_bytes: bytes, dst_file: str,
+                                      dedup=PIPE_DEDUP):
+        sha256 = None
+        if dedup:
+            sha256 = hashlib.sha256(file_bytes).hexdigest()
+            if self._file_dedup_to_server(sha256, dst_file):
+                return
 
-    def file_bytes_transfer_to_server(self, file_bytes: bytes, dst_file: str):
         data_len = len(file_bytes)
-        with self._file_transfer_to_server(dst_file, data_len) as tcp_json_com:
-            tcp_json_com.io.sendall(file_bytes)
+        compressed = self._compress_file_transfer(data_len)
+        with self._file_transfer_to_server(
+                dst_file, data_len, compressed, sha256) as tcp_json_com:
+            if compressed:
+                tcp_json_com.io.sendall_compressed([file_bytes])
+            else:
+                tcp_json_com.io.sendall(file_bytes)
+
+    def file_transfer_to_server(self, src_file: str, dst_file: str,
+                                resume=False, streams=PIPE_TRANSFER_STREAMS,
+                                dedup=PIPE_DEDUP) -> FileTransferStats:
+        start = time.monotonic()
+        sha256 = None
+        if dedup:
+            sha256 = file_sha256(src_file)
+            if self._file_dedup_to_server(sha256, dst_file):
+                return FileTransferStats(os.path.getsize(src_file),
+                                         time.monotonic() - start, True)
+
+        if streams > 1:
+            if resume:
+                raise ValueError('A parallel transfer copies the whole file.')
+            count = self._parallel_transfer_to_server(
+                src_file, dst_file, streams)
+            return FileTransferStats(count, time.monotonic() - start)
 
-    def file_transfer_to_server(self, src_file: str, dst_file: str):
         data_len = os.path.getsize(src_file)
-        with self._file_transfer_to_server(dst_file, data_len) as tcp_json_com:
-            tcp_json_com.io.sendall_from_file(src_file)
+        if resume:
+            count = self._file_range_transfer_to_server(
+                src_file, dst_file, data_len)
+            return FileTransferStats(count, time.monotonic() - start)
+
+        compressed = self._compress_file_transfer(data_len)
+        with self._file_transfer_to_server(
+                dst_file, data_len, compressed, sha256) as tcp_json_com:
+            if compressed:
+                tcp_json_com.io.sendall_compressed(
+                    TcpNetIo.file_chunks(src_file))
+            else:
+                tcp_json_com.io.sendall_from_file(src_file)
+        return FileTransferStats(data_len, time.monotonic() - start)
+
+    def dir_transfer_to_client(self, src_dir: str, dst_dir: str
+                               ) -> FileTransferStats:
+        start = time.monotonic()
+        with self._files_transfer_to_client({'src_dir': src_dir}) as (
+                tcp_json_com):
+            os.makedirs(dst_dir, exist_ok=True)
+            count = tcp_json_com.io.recv_files(dst_dir)
+        return FileTransferStats(count, time.monotonic() - start)
+
+    def dir_transfer_to_server(self, src_dir: str, dst_dir: str
+                               ) -> FileTransferStats:
+        if not os.path.isdir(src_dir):
+            raise PipeFileTransferErr(
+                "Directory '{}' not found.".format(src_dir))
+        start = time.monotonic()
+        count = self._files_transfer_to_server(dir_entries(src_dir), dst_dir)
+        return FileTransferStats(count, time.monotonic() - start)
+
+    def files_transfer_to_client(self, src_files: List[str], dst_dir: str
+                                 ) -> FileTransferStats:
+        # the files are written in dst_dir under their base name
+        start = time.monotonic()
+        with self._files_transfer_to_client({'src_files': src_files}) as (
+                tcp_json_com):
+            os.makedirs(dst_dir, exist_ok=True)
+            count = tcp_json_com.io.recv_files(dst_dir)
+        return FileTransferStats(count, time.monotonic() - start)
+
+    def files_transfer_to_server(self, src_files: List[str], dst_dir: str
+                                 ) -> FileTransferStats:
+        for src_file in src_files:
+            if not os.path.isfile(src_file):
+                raise PipeFileTransferErr(
+                    "File '{}' not found.".format(src_file))
+        start = time.monotonic()
+        count = self._files_transfer_to_server(
+            [(os.path.basename(f), f) for f in src_files], dst_dir)
+        return FileTransferStats(count, time.monotonic() - start)
 
 
 class ObjProxy(object):
     def __init__(self, object_name: str, ip_address: str,
-                 port: int, class_name: str, src: str = None, std_forward=True):
+                 port: int, class_name: str, src: str = None, std_forward=True,
+                 pipe_client_rpc: PipeClientJsonRpc = None):
         self.__PROXY_IP__ = ip_address
         self.__PROXY_PORT__ = port
         self.__PROXY_OBJECT_NAME__ = object_name
         self.__PROXY_SRC__ = src
-        self.__GPC__ = PipeClientJsonRpc(ip_address, port)
+        self.__GPC__ = pipe_client_rpc or PipeClientJsonRpc(ip_address, port)
         self.__PROXY_CLASS_NAME__ = class_name
         self.__STD_FORWARD__ = std_forward
 
@@ -374,8 +1767,9 @@ def attach_proxy_meta(obj: Any, obj_name: str, ip_address: str, port: int,
 
 
 def _class_proxy_factory(class_name: str, ip_address=PIPE_IP, port=PIPE_PORT,
-                         src: str = None, std_forward=True):
-    gpc = PipeClientJsonRpc(ip_address, port)
+                         src: str = None, std_forward=True,
+                         pipe_client_rpc: PipeClientJsonRpc = None):
+    gpc = pipe_client_rpc or PipeClientJsonRpc(ip_address, port)
 
     class MetaClassProxy(type):
         def __getattr__(self, name):
@@ -404,50 +1798,156 @@ def _class_proxy_factory(class_name: str, ip_address=PIPE_IP, port=PIPE_PORT,
         def __new__(cls, *args, **kwargs):
             obj_name = gpc.object_proxy_new(class_name, args, kwargs)
             return ObjProxy(obj_name, ip_address, port, class_name, src,
-                            std_forward)
+                            std_forward, gpc)
 
     attach_proxy_meta(ClassProxy, class_name, ip_address, port, src)
 
     return ClassProxy
 
 
+def _strip_remote_decorator(src: str) -> str:
+    # the lines of the PipeClient.remote decorators are removed, a decorator
+    # ends with its logical line
+    lines = src.splitlines(True)
+    ends = [token.end[0] for token in tokenize.generate_tokens(
+        io.StringIO(src).readline) if token.type == tokenize.NEWLINE]
+    for decorator in reversed(ast.parse(src).body[0].decorator_list):
+        if isinstance(decorator, ast.Attribute) and \
+                decorator.attr == 'remote' or \
+                isinstance(decorator, ast.Name) and decorator.id == 'remote':
+            end = min(row for row in ends if row >= decorator.lineno)
+            del lines[decorator.lineno - 1:end]
+    return ''.join(lines)
+
+
+def _package_bundle(module: types.ModuleType) -> bytes:
+    # zip of the files of a package or module, the same files always give the
+    # same bundle
+    if hasattr(module, '__path__'):
+        root = list(module.__path__)[0]
+        files = []
+        for dir_path, dir_names, file_names in os.walk(root):
+            dir_names[:] = sorted(d for d in dir_names if d != '__pycache__')
+            files.extend(os.path.join(dir_path, f) for f in sorted(file_names)
+                         if not f.endswith(('.pyc', '$py.class')))
+    else:
+        root = module.__file__
+        files = [root]
+
+    bundle = io.BytesIO()
+    with zipfile.ZipFile(bundle, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for path in files:
+            info = zipfile.ZipInfo(os.path.relpath(
+                path, os.path.dirname(root)).replace(os.sep, '/'))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as f:
+                zip_file.writestr(info, f.read())
+    return bundle.getvalue()
+
+
 class PipeClient:
-    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT, std_forward=True):
+    def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT, std_forward=True,
+                 multiplex=PIPE_MULTIPLEX, unix_socket=PIPE_UNIX_SOCKET,
+                 compression=PIPE_COMPRESSION, codec=PIPE_CODEC):
         self.ip_address = ip_address
         self.port = port
         self.std_forward = std_forward
-        self.pipe_client_rpc = PipeClientJsonRpc(self.ip_address, self.port)
+        self.pipe_client_rpc = PipeClientJsonRpc(
+            self.ip_address, self.port, multiplex=multiplex,
+            unix_socket=unix_socket, compression=compression, codec=codec)
         # direct RPC method binding
         pcrpc = self.pipe_client_rpc
         self.get_server_banner = pcrpc.get_server_banner
         self.server_remote_shutdown = pcrpc.server_remote_shutdown
+        self.get_file_size = pcrpc.get_file_size
+        self.get_file_hash = pcrpc.get_file_hash
         self.file_bytes_transfer_to_client = pcrpc.file_bytes_transfer_to_client
         self.file_transfer_to_client = pcrpc.file_transfer_to_client
         self.file_bytes_transfer_to_server = pcrpc.file_bytes_transfer_to_server
         self.file_transfer_to_server = pcrpc.file_transfer_to_server
+        self.dir_transfer_to_client = pcrpc.dir_transfer_to_client
+        self.dir_transfer_to_server = pcrpc.dir_transfer_to_server
+        self.files_transfer_to_client = pcrpc.files_transfer_to_client
+        self.files_transfer_to_server = pcrpc.files_transfer_to_server
+        self.batch = pcrpc.batch
 
     def exec(self, code: str, std_cap=False) -> Union[None, str]:
         return self.pipe_client_rpc.exec(code, std_cap, self.std_forward)
 
+    def iter_exec(self, func_name: str, args: Tuple = (), kwargs: dict = None,
+                  batch_size=PIPE_ITER_BATCH_SIZE) -> RemoteIterator:
+        return self.pipe_client_rpc.iter_exec(
+            func_name, args, kwargs or {}, self.std_forward, batch_size)
+
+    def handle_exec(self, func_name: str, args: Tuple = (), kwargs: dict = None
+                    ) -> Any:
+        # a list or dict returned is always paged
+        return self.pipe_client_rpc.func_exec(
+            func_name, args, kwargs or {}, self.std_forward, handle=0)
+
     def obj_proxy_factory(self, object_name: str, class_name: str = None,
                           src: str = None) -> ObjProxy:
         return ObjProxy(object_name, self.ip_address, self.port, class_name,
-                        src)
+                        src, pipe_client_rpc=self.pipe_client_rpc)
 
     def class_proxy_factory(self, class_name: str, src: str):
         return _class_proxy_factory(class_name, self.ip_address, self.port, src,
-                                    self.std_forward)
+                                    self.std_forward, self.pipe_client_rpc)
 
     def register_class(self, class_obj: Any):
         if not inspect.isclass(class_obj):
             raise ValueError("'{}' object must be a class.".format(
                 class_obj.__name__))
         src = textwrap.dedent(inspect.getsource(class_obj))
-        self.pipe_client_rpc.exec(src)
+        self.pipe_client_rpc.register_code(class_obj.__name__, src,
+                                           std_forward=self.std_forward)
         return self.class_proxy_factory(class_obj.__name__, src)
 
+    def register_many(self, *objs: Any, defer=False) -> List[Any]:
+        # the functions and classes are registered together, or before the
+        # next request of the client if defer
+        codes, proxies = [], []
+        for obj in objs:
+            if not inspect.isfunction(obj) and not inspect.isclass(obj):
+                raise ValueError(
+                    "'{}' object must be a function or a class.".format(
+                        obj.__name__))
+            src = _strip_remote_decorator(
+                textwrap.dedent(inspect.getsource(obj)))
+            codes.append((obj.__name__, src))
+            if inspect.isclass(obj):
+                proxies.append(self.class_proxy_factory(obj.__name__, src))
+            else:
+                proxies.append(self.func_proxy_factory(obj.__name__, src))
+
+        if defer:
+            self.pipe_client_rpc.defer_codes(codes)
+        else:
+            self.pipe_client_rpc.register_codes(codes, self.std_forward)
+        return proxies
+
+    def register_package(self, package: Union[str, types.ModuleType]):
+        # the package is importable by the remote code once registered
+        if isinstance(package, str):
+            package = importlib.import_module(package)
+        if '.' in package.__name__:
+            raise ValueError("'{}' must be a top level package or "
+                             "module.".format(package.__name__))
+        self.pipe_client_rpc.register_package(package.__name__,
+                                              _package_bundle(package))
+
+    def remote(self, obj: Any) -> Any:
+        # decorator, the decorated objects are registered together before the
+        # next request of the client
+        return self.register_many(obj, defer=True)[0]
+
+    def clear_deferred(self) -> List[str]:
+        # the names deferred and not registered yet are dropped
+        return [name for name, _ in
+                self.pipe_client_rpc.clear_deferred_codes()]
+
     def func_proxy_factory(self, func_name: str, src: str = None) -> callable:
-        json_rpc_client = PipeClientJsonRpc(self.ip_address, self.port)
+        json_rpc_client = self.pipe_client_rpc
 
         def func_proxy(*args, **kwargs) -> Any:
             return json_rpc_client.func_exec(func_name, args, kwargs,
@@ -462,12 +1962,13 @@ class PipeClient:
             raise ValueError("'{}' object must be a function.".format(
                 func.__name__))
         src = textwrap.dedent(inspect.getsource(func))
-        self.pipe_client_rpc.exec(src)
+        self.pipe_client_rpc.register_code(func.__name__, src,
+                                           std_forward=self.std_forward)
         return self.func_proxy_factory(func.__name__, src)
 
     def communicator_proxy_factory(self, func_name: str, com_type: str,
                                    src: str = None) -> callable:
-        json_rpc_client = PipeClientJsonRpc(self.ip_address, self.port)
+        json_rpc_client = self.pipe_client_rpc
 
         def communicator_proxy() -> Union[TcpNetIo, TcpJsonCom]:
             return json_rpc_client.execute_custom_communicator(
@@ -482,5 +1983,6 @@ class PipeClient:
         if not inspect.isfunction(func):
             raise ValueError("'{}' must be a function.".format(func.__name__))
         src = textwrap.dedent(inspect.getsource(func))
-        self.pipe_client_rpc.register_custom_communicator(func.__name__, src)
+        self.pipe_client_rpc.register_code(func.__name__, src, True,
+                                           self.std_forward)
         return self.communicator_proxy_factory(func.__name__, com_type, src)
@@ -0,0 +1,306 @@
+################################################################################
+#
+# Copyright 2022 Vincent Dary
+#
+# This file is part of ghidra-pipe.
+#
+# ghidra-pipe is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# ghidra-pipe is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# ghidra-pipe. If not, see <https://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# MessagePack subset shared by the pipe server (Jython 2.7) and the pipe
+# client (CPython 3), negotiated per connection with the set_codec method:
+# nil, bool, int, float 64, str, bin, array and map, the integers beyond 64
+# bits are sent as an ext type holding their decimal string. bin values are
+# decoded as bytearray, arrays as list.
+
+import struct
+
+if str is bytes:  # Python 2, str holds text
+    TEXT_TYPES = (str, unicode)  # noqa: F821
+    INT_TYPES = (int, long)  # noqa: F821
+    BINARY_TYPES = (bytearray,)
+else:
+    TEXT_TYPES = (str,)
+    INT_TYPES = (int,)
+    BINARY_TYPES = (bytes, bytearray, memoryview)
+
+EXT_BIG_INT = 1
+
+_B = struct.Struct('>B').pack
+_b = struct.Struct('>b').pack
+_BB = struct.Struct('>BB').pack
+_BH = struct.Struct('>BH').pack
+_BI = struct.Struct('>BI').pack
+_BQ = struct.Struct('>BQ').pack
+_Bb = struct.Struct('>Bb').pack
+_Bh = struct.Struct('>Bh').pack
+_Bi = struct.Struct('>Bi').pack
+_Bq = struct.Struct('>Bq').pack
+_Bd = struct.Struct('>Bd').pack
+_BBb = struct.Struct('>BBb').pack
+
+_FIXINT = [_B(i) for i in range(0x80)]
+
+
+class MsgPackError(ValueError):
+    pass
+
+
+def msgpack_dumps(obj, default=None):
+    # default converts the values of the other types, e.g. the byte jarrays
+    chunks = []
+    write = chunks.append
+    # the dict keys are repeated in the lists of records
+    texts = {}
+
+    def pack(obj):
+        # the most frequent types are tested first
+        obj_type = type(obj)
+
+        if obj_type in TEXT_TYPES:
+            packed = texts.get(obj)
+            if packed is None:
+                packed = _pack_text(obj)
+                if len(obj) < 0x20:
+                    texts[obj] = packed
+            write(packed)
+        elif obj_type in INT_TYPES:
+            write(_FIXINT[obj] if 0 <= obj < 0x80 else _pack_int(obj))
+        elif obj_type is dict:
+            write(_pack_header(len(obj), 0x80, 0xde))
+            for key, value in obj.items():
+                pack(key)
+                pack(value)
+        elif obj_type in (list, tuple):
+            write(_pack_header(len(obj), 0x90, 0xdc))
+            for item in obj:
+                pack(item)
+        elif obj is None:
+            write(b'\xc0')
+        elif obj_type is bool:
+            write(b'\xc3' if obj else b'\xc2')
+        elif obj_type is float:
+            write(_Bd(0xcb, obj))
+        elif obj_type in BINARY_TYPES:
+            write(_pack_bin_header(len(obj)))
+            # the chunks are joined as str on Python 2
+            write(obj if bytes is not str else bytes(obj))
+        elif isinstance(obj, dict):  # subclasses, e.g. OrderedDict
+            pack(dict(obj))
+        elif isinstance(obj, (list, tuple)):
+            pack(list(obj))
+        elif isinstance(obj, INT_TYPES):
+            pack(int(obj))
+        elif isinstance(obj, TEXT_TYPES):
+            write(_pack_text(obj))
+        elif default is not None:
+            pack(default(obj))
+        else:
+            raise TypeError('{!r} is not MessagePack serializable'.format(obj))
+
+    pack(obj)
+    return b''.join(chunks)
+
+
+def _pack_int(obj):
+    if -0x20 <= obj < 0:
+        return _b(obj)
+    elif 0 <= obj <= 0xffffffffffffffff:
+        if obj < 0x80:
+            return _B(obj)
+        elif obj <= 0xff:
+            return _BB(0xcc, obj)
+        elif obj <= 0xffff:
+            return _BH(0xcd, obj)
+        elif obj <= 0xffffffff:
+            return _BI(0xce, obj)
+        return _BQ(0xcf, obj)
+    elif -0x8000000000000000 <= obj < 0:
+        if obj >= -0x80:
+            return _Bb(0xd0, obj)
+        elif obj >= -0x8000:
+            return _Bh(0xd1, obj)
+        elif obj >= -0x80000000:
+            return _Bi(0xd2, obj)
+        return _Bq(0xd3, obj)
+    data = str(obj).encode('ascii')
+    return _BBb(0xc7, len(data), EXT_BIG_INT) + data
+
+
+def _pack_text(obj):
+    if type(obj) is not bytes:
+        obj = obj.encode('utf-8')
+    data_len = len(obj)
+    if data_len < 0x20:
+        return _B(0xa0 | data_len) + obj
+    elif data_len <= 0xff:
+        return _BB(0xd9, data_len) + obj
+    elif data_len <= 0xffff:
+        return _BH(0xda, data_len) + obj
+    return _BI(0xdb, data_len) + obj
+
+
+def _pack_bin_header(data_len):
+    if data_len <= 0xff:
+        return _BB(0xc4, data_len)
+    elif data_len <= 0xffff:
+        return _BH(0xc5, data_len)
+    return _BI(0xc6, data_len)
+
+
+def _pack_header(length, fix_type, type_16):
+    if length < 0x10:
+        return _B(fix_type | length)
+    elif length <= 0xffff:
+        return _BH(type_16, length)
+    return _BI(type_16 + 1, length)
+
+
+def msgpack_loads(data):
+    # a bytearray is indexed as int on both Python 2 and 3
+    if type(data) is not bytearray:
+        data = bytearray(data)
+    obj, pos = _unpack(data, 0)
+    if pos != len(data):
+        raise MsgPackError('extra data after the MessagePack object')
+    return obj
+
+
+def _unpack(data, pos):
+    # fixint, fixstr, fixarray and fixmap are decoded inline
+    try:
+        type_byte = data[pos]
+    except IndexError:
+        raise MsgPackError('truncated MessagePack data')
+    pos += 1
+
+    if type_byte < 0x80:
+        return type_byte, pos
+    elif 0xa0 <= type_byte < 0xc0:
+        end = pos + (type_byte & 0x1f)
+        if end > len(data):
+            raise MsgPackError('truncated MessagePack data')
+        return data[pos:end].decode('utf-8'), end
+    elif 0x90 <= type_byte < 0xa0:
+        return _decode_array(data, pos, type_byte & 0x0f)
+    elif 0x80 <= type_byte < 0x90:
+        return _decode_map(data, pos, type_byte & 0x0f)
+    return _DECODERS[type_byte](data, pos, type_byte)
+
+
+def _read(data, pos, length):
+    end = pos + length
+    if end > len(data):
+        raise MsgPackError('truncated MessagePack data')
+    return data[pos:end], end
+
+
+def _unpack_struct(fmt):
+    unpacker = struct.Struct(fmt)
+
+    def unpack(data, pos):
+        raw, pos = _read(data, pos, unpacker.size)
+        return unpacker.unpack(bytes(raw))[0], pos
+    return unpack
+
+
+_read_u8 = _unpack_struct('>B')
+_read_u16 = _unpack_struct('>H')
+_read_u32 = _unpack_struct('>I')
+
+
+def _decode_text(data, pos, length):
+    raw, pos = _read(data, pos, length)
+    return raw.decode('utf-8'), pos
+
+
+def _decode_array(data, pos, length):
+    array = []
+    for _ in range(length):
+        item, pos = _unpack(data, pos)
+        array.append(item)
+    return array, pos
+
+
+def _decode_map(data, pos, length):
+    mapping = {}
+    for _ in range(length):
+        key, pos = _unpack(data, pos)
+        mapping[key], pos = _unpack(data, pos)
+    return mapping, pos
+
+
+def _decode_ext(data, pos, length):
+    ext_type, pos = _read_u8(data, pos)
+    raw, pos = _read(data, pos, length)
+    if ext_type != EXT_BIG_INT:
+        raise MsgPackError('unknown MessagePack ext type {}'.format(ext_type))
+    return int(bytes(raw)), pos
+
+
+def _sized(read_length, decode):
+    def decoder(data, pos, type_byte):
+        length, pos = read_length(data, pos)
+        return decode(data, pos, length)
+    return decoder
+
+
+def _number(fmt):
+    read_number = _unpack_struct(fmt)
+    return lambda data, pos, type_byte: read_number(data, pos)
+
+
+def _constant(value):
+    return lambda data, pos, type_byte: (value, pos)
+
+
+def _invalid(data, pos, type_byte):
+    raise MsgPackError('invalid MessagePack type 0x{:02x}'.format(type_byte))
+
+
+def _decode_bin(data, pos, length):
+    raw, pos = _read(data, pos, length)
+    return bytearray(raw), pos
+
+
+_DECODERS = [_invalid] * 0x100
+for _i in range(0xe0, 0x100):
+    _DECODERS[_i] = lambda data, pos, type_byte: (type_byte - 0x100, pos)
+_DECODERS[0xc0] = _constant(None)
+_DECODERS[0xc2] = _constant(False)
+_DECODERS[0xc3] = _constant(True)
+_DECODERS[0xc4] = _sized(_read_u8, _decode_bin)
+_DECODERS[0xc5] = _sized(_read_u16, _decode_bin)
+_DECODERS[0xc6] = _sized(_read_u32, _decode_bin)
+_DECODERS[0xc7] = _sized(_read_u8, _decode_ext)
+_DECODERS[0xc8] = _sized(_read_u16, _decode_ext)
+_DECODERS[0xc9] = _sized(_read_u32, _decode_ext)
+_DECODERS[0xca] = _number('>f')
+_DECODERS[0xcb] = _number('>d')
+_DECODERS[0xcc] = _number('>B')
+_DECODERS[0xcd] = _number('>H')
+_DECODERS[0xce] = _number('>I')
+_DECODERS[0xcf] = _number('>Q')
+_DECODERS[0xd0] = _number('>b')
+_DECODERS[0xd1] = _number('>h')
+_DECODERS[0xd2] = _number('>i')
+_DECODERS[0xd3] = _number('>q')
+_DECODERS[0xd9] = _sized(_read_u8, _decode_text)
+_DECODERS[0xda] = _sized(_read_u16, _decode_text)
+_DECODERS[0xdb] = _sized(_read_u32, _decode_text)
+_DECODERS[0xdc] = _sized(_read_u16, _decode_array)
+_DECODERS[0xdd] = _sized(_read_u32, _decode_array)
+_DECODERS[0xde] = _sized(_read_u16, _decode_map)
+_DECODERS[0xdf] = _sized(_read_u32, _decode_map)
+del _i
@@ -20,3 +20,33 @@
 
 PIPE_IP = 'localhost'
 PIPE_PORT = 5098
+PIPE_KEEP_ALIVE_TIMEOUT = 60
+PIPE_POOL_SIZE = 8
+PIPE_BACKLOG = 50
+PIPE_MAX_CONNECTIONS = 64
+PIPE_CONCURRENT = False
+PIPE_WORKERS = 16
+PIPE_QUEUE_LIMIT = 64
+PIPE_TRANSPORT = 'blocking'
+PIPE_MULTIPLEX = False
+PIPE_UNIX_SOCKET = None
+PIPE_IO_BUFFER_SIZE = 65536
+PIPE_SOCKET_BUFFER_SIZE = 0
+PIPE_COMPRESSION = False
+PIPE_COMPRESSION_THRESHOLD = 8192
+PIPE_COMPRESSION_LEVEL = 1
+PIPE_TRANSFER_CHUNK_SIZE = 1048576
+PIPE_TRANSFER_RETRIES = 3
+PIPE_TRANSFER_STREAMS = 1
+PIPE_DEDUP = False
+PIPE_DEDUP_STORE = None
+PIPE_ATTACHMENTS = False
+PIPE_CODEC = 'json'
+PIPE_GSON = True
+PIPE_ORJSON = True
+PIPE_ITER_BATCH_SIZE = 1000
+PIPE_ITER_TIMEOUT = 600
+PIPE_HANDLE_THRESHOLD = None
+PIPE_PAGE_SIZE = 1000
+PIPE_PAGE_CACHE = 16
+PIPE_CODE_CACHE_SIZE = 256
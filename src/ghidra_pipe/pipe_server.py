@@ -23,24 +23,107 @@ import sys
 import struct
 import traceback
 import json
-import base64
 import inspect
 import binascii
-import tempfile
+import stat
+import hashlib
+import zipfile
+import shutil
+import array
 import contextlib
+import tempfile
+import time
+import types
 import threading
+import collections
+import Queue
 from cStringIO import StringIO
 
-from java.net import InetAddress, ServerSocket
-from java.io import FileOutputStream, FileInputStream
+from java.net import InetAddress, InetSocketAddress, StandardSocketOptions
+from java.net import SocketTimeoutException, ServerSocket, ConnectException
+from java.lang import Integer, System
+from java.security import MessageDigest
+from java.util.zip import Deflater, Inflater, CRC32
+from java.io import FileOutputStream, FileInputStream, RandomAccessFile
 from java.io import DataInputStream, DataOutputStream
+from java.io import BufferedInputStream, BufferedOutputStream
+from java.io import IOException, ByteArrayOutputStream, File
+from java.io import ByteArrayInputStream, InputStreamReader, OutputStreamWriter
+from java.nio.file import Files, StandardCopyOption
+from java.nio import ByteBuffer
+from java.nio.charset import StandardCharsets
+from java.util import Arrays, ArrayList, Base64, LinkedHashMap
+from java.util import Iterator as JavaIterator
+from java.util import List as JavaList, Map as JavaMap
+from java.nio.channels import Selector, SelectionKey, ServerSocketChannel
+from java.nio.channels import Channels, SocketChannel
 
 import jarray
-
-from pipe_default_conf import PIPE_IP, PIPE_PORT
-
-PIPE_PORT = os.getenv('PIPE_PORT', PIPE_PORT)
+from org.python.core.util import StringUtil
+from org.python.core import PyString
+
+# Gson is bundled with Ghidra, not with a standalone Jython
+try:
+    from com.google.gson import GsonBuilder, JsonParser
+except ImportError:
+    GsonBuilder = None
+
+from pipe_default_conf import PIPE_IP, PIPE_PORT, PIPE_KEEP_ALIVE_TIMEOUT
+from pipe_default_conf import PIPE_BACKLOG, PIPE_MAX_CONNECTIONS
+from pipe_default_conf import PIPE_CONCURRENT
+from pipe_default_conf import PIPE_WORKERS, PIPE_QUEUE_LIMIT
+from pipe_default_conf import PIPE_TRANSPORT, PIPE_UNIX_SOCKET
+from pipe_default_conf import PIPE_IO_BUFFER_SIZE, PIPE_SOCKET_BUFFER_SIZE
+from pipe_default_conf import PIPE_COMPRESSION_LEVEL
+from pipe_default_conf import PIPE_DEDUP_STORE, PIPE_GSON
+from pipe_default_conf import PIPE_ITER_BATCH_SIZE, PIPE_ITER_TIMEOUT
+from pipe_default_conf import PIPE_CODE_CACHE_SIZE
+from pipe_codec import msgpack_dumps, msgpack_loads
+
+PIPE_PORT = int(os.getenv('PIPE_PORT', PIPE_PORT))
 PIPE_IP = os.getenv('PIPE_IP', PIPE_IP)
+PIPE_KEEP_ALIVE_TIMEOUT = int(os.getenv('PIPE_KEEP_ALIVE_TIMEOUT',
+                                        PIPE_KEEP_ALIVE_TIMEOUT))
+PIPE_BACKLOG = int(os.getenv('PIPE_BACKLOG', PIPE_BACKLOG))
+PIPE_MAX_CONNECTIONS = int(os.getenv('PIPE_MAX_CONNECTIONS',
+                                     PIPE_MAX_CONNECTIONS))
+PIPE_CONCURRENT = os.getenv('PIPE_CONCURRENT', str(PIPE_CONCURRENT)) == 'True'
+PIPE_WORKERS = int(os.getenv('PIPE_WORKERS', PIPE_WORKERS))
+PIPE_QUEUE_LIMIT = int(os.getenv('PIPE_QUEUE_LIMIT', PIPE_QUEUE_LIMIT))
+PIPE_TRANSPORT = os.getenv('PIPE_TRANSPORT', PIPE_TRANSPORT)
+PIPE_UNIX_SOCKET = os.getenv('PIPE_UNIX_SOCKET', PIPE_UNIX_SOCKET) or None
+PIPE_IO_BUFFER_SIZE = int(os.getenv('PIPE_IO_BUFFER_SIZE', PIPE_IO_BUFFER_SIZE))
+PIPE_SOCKET_BUFFER_SIZE = int(os.getenv('PIPE_SOCKET_BUFFER_SIZE',
+                                        PIPE_SOCKET_BUFFER_SIZE))
+PIPE_COMPRESSION_LEVEL = int(os.getenv('PIPE_COMPRESSION_LEVEL',
+                                       PIPE_COMPRESSION_LEVEL))
+# content addressed store of the uploaded files, private to the user of the
+# server, next to the temp directory
+PIPE_DEDUP_STORE = os.getenv('PIPE_DEDUP_STORE', PIPE_DEDUP_STORE) or \
+    os.path.join(tempfile.gettempdir(),
+                 'ghidra_pipe_store_' + System.getProperty('user.name'))
+PIPE_GSON = os.getenv('PIPE_GSON', str(PIPE_GSON)) == 'True'
+PIPE_ITER_TIMEOUT = int(os.getenv('PIPE_ITER_TIMEOUT', PIPE_ITER_TIMEOUT))
+PIPE_CODE_CACHE_SIZE = int(os.getenv('PIPE_CODE_CACHE_SIZE',
+                                     PIPE_CODE_CACHE_SIZE))
+
+# the JSON frames are encoded and decoded by Gson when available, else by the
+# json module
+GSON = None
+if PIPE_GSON and GsonBuilder is not None:
+    GSON = GsonBuilder().serializeNulls().disableHtmlEscaping() \
+        .serializeSpecialFloatingPointValues().create()
+
+# high bit of the frame length, the frame body is zlib compressed
+FRAME_COMPRESSED = 0x80000000
+# the JSON text of the frame body is followed by raw binary segments
+FRAME_ATTACHMENTS = 0x40000000
+FRAME_LENGTH_MASK = 0x3FFFFFFF
+
+# entry types of the stream of a multi-file transfer
+FILE_ENTRY_END = 0
+FILE_ENTRY_FILE = 1
+FILE_ENTRY_DIR = 2
 
 
 def jarray_b(bytes_seq):
@@ -49,13 +132,44 @@ def jarray_b(bytes_seq):
     return buff
 
 
-@contextlib.contextmanager
-def create_temporary_empty_file():
-    fd, path = tempfile.mkstemp()
-    os.close(fd)
-    yield path
-    if os.path.exists(path) and os.path.isfile(path):
-        os.remove(path)
+def set_socket_buffer_size(sock, send_buffer=True):
+    # the receive buffer of a server socket is inherited by its connections,
+    # sock is a socket or a socket channel
+    if PIPE_SOCKET_BUFFER_SIZE > 0:
+        size = Integer(PIPE_SOCKET_BUFFER_SIZE)
+        sock.setOption(StandardSocketOptions.SO_RCVBUF, size)
+        if send_buffer:
+            sock.setOption(StandardSocketOptions.SO_SNDBUF, size)
+
+
+def zlib_deflate(jarray_byte, level=PIPE_COMPRESSION_LEVEL, offset=0):
+    deflater = Deflater(level)
+    deflater.setInput(jarray_byte, offset, len(jarray_byte) - offset)
+    deflater.finish()
+    out_stream = ByteArrayOutputStream(len(jarray_byte) // 2 + 64)
+    buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+    try:
+        while not deflater.finished():
+            out_stream.write(buff, 0, deflater.deflate(buff))
+    finally:
+        deflater.end()
+    return out_stream.toByteArray()
+
+
+def zlib_inflate(jarray_byte):
+    inflater = Inflater()
+    inflater.setInput(jarray_byte)
+    out_stream = ByteArrayOutputStream(len(jarray_byte) * 4)
+    buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+    try:
+        while not inflater.finished():
+            n_inflated = inflater.inflate(buff)
+            if not n_inflated and inflater.needsInput():
+                raise JavaTcpNetIoError('truncated compressed data')
+            out_stream.write(buff, 0, n_inflated)
+    finally:
+        inflater.end()
+    return out_stream.toByteArray()
 
 
 @contextlib.contextmanager
@@ -72,11 +186,155 @@ def java_file_input_ctx(filename):
     in_fstream.close()
 
 
+@contextlib.contextmanager
+def java_random_access_ctx(filename, mode):
+    raf = RandomAccessFile(filename, mode)
+    yield raf
+    raf.close()
+
+
+def dir_entries(src_dir):
+    # (name, filename) of the sub directories and files of src_dir, the names
+    # are relative paths with '/' separators, filename is None for a directory
+    for root, dirs, files in os.walk(src_dir):
+        dirs.sort()
+        if root != src_dir:
+            yield os.path.relpath(root, src_dir).replace(os.sep, '/'), None
+        for name in sorted(files):
+            filename = os.path.join(root, name)
+            if os.path.isfile(filename):
+                yield os.path.relpath(filename, src_dir).replace(
+                    os.sep, '/'), filename
+
+
+def file_entry_path(root, name):
+    # the entries can not be written outside of the destination directory
+    root = os.path.abspath(root)
+    path = os.path.abspath(os.path.join(root, *name.split('/')))
+    if not path.startswith(root + os.sep):
+        raise JavaTcpNetIoError(
+            "file entry '{}' outside of '{}'".format(name, root))
+    return path
+
+
+def java_file_digest(filename, algorithm):
+    digest = MessageDigest.getInstance(algorithm)
+    buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+    with java_file_input_ctx(filename) as in_fstream:
+        while True:
+            n_read = in_fstream.read(buff)
+            if n_read < 0:
+                break
+            digest.update(buff, 0, n_read)
+    return binascii.hexlify(JarrayConvBypass.tostring(digest.digest()))
+
+
+def dedup_store_root():
+    # the store is created private to the user of the server, a store owned
+    # by another user, or open to the other users, is never trusted
+    try:
+        os.makedirs(PIPE_DEDUP_STORE, 0o700)
+    except OSError:
+        if not os.path.isdir(PIPE_DEDUP_STORE):
+            raise
+    if hasattr(os, 'getuid'):
+        st = os.lstat(PIPE_DEDUP_STORE)
+        if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or \
+                st.st_mode & 0o077:
+            raise ValueError("dedup store '{}' is not private to the "
+                             "user".format(PIPE_DEDUP_STORE))
+    return PIPE_DEDUP_STORE
+
+
+def dedup_store_path(sha256):
+    if len(sha256) != 64 or sha256.strip('0123456789abcdef'):
+        raise ValueError("invalid SHA-256 '{}'".format(sha256))
+    return os.path.join(dedup_store_root(), sha256[:2], sha256)
+
+
+def dedup_store_find(sha256):
+    # the stored file is hashed again before use, None if it is missing or
+    # altered
+    stored = dedup_store_path(sha256)
+    if os.path.isfile(stored) and \
+            java_file_digest(stored, 'SHA-256') == sha256:
+        return stored
+    return None
+
+
+def package_store_path(sha256):
+    # the packages are extracted by content hash in the dedup store
+    dedup_store_path(sha256)
+    return os.path.join(dedup_store_root(), 'packages', sha256)
+
+
+def package_store_add(bundle, sha256):
+    # the zip bundle is extracted in a temporary directory renamed once
+    # complete, jython writes the $py.class files of its modules beside them,
+    # the bundle is kept beside the directory to verify it, see
+    # package_store_verify, an altered package is replaced
+    bundle = str(bundle)
+    if hashlib.sha256(bundle).hexdigest() != sha256:
+        raise ValueError("package bundle does not match '{}'".format(sha256))
+    path = package_store_path(sha256)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(path))
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path))
+    os.close(fd)
+    try:
+        with open(tmp_file, 'wb') as bundle_file:
+            bundle_file.write(bundle)
+        with contextlib.closing(zipfile.ZipFile(StringIO(bundle))) as zip_file:
+            for name in zip_file.namelist():
+                entry_path = file_entry_path(tmp_dir, name)
+                if not os.path.isdir(os.path.dirname(entry_path)):
+                    os.makedirs(os.path.dirname(entry_path))
+                with open(entry_path, 'wb') as entry_file:
+                    entry_file.write(zip_file.read(name))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        if os.path.isfile(path + '.zip'):
+            os.remove(path + '.zip')
+        os.rename(tmp_dir, path)
+        os.rename(tmp_file, path + '.zip')
+    finally:
+        shutil.rmtree(tmp_dir, True)
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def package_store_verify(sha256):
+    # the files of the bundle must be unchanged in the extracted directory
+    path = package_store_path(sha256)
+    try:
+        with open(path + '.zip', 'rb') as bundle_file:
+            bundle = bundle_file.read()
+        if hashlib.sha256(bundle).hexdigest() != sha256:
+            return False
+        with contextlib.closing(zipfile.ZipFile(StringIO(bundle))) as zip_file:
+            for name in zip_file.namelist():
+                with open(file_entry_path(path, name), 'rb') as entry_file:
+                    if entry_file.read() != zip_file.read(name):
+                        return False
+    except (IOError, OSError, zipfile.BadZipfile, JavaTcpNetIoError):
+        return False
+    return True
+
+
+class JavaTcpNetIoError(Exception):
+    pass
+
+
 class JavaTcpNetIo:
+    # the streams are buffered, a frame header and its body are read with one
+    # syscall, the writes are flushed at the end of each send
     def __init__(self, java_sock):
         self.sock = java_sock
-        self.in_stream = DataInputStream(self.sock.getInputStream())
-        self.out_stream = DataOutputStream(self.sock.getOutputStream())
+        self.in_stream = DataInputStream(BufferedInputStream(
+            self.sock.getInputStream(), PIPE_IO_BUFFER_SIZE))
+        self.out_stream = DataOutputStream(BufferedOutputStream(
+            self.sock.getOutputStream(), PIPE_IO_BUFFER_SIZE))
 
     def __enter__(self):
         return self
@@ -85,9 +343,13 @@ class JavaTcpNetIo:
         self.in_stream.close()
         self.out_stream.close()
 
+    def set_timeout(self, timeout):
+        self.sock.setSoTimeout(int(timeout * 1000))
+
     def sendall(self, jarray_byte):
         data_len = len(jarray_byte)
         self.out_stream.write(jarray_byte, 0, data_len)
+        self.out_stream.flush()
         return data_len
 
     def recvall(self, data_len):
@@ -96,127 +358,534 @@ class JavaTcpNetIo:
 
         while count < data_len:
             n_read = self.in_stream.read(recv_buff, count, data_len-count)
+            if n_read < 0:
+                raise JavaTcpNetIoError('socket connection broken')
             count += n_read
 
         return recv_buff
 
     def recvall_to_file(self, data_len, filename):
-        recv_buff = jarray.zeros(4096, "b")
+        recv_buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, "b")
         count = 0
 
         with java_file_output_ctx(filename) as out_fstream:
             while count < data_len:
                 n_read = self.in_stream.read(
-                    recv_buff, 0, min(data_len-count, 4096))
+                    recv_buff, 0, min(data_len-count, PIPE_IO_BUFFER_SIZE))
+                if n_read < 0:
+                    raise JavaTcpNetIoError('socket connection broken')
                 out_fstream.write(recv_buff, 0, n_read)
                 count += n_read
 
         return count
 
     def sendall_from_file(self, filename):
-        send_buff = jarray.zeros(4096, "b")
-        data_len = os.path.getsize(filename)
+        # the socket is not created by a channel, the socket adaptor of a
+        # channel serializes its reads and writes on JDK 12 and older, the
+        # file is copied through the stream buffer
+        self._write_from_file(filename, os.path.getsize(filename))
+        self.out_stream.flush()
+
+    def _write_from_file(self, filename, data_len):
+        send_buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, "b")
         count = 0
 
         with java_file_input_ctx(filename) as in_fstream:
             while count < data_len:
-                n_read = in_fstream.read(send_buff, 0, min(data_len-count, 4096))
+                n_read = in_fstream.read(
+                    send_buff, 0, min(data_len-count, PIPE_IO_BUFFER_SIZE))
+                if n_read < 0:
+                    raise JavaTcpNetIoError('file truncated while sent')
                 self.out_stream.write(send_buff, 0, n_read)
                 count += n_read
 
+    def sendall_files(self, entries):
+        # tar-like stream, each entry is its type, its name and for a file its
+        # size and bytes, the small files are copied in the stream buffer
+        count = 0
+
+        for name, filename in entries:
+            name_b = name.encode('utf-8')
+            if filename is None:
+                self.out_stream.write(jarray_b(
+                    struct.pack('!BI', FILE_ENTRY_DIR, len(name_b)) + name_b))
+                continue
+            data_len = os.path.getsize(filename)
+            self.out_stream.write(jarray_b(
+                struct.pack('!BI', FILE_ENTRY_FILE, len(name_b)) + name_b +
+                struct.pack('!Q', data_len)))
+            if data_len < PIPE_IO_BUFFER_SIZE:
+                self._write_from_file(filename, data_len)
+            else:
+                self.sendall_from_file(filename)
+            count += data_len
+
+        self.out_stream.write(jarray_b(struct.pack('!BI', FILE_ENTRY_END, 0)))
+        self.out_stream.flush()
+        return count
+
+    def recvall_files(self, dst_dir):
+        # each file is written as soon as it is received
+        count = 0
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir)
+
+        while True:
+            entry_type = self.in_stream.readUnsignedByte()
+            name_len = self.in_stream.readInt()
+            if entry_type == FILE_ENTRY_END:
+                return count
+            name = JarrayConvBypass.tostring(
+                self.recvall(name_len)).decode('utf-8')
+            path = file_entry_path(dst_dir, name)
+            if entry_type == FILE_ENTRY_DIR:
+                if not os.path.isdir(path):
+                    os.makedirs(path)
+                continue
+            data_len = self.in_stream.readLong()
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            count += self.recvall_to_file(data_len, path)
+
+    def _send_chunk(self, buff, data_len):
+        if data_len > 0:
+            self.out_stream.writeInt(data_len)
+            self.out_stream.write(buff, 0, data_len)
+
+    def sendall_from_file_compressed(self, filename,
+                                     level=PIPE_COMPRESSION_LEVEL):
+        # zlib stream sent as length prefixed chunks, ended by an empty chunk
+        deflater = Deflater(level)
+        in_buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+        out_buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+
+        try:
+            with java_file_input_ctx(filename) as in_fstream:
+                while True:
+                    n_read = in_fstream.read(in_buff)
+                    if n_read < 0:
+                        break
+                    deflater.setInput(in_buff, 0, n_read)
+                    while not deflater.needsInput():
+                        self._send_chunk(out_buff, deflater.deflate(out_buff))
+            deflater.finish()
+            while not deflater.finished():
+                self._send_chunk(out_buff, deflater.deflate(out_buff))
+        finally:
+            deflater.end()
+
+        self.out_stream.writeInt(0)
+        self.out_stream.flush()
+
+    def recvall_to_file_compressed(self, filename):
+        inflater = Inflater()
+        out_buff = jarray.zeros(PIPE_IO_BUFFER_SIZE, 'b')
+        count = 0
+
+        try:
+            with java_file_output_ctx(filename) as out_fstream:
+                while True:
+                    chunk_len = self.in_stream.readInt()
+                    if not chunk_len:
+                        break
+                    inflater.setInput(self.recvall(chunk_len))
+                    while not inflater.needsInput() and \
+                            not inflater.finished():
+                        n_inflated = inflater.inflate(out_buff)
+                        out_fstream.write(out_buff, 0, n_inflated)
+                        count += n_inflated
+        finally:
+            inflater.end()
+
+        return count
+
+    def sendall_from_file_range(self, filename, offset, data_len, chunk_size):
+        # each chunk is followed by its CRC32, the client resumes an
+        # interrupted transfer from its last verified chunk
+        buff = jarray.zeros(chunk_size, 'b')
+        crc = CRC32()
+        count = 0
+
+        with java_random_access_ctx(filename, 'r') as raf:
+            raf.seek(offset)
+            while count < data_len:
+                chunk_len = min(chunk_size, data_len - count)
+                raf.readFully(buff, 0, chunk_len)
+                crc.reset()
+                crc.update(buff, 0, chunk_len)
+                self.out_stream.write(buff, 0, chunk_len)
+                self.out_stream.write(
+                    jarray_b(struct.pack('!I', crc.getValue())))
+                count += chunk_len
+        self.out_stream.flush()
+
+        return count
+
+    def recvall_to_file_range(self, data_len, filename, offset, chunk_size,
+                              truncate=True):
+        # only the verified chunks are written, with truncate the file ends at
+        # the last verified chunk, its size is the resume offset
+        buff = jarray.zeros(chunk_size, 'b')
+        crc = CRC32()
+        count = 0
+
+        with java_random_access_ctx(filename, 'rw') as raf:
+            if truncate:
+                raf.setLength(offset)
+            raf.seek(offset)
+            while count < data_len:
+                chunk_len = min(chunk_size, data_len - count)
+                self.in_stream.readFully(buff, 0, chunk_len)
+                chunk_crc = self.in_stream.readInt() & 0xffffffff
+                crc.reset()
+                crc.update(buff, 0, chunk_len)
+                if crc.getValue() != chunk_crc:
+                    raise JavaTcpNetIoError('chunk checksum mismatch')
+                raf.write(buff, 0, chunk_len)
+                count += chunk_len
+
+        return count
+
 
+# streams of a blocking socket channel, Unix domain socket channels have no
+# java.net.Socket adaptor, the input is not buffered, the bytes following the
+# raw stream belong to the event loop
+class JavaChannelNetIo(JavaTcpNetIo):
+    def __init__(self, channel):
+        self.sock = channel
+        self.in_stream = DataInputStream(Channels.newInputStream(channel))
+        self.out_stream = DataOutputStream(BufferedOutputStream(
+            Channels.newOutputStream(channel), PIPE_IO_BUFFER_SIZE))
+
+    def sendall_from_file(self, filename):
+        # kernel zero-copy from the file to the socket channel (sendfile)
+        self.out_stream.flush()
+        with java_file_input_ctx(filename) as in_fstream:
+            file_channel = in_fstream.getChannel()
+            data_len = file_channel.size()
+            count = 0
+            while count < data_len:
+                count += file_channel.transferTo(
+                    count, data_len - count, self.sock)
+
+
+# jarray.tostring/fromstring get stuck on large arrays, the bytes are mapped
+# one to one on the chars of a java String (ISO-8859-1), without copy loop in
+# Python code, see tests/benchmark_jarray_conv.py
 class JarrayConvBypass:
-    STUCK_LIMIT = 4096 * 8
+    @staticmethod
+    def tostring(jarray_byte):
+        return PyString(StringUtil.fromBytes(jarray_byte))
 
-    @classmethod
-    def tostring(cls, jarray_byte):
-        if len(jarray_byte) < cls.STUCK_LIMIT:
-            return jarray_byte.tostring()
+    @staticmethod
+    def fromstring(str_bytes):
+        return StringUtil.toBytes(str_bytes)
 
-        with create_temporary_empty_file() as file_path:
-            with java_file_output_ctx(file_path) as out_fstream:
-                out_fstream.write(jarray_byte)
-            with open(file_path, 'rb') as fd:
-                return fd.read()
 
-    @classmethod
-    def fromstring(cls, str_bytes):
-        if len(str_bytes) < cls.STUCK_LIMIT:
-            return jarray_b(str_bytes)
+def is_byte_jarray(data):
+    return isinstance(data, array.array) and data.typecode == 'b'
+
 
-        with create_temporary_empty_file() as tmp_file:
-            with open(tmp_file, 'wb') as f:
-                f.write(str_bytes)
-            with java_file_input_ctx(tmp_file) as in_fstream:
-                buff = jarray.zeros(len(str_bytes), 'b')
-                in_fstream.read(buff)
-                return buff
+def base64_encode(data):
+    # the byte jarrays are encoded without conversion
+    if not is_byte_jarray(data):
+        data = JarrayConvBypass.fromstring(bytes(data))
+    return Base64.getEncoder().encodeToString(data)
+
+
+def base64_decode(text):
+    data = Base64.getDecoder().decode(text)
+    return bytearray(JarrayConvBypass.tostring(data))
 
 
 class JsonComEncoder(json.JSONEncoder):
+    # with an attachments list, the bytearrays and byte jarrays (e.g. read
+    # from the Ghidra memory) are referenced by their offset and length in the
+    # raw segments following the JSON text, else they are base64 encoded
+    def __init__(self, *args, **kwargs):
+        self.attachments = kwargs.pop('attachments', None)
+        self.attachments_len = 0
+        super(JsonComEncoder, self).__init__(*args, **kwargs)
+
     def default(self, data):
-        if type(data) == bytearray:
-            return {'__bytearray__': True,
-                    'data': base64.b64encode(data).decode('utf-8')}
+        if type(data) == bytearray or is_byte_jarray(data):
+            if self.attachments is not None:
+                if not is_byte_jarray(data):
+                    data = JarrayConvBypass.fromstring(bytes(data))
+                ref = {'__bytearray__': True, 'offset': self.attachments_len,
+                       'length': len(data)}
+                self.attachments.append(data)
+                self.attachments_len += len(data)
+                return ref
+            return {'__bytearray__': True, 'data': base64_encode(data)}
         else:
             return super(JsonComEncoder, self).default(data)
 
 
-def json_com_decoder(obj):
+def json_com_decoder(obj, attachments=None):
     if type(obj) == dict and '__bytearray__' in obj:
-        return bytearray(base64.b64decode(obj['data']))
+        if 'data' in obj:
+            return base64_decode(obj['data'])
+        offset = obj['offset']
+        return bytearray(attachments[offset:offset + obj['length']])
     return obj
 
 
-class JavaTcpJsonCom:
+def gson_dumps(data, attachments=None):
+    # the values are converted to java collections serialized by Gson, the
+    # byte jarrays follow the rules of JsonComEncoder
+    encoder = JsonComEncoder(attachments=attachments)
+
+    def to_java(obj):
+        obj_type = type(obj)
+        if obj_type in (unicode, int, long, bool, float) or obj is None:
+            return obj
+        elif isinstance(obj, str):
+            return obj.decode('utf-8')
+        elif isinstance(obj, dict):
+            java_map = LinkedHashMap()
+            for key, value in obj.items():
+                java_map.put(gson_key(key), to_java(value))
+            return java_map
+        elif isinstance(obj, (list, tuple)):
+            java_list = ArrayList(len(obj))
+            for item in obj:
+                java_list.add(to_java(item))
+            return java_list
+        elif isinstance(obj, unicode):  # subclasses
+            return unicode(obj)
+        elif isinstance(obj, (int, long)):
+            return int(obj)
+        elif isinstance(obj, float):
+            return float(obj)
+        return to_java(encoder.default(obj))
+
+    out_stream = ByteArrayOutputStream()
+    writer = OutputStreamWriter(out_stream, StandardCharsets.UTF_8)
+    GSON.toJson(to_java(data), writer)
+    writer.flush()
+    return out_stream.toByteArray()
+
+
+def gson_key(key):
+    # the dict keys converted like json.dumps does
+    if isinstance(key, str):
+        return key.decode('utf-8')
+    elif isinstance(key, unicode):
+        return key
+    elif key is True or key is False or key is None:
+        return {True: 'true', False: 'false', None: 'null'}[key]
+    elif isinstance(key, (int, long, float)):
+        return repr(key) if type(key) is float else str(key)
+    raise TypeError('key {!r} is not a string'.format(key))
+
+
+def gson_loads(body_jarray_b, offset, length, attachments=None):
+    # the JSON tree of Gson converted to Python values, the numbers without
+    # fraction nor exponent are int
+    def to_python(element):
+        if element.isJsonObject():
+            obj = {}
+            for entry in element.entrySet():
+                obj[entry.getKey()] = to_python(entry.getValue())
+            return json_com_decoder(obj, attachments)
+        elif element.isJsonArray():
+            return [to_python(item) for item in element]
+        elif element.isJsonNull():
+            return None
+        elif element.isBoolean():
+            return element.getAsBoolean()
+        elif element.isString():
+            return element.getAsString()
+        number = element.getAsString()
+        try:
+            return int(number)
+        except ValueError:
+            return float(number)
+
+    reader = InputStreamReader(
+        ByteArrayInputStream(body_jarray_b, offset, length),
+        StandardCharsets.UTF_8)
+    return to_python(JsonParser().parse(reader))
+
+
+def msgpack_default(data):
+    if is_byte_jarray(data):
+        return bytearray(JarrayConvBypass.tostring(data))
+    raise TypeError('{!r} is not MessagePack serializable'.format(data))
+
+
+# encoding and decoding of the frames, shared by the blocking connections and
+# the connections of the nio event loop
+class JsonFrameCodec:
+    @staticmethod
+    def decode(body_jarray_b, flags=0, codec='json'):
+        if flags & FRAME_COMPRESSED:
+            body_jarray_b = zlib_inflate(body_jarray_b)
+        if codec == 'msgpack':
+            return msgpack_loads(JarrayConvBypass.tostring(body_jarray_b))
+        offset, json_len, attachments = 0, len(body_jarray_b), None
+        if flags & FRAME_ATTACHMENTS:
+            offset, json_len = 4, ByteBuffer.wrap(body_jarray_b).getInt()
+            attachments = JarrayConvBypass.tostring(Arrays.copyOfRange(
+                body_jarray_b, 4 + json_len, len(body_jarray_b)))
+        if GSON is not None:
+            return gson_loads(body_jarray_b, offset, json_len, attachments)
+        body = JarrayConvBypass.tostring(body_jarray_b)
+        return json.loads(
+            body[offset:offset + json_len],
+            object_hook=lambda obj: json_com_decoder(obj, attachments))
+
+    @staticmethod
+    def encode(data, compression=None, attachments=False, codec='json'):
+        # the bytearrays of a MessagePack frame are bin values, never
+        # attachments
+        segments = None
+        if codec == 'msgpack':
+            json_jarray_b = JarrayConvBypass.fromstring(
+                msgpack_dumps(data, msgpack_default))
+        else:
+            segments = [] if attachments else None
+            if GSON is not None:
+                json_jarray_b = gson_dumps(data, segments)
+            else:
+                json_jarray_b = JarrayConvBypass.fromstring(bytes(json.dumps(
+                    data, cls=JsonComEncoder, attachments=segments)))
+
+        flags, header = 0, ''
+        if segments:
+            flags = FRAME_ATTACHMENTS
+            header = struct.pack('!I', len(json_jarray_b))
+        body_len = len(header) + len(json_jarray_b) + \
+            sum([len(segment) for segment in segments or []])
+        if body_len > FRAME_LENGTH_MASK:
+            raise JavaTcpNetIoError('frame too large')
+        frame = ByteBuffer.allocate(4 + body_len)
+        frame.put(jarray_b(struct.pack('!I', body_len | flags) + header))
+        frame.put(json_jarray_b)
+        for segment in segments or []:
+            frame.put(segment)
+        if compression is None or body_len < compression[0]:
+            return frame.array()
+
+        body = zlib_deflate(frame.array(), compression[1], 4)
+        frame = ByteBuffer.allocate(4 + len(body))
+        frame.put(jarray_b(struct.pack(
+            '!I', len(body) | flags | FRAME_COMPRESSED)))
+        frame.put(body)
+        return frame.array()
+
+
+class JavaTcpJsonCom(JsonFrameCodec):
     def __init__(self, java_tcp_net_io):
         self.io = java_tcp_net_io
+        # requests of a multiplexed connection send their frames concurrently
+        self._send_lock = threading.Lock()
+        # (threshold, level) once the client negotiated the frame compression
+        self.compression = None
+        # the client understands the attachments once negotiated, see
+        # set_attachments, or once it sent one such frame
+        self.attachments = False
+        # 'json' or 'msgpack' once negotiated by the client, see set_codec
+        self.codec = 'json'
+
+    def set_compression(self, threshold, level):
+        self.compression = (threshold, level)
+
+    def set_attachments(self):
+        self.attachments = True
+
+    def set_codec(self, codec, response):
+        # the response is encoded with the previous codec, the codec is
+        # switched before the client sends its next frame
+        frame = self.encode(response, self.compression, self.attachments,
+                            self.codec)
+        self.codec = codec
+        with self._send_lock:
+            return self.io.sendall(frame)
 
     def recv(self):
         json_len = struct.unpack('!I', self.io.recvall(4))[0]
-        json_jarray_b = self.io.recvall(json_len)
-        json_str = JarrayConvBypass.tostring(json_jarray_b)
-        ret = json.loads(json_str, object_hook=json_com_decoder)
-        return ret
+        json_jarray_b = self.io.recvall(json_len & FRAME_LENGTH_MASK)
+        if json_len & FRAME_ATTACHMENTS:
+            self.attachments = True
+        return self.decode(json_jarray_b, json_len & ~FRAME_LENGTH_MASK,
+                           self.codec)
 
     def send(self, data):
-        json_str = bytes(json.dumps(data, cls=JsonComEncoder))
-        json_len = struct.pack('!I', len(json_str))
-        json_jarray_b = JarrayConvBypass.fromstring(json_len + json_str)
-        return self.io.sendall(json_jarray_b)
+        json_jarray_b = self.encode(data, self.compression, self.attachments,
+                                    self.codec)
+        with self._send_lock:
+            return self.io.sendall(json_jarray_b)
 
 
+# sys.stdout/stderr replacement, the writes of each thread are forwarded to
+# the hook registered by this thread, else to the original stream
 class StdOutputPatch:
-    def __init__(self, hook):
-        self.hook = hook
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def set_hook(self, hook):
+        self._local.hook = hook
 
     def write(self, out):
-        self.hook(out)
+        hook = getattr(self._local, 'hook', None)
+        if hook:
+            hook(out)
+        else:
+            self.stream.write(out)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
 
 
 class StdoutStderrRedirectorCtx:
+    _patch_lock = threading.Lock()
+
     def __init__(self, stdout_write_hook=None, stderr_write_hook=None,
                  stdout_stderr_capture=False):
         self.stdout_write_hook = stdout_write_hook
         self.stderr_write_hook = stderr_write_hook
         self.stdout_stderr_capture = stdout_stderr_capture
         self.saved_stderr_stdout = None
-        self.saved_stdout = sys.stdout
-        self.saved_stderr = sys.stderr
+        self.stdout_patch = None
+        self.stderr_patch = None
+
+    @classmethod
+    def patch_stdout_stderr(cls):
+        # sys.stdout/err are shared by all threads, they are patched once and
+        # the redirection is selected per thread
+        with cls._patch_lock:
+            if not isinstance(sys.stdout, StdOutputPatch):
+                sys.stdout = StdOutputPatch(sys.stdout)
+            if not isinstance(sys.stderr, StdOutputPatch):
+                sys.stderr = StdOutputPatch(sys.stderr)
+            return sys.stdout, sys.stderr
+
+    @property
+    def saved_stdout(self):
+        return self.stdout_patch.stream
+
+    @property
+    def saved_stderr(self):
+        return self.stderr_patch.stream
 
     def __enter__(self):
         # required because Jython don't save stdout/err in __stdout/err__
+        self.stdout_patch, self.stderr_patch = self.patch_stdout_stderr()
         if self.stdout_stderr_capture:
             self.saved_stderr_stdout = StringIO()
         if self.stdout_write_hook or self.stdout_stderr_capture:
-            sys.stdout = StdOutputPatch(self.stdout_write)
+            self.stdout_patch.set_hook(self.stdout_write)
         if self.stderr_write_hook or self.stdout_stderr_capture:
-            sys.stderr = StdOutputPatch(self.stderr_write)
+            self.stderr_patch.set_hook(self.stderr_write)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        sys.stdout, sys.stderr = self.saved_stdout, self.saved_stderr
-        self.saved_stdout = self.saved_stderr = self.saved_stderr_stdout = None
+        self.stdout_patch.set_hook(None)
+        self.stderr_patch.set_hook(None)
+        self.saved_stderr_stdout = None
 
     def get_saved_stdout_stderr(self):
         if self.stdout_stderr_capture:
@@ -237,7 +906,36 @@ class StdoutStderrRedirectorCtx:
             self.stderr_write_hook(str_out, self.saved_stderr)
 
 
-class PythonCodeExecutor:
+# the code objects compiled from the remote code, shared by all the threads,
+# the last PIPE_CODE_CACHE_SIZE sources compiled are kept
+class CodeCache:
+    def __init__(self, size):
+        self.size = size
+        self.codes = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def compile(self, source, mode='exec'):
+        key = (mode, source)
+        with self.lock:
+            code = self.codes.pop(key, None)
+            if code is not None:
+                self.codes[key] = code
+                return code
+
+        code = compile(source, '<string>', mode)
+        with self.lock:
+            self.codes[key] = code
+            while len(self.codes) > self.size:
+                self.codes.popitem(last=False)
+        return code
+
+
+CODE_CACHE = CodeCache(PIPE_CODE_CACHE_SIZE)
+
+
+# the executor state (stdout/err hooks, last error) is kept per thread, one
+# instance can be shared by concurrent RPC requests
+class PythonCodeExecutor(threading.local):
     def __init__(self):
         self.stdout_write_hook = None
         self.stderr_write_hook = None
@@ -258,7 +956,7 @@ class PythonCodeExecutor:
                 self.stderr_write_hook,
                 stdouterr_capture) as std:
             try:
-                exec("""exec py_code in globals()""")
+                exec(CODE_CACHE.compile(py_code), globals())
                 stacktrace = None
             except:
                 stacktrace = traceback.format_exc()
@@ -269,69 +967,609 @@ class PythonCodeExecutor:
         return output, stacktrace
 
     def func_exec_wrap(self, func_name, args, kwargs):
-        arg_names = []
-        for i, a in enumerate(args):
-            name = '__arg_{}__'.format(i)
-            globals()[name] = a
-            arg_names.append(name)
+        # the function is looked up with its cached compiled name, at each call
+        # to see the rebound names, and is called directly
+        code = '{}(*args, **kwargs)'.format(func_name)
+        with StdoutStderrRedirectorCtx(self.stdout_write_hook,
+                                       self.stderr_write_hook) as std:
+            try:
+                func = eval(CODE_CACHE.compile(func_name, 'eval'), globals())
+                ret = func(*args, **dict((str(k), v)
+                                         for k, v in kwargs.items()))
+                stacktrace = None
+            except:
+                ret = None
+                stacktrace = traceback.format_exc()
+            out = std.get_saved_stdout_stderr()
 
-        kwarg_names = []
-        for i, k in enumerate(kwargs):
-            name = '__kwarg_{}__'.format(i)
-            globals()[name] = kwargs[k]
-            kwarg_names.append(name)
+        self.last_exc_code = code
+        self.last_stacktrace = stacktrace
+        return ret, out, stacktrace
+
+    def iter_batch(self, iterator, count, code):
+        # next items of a streamed iterator, the remote code of the iterator
+        # runs with the std hooks of the request
+        items, done = [], False
+        with StdoutStderrRedirectorCtx(self.stdout_write_hook,
+                                       self.stderr_write_hook):
+            try:
+                for _ in range(count):
+                    items.append(next(iterator))
+                stacktrace = None
+            except StopIteration:
+                done, stacktrace = True, None
+            except:
+                stacktrace = traceback.format_exc()
 
-        code = '__ret__={}({}{}{})'.format(
-            func_name, ','.join(arg_names),
-            ',' if len(args) > 0 and len(kwargs) > 0 else '',
-            ','.join('{}={}'.format(
-                k, kwarg_names[i]) for i, k in enumerate(kwargs)))
+        self.last_exc_code = code
+        self.last_stacktrace = stacktrace
+        return items, done, stacktrace
+
+
+def java_iterator_items(java_iterator):
+    while java_iterator.hasNext():
+        yield java_iterator.next()
+
+
+def to_iterator(obj):
+    if isinstance(obj, JavaIterator):
+        return java_iterator_items(obj)
+    return iter(obj)
+
+
+# iterator of a streamed func_exec/iter_exec result, the client pulls its
+# items by batches, one batch at a time
+class StreamedIterator:
+    def __init__(self, iterator, code):
+        self.iterator = iterator
+        self.code = code
+        self.lock = threading.Lock()
+        self.last_used = time.time()
+
+    def close(self):
+        if hasattr(self.iterator, 'close'):
+            self.iterator.close()
+
+
+# large sequence or mapping result kept by the server, the client reads it by
+# pages, the keys of a mapping are listed on the first page read
+class PagedHandle:
+    def __init__(self, value):
+        self.value = value
+        self.keys = None
+        self.last_used = time.time()
+
+    def page(self, start, stop):
+        value = self.value
+        if isinstance(value, (list, tuple)):
+            return list(value[start:stop])
+        elif isinstance(value, JavaList):
+            stop = min(stop, value.size())
+            return list(value.subList(min(start, stop), stop))
+
+        if self.keys is None:
+            self.keys = list(value.keys() if isinstance(value, dict)
+                             else value.keySet())
+        return [[key, value.get(key)] for key in self.keys[start:stop]]
+
+    def get(self, key):
+        value = self.value
+        if isinstance(value, dict):
+            return key in value, value.get(key)
+        return value.containsKey(key), value.get(key)
+
+
+class RpcWorkerError(Exception):
+    pass
+
+
+# bounded pool of threads processing the RPC requests read by the connection
+# threads, idle keep-alive connections only hold their connection thread
+class RpcWorkerPool:
+    def __init__(self, workers=PIPE_WORKERS, queue_limit=PIPE_QUEUE_LIMIT,
+                 name=''):
+        self._jobs = Queue.Queue(queue_limit)
+        self._threads = []
+
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._worker, name='{} worker {}'.format(name, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            func, args = job
+            try:
+                func(*args)
+            except:
+                print(traceback.format_exc())
 
-        globals()['__ret__'] = None
-        out, trace = self.py_code_exec(code)
-        ret = globals()['__ret__']
+    def execute(self, func, *args):
+        # blocks the calling connection thread until a worker processed the
+        # job, or while the job queue is full
+        done, status = self.submit(func, *args)
+        done.wait()
+        if status:
+            raise RpcWorkerError(status[0])
 
-        for var_name in arg_names + kwarg_names + ['__ret__']:
-            globals().pop(var_name)
+    def submit(self, func, *args):
+        # blocks only while the job queue is full, the returned event is set
+        # when the job is processed, status holds its traceback on error
+        done, status = threading.Event(), []
 
-        return ret, out, trace
+        def job():
+            try:
+                func(*args)
+            except:
+                status.append(traceback.format_exc())
+            finally:
+                done.set()
+
+        self._jobs.put((job, ()))
+        return done, status
+
+    def try_submit(self, func, *args):
+        try:
+            self._jobs.put_nowait((func, args))
+        except Queue.Full:
+            return False
+        return True
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._jobs.put(None)
+
+
+class NioConnection:
+    def __init__(self, channel):
+        self.channel = channel
+        self.key = None
+        self.header = ByteBuffer.allocate(4)
+        self.body = None
+        self.body_flags = 0
+        # frame compression negotiated by the client, see JavaTcpJsonCom
+        self.compression = None
+        self.attachments = False
+        self.codec = 'json'
+        # frames encoded by the workers, written by the event loop thread
+        self.out_buffers = Queue.Queue()
+        self.out_current = None
+        self.busy = False
+        self.closing = False
+        self.last_activity = time.time()
+        # requests of the connection processed by the workers
+        self.in_flight = 0
+        self.in_flight_cond = threading.Condition()
+
+    def read_frame(self):
+        # never read past the current frame, the following bytes may belong
+        # to a raw stream processed in blocking mode (file transfer...)
+        if self.body is None:
+            if self.channel.read(self.header) < 0:
+                raise JavaTcpNetIoError('socket connection broken')
+            if self.header.hasRemaining():
+                return None
+            self.header.flip()
+            json_len = self.header.getInt()
+            self.header.clear()
+            # the frame flags are the high bits of the java int
+            self.body_flags = json_len & ~FRAME_LENGTH_MASK
+            if self.body_flags & FRAME_ATTACHMENTS:
+                self.attachments = True
+            self.body = ByteBuffer.allocate(json_len & FRAME_LENGTH_MASK)
+
+        if self.body.hasRemaining() and self.channel.read(self.body) < 0:
+            raise JavaTcpNetIoError('socket connection broken')
+        if self.body.hasRemaining():
+            return None
+
+        json_jarray_b = self.body.array()
+        self.body = None
+        return json_jarray_b, self.body_flags
+
+    def has_pending_write(self):
+        return self.out_current is not None or not self.out_buffers.empty()
+
+    def write_pending(self):
+        while True:
+            if self.out_current is None:
+                try:
+                    self.out_current = self.out_buffers.get_nowait()
+                except Queue.Empty:
+                    return True
+            self.channel.write(self.out_current)
+            if self.out_current.hasRemaining():
+                return False
+            self.out_current = None
+
+    def flush_blocking(self):
+        # the channel must be in blocking mode
+        while not self.write_pending():
+            pass
+
+    def update_interest(self):
+        if self.key is None or not self.key.isValid():
+            return
+        ops = 0
+        if not self.busy:
+            ops |= SelectionKey.OP_READ
+        if self.has_pending_write():
+            ops |= SelectionKey.OP_WRITE
+        self.key.interestOps(ops)
+
+    def close(self):
+        if self.key is not None:
+            self.key.cancel()
+        self.channel.close()
+
+
+# send side of a connection of the nio event loop, the frames are read by the
+# event loop, the settings of the connection are kept by NioConnection
+class NioJsonCom(JsonFrameCodec):
+    def __init__(self, event_loop, connection):
+        self.io = None
+        self.event_loop = event_loop
+        self.connection = connection
+
+    def set_compression(self, threshold, level):
+        self.connection.compression = (threshold, level)
+
+    def set_attachments(self):
+        self.connection.attachments = True
+
+    def set_codec(self, codec, response):
+        # the next frames are decoded by the workers with the codec of the
+        # connection, see JavaTcpJsonCom.set_codec
+        json_jarray_b = self.encode(response, self.connection.compression,
+                                    self.connection.attachments,
+                                    self.connection.codec)
+        self.connection.codec = codec
+        return self._send_frame(json_jarray_b)
+
+    def send(self, data):
+        return self._send_frame(self.encode(
+            data, self.connection.compression, self.connection.attachments,
+            self.connection.codec))
+
+    def _send_frame(self, json_jarray_b):
+        self.connection.out_buffers.put(ByteBuffer.wrap(json_jarray_b))
+        self.event_loop.notify(self.connection, 'write')
+        return len(json_jarray_b)
+
+
+class NioEventLoop:
+    # Single thread java.nio event loop reading and writing the frames of all
+    # the client connections without blocking. Complete requests are processed
+    # by the worker pool. Notifications working on the raw socket stream are
+    # processed in blocking mode, the connection is detached from the selector
+    # during their processing.
+
+    def __init__(self, server_channel, json_rpc_server, rpc_worker_pool,
+                 keep_alive_timeout=PIPE_KEEP_ALIVE_TIMEOUT):
+        self.server_channel = server_channel
+        self.json_rpc_server = json_rpc_server
+        self.rpc_worker_pool = rpc_worker_pool
+        self.keep_alive_timeout = keep_alive_timeout
+        self.selector = Selector.open()
+        self.is_running = False
+        self._events = Queue.Queue()
+        self._connections = set()
+        self._pending_requests = []
+
+    def notify(self, connection, event, *args):
+        self._events.put((connection, event, args))
+        self.selector.wakeup()
+
+    def stop(self):
+        self.is_running = False
+        self.selector.wakeup()
+
+    def run(self):
+        self.server_channel.configureBlocking(False)
+        self.server_channel.register(self.selector, SelectionKey.OP_ACCEPT)
+        self.is_running = True
+
+        while self.is_running:
+            self.selector.select(1000)
+            self._process_events()
+            selected_keys = self.selector.selectedKeys()
+            for key in list(selected_keys):
+                self._process_key(key)
+            selected_keys.clear()
+            self._submit_pending_requests()
+            self._close_idle_connections()
+
+        self._close_all()
+
+    def _process_key(self, key):
+        if not key.isValid():
+            return
+        if key.isAcceptable():
+            self._accept()
+            return
+
+        connection = key.attachment()
+        try:
+            if key.isReadable():
+                self._read(connection)
+            if key.isValid() and key.isWritable():
+                self._write(connection)
+        except (JavaTcpNetIoError, IOException):
+            self._close(connection)
+
+    def _accept(self):
+        channel = self.server_channel.accept()
+        if channel is None:
+            return
+        channel.configureBlocking(False)
+        if isinstance(channel.getLocalAddress(), InetSocketAddress):
+            channel.socket().setTcpNoDelay(True)
+        set_socket_buffer_size(channel)
+        connection = NioConnection(channel)
+        connection.key = channel.register(
+            self.selector, SelectionKey.OP_READ, connection)
+        self._connections.add(connection)
+
+    def _read(self, connection):
+        frame = connection.read_frame()
+        connection.last_activity = time.time()
+        if frame is not None:
+            # stop reading until the worker knows the frame type, the next
+            # frame may be followed by a raw stream (notification)
+            connection.busy = True
+            connection.update_interest()
+            with connection.in_flight_cond:
+                connection.in_flight += 1
+            self._pending_requests.append((connection, frame))
+
+    def _write(self, connection):
+        if connection.write_pending():
+            connection.last_activity = time.time()
+            if connection.closing:
+                self._close(connection)
+                return
+        connection.update_interest()
+
+    def _submit_pending_requests(self):
+        while self._pending_requests:
+            connection, frame = self._pending_requests[0]
+            if not self.rpc_worker_pool.try_submit(
+                    self._process_request, connection, frame):
+                return  # job queue full, retried on next loop
+            self._pending_requests.pop(0)
+
+    def _close_idle_connections(self):
+        now = time.time()
+        for connection in list(self._connections):
+            if (not connection.busy and not connection.in_flight
+                    and not connection.has_pending_write()
+                    and now - connection.last_activity
+                    > self.keep_alive_timeout):
+                self._close(connection)
+
+    def _close(self, connection):
+        self._connections.discard(connection)
+        connection.close()
+
+    def _close_all(self):
+        self.selector.close()
+        for connection in list(self._connections):
+            try:
+                connection.channel.configureBlocking(True)
+                connection.flush_blocking()
+            except:
+                pass
+            self._close(connection)
+
+    def _process_events(self):
+        while True:
+            try:
+                connection, event, args = self._events.get_nowait()
+            except Queue.Empty:
+                return
+
+            if event == 'write':
+                connection.update_interest()
+            elif event == 'resume':
+                connection.busy = False
+                connection.last_activity = time.time()
+                connection.update_interest()
+            elif event == 'close':
+                if connection.key is not None and \
+                        connection.has_pending_write():
+                    connection.closing = True
+                    connection.update_interest()
+                else:
+                    self._close(connection)
+            elif event == 'detach':
+                connection.key.cancel()
+                connection.key = None
+                self.selector.selectNow()  # deregister the canceled key
+                args[0].set()
+            elif event == 'attach':
+                connection.key = connection.channel.register(
+                    self.selector, SelectionKey.OP_READ, connection)
+                connection.busy = False
+                connection.last_activity = time.time()
+                connection.update_interest()
+
+    def _process_request(self, connection, frame):
+        # called by a worker thread
+        event = 'close'
+        try:
+            json_com = NioJsonCom(self, connection)
+            data = json_com.decode(frame[0], frame[1], connection.codec)
+            close = JsonRpcServer.is_connection_close(data)
+            if JsonRpcServer.is_request(data) and not close:
+                # the requests pipelined by a multiplexed client are
+                # processed in parallel, resume reading the connection
+                event = None
+                self.notify(connection, 'resume')
+                self.json_rpc_server.dispatch(json_com, data)
+            else:
+                self._wait_other_requests(connection)
+                if JsonRpcServer.is_request(data):
+                    self.json_rpc_server.dispatch(json_com, data)
+                else:
+                    self._process_blocking_notification(connection, data)
+                    if not close:
+                        connection.channel.configureBlocking(False)
+                        event = 'attach'
+        except:
+            print(traceback.format_exc())
+        finally:
+            self._request_done(connection)
+        if event:
+            self.notify(connection, event)
+
+    @staticmethod
+    def _wait_other_requests(connection):
+        with connection.in_flight_cond:
+            while connection.in_flight > 1:
+                connection.in_flight_cond.wait()
+
+    @staticmethod
+    def _request_done(connection):
+        with connection.in_flight_cond:
+            connection.in_flight -= 1
+            connection.in_flight_cond.notifyAll()
+
+    def _process_blocking_notification(self, connection, data):
+        detached = threading.Event()
+        self.notify(connection, 'detach', detached)
+        # the detach event is never processed once the event loop stopped
+        while not detached.wait(1):
+            if not self.is_running:
+                raise JavaTcpNetIoError('event loop stopped')
+        connection.channel.configureBlocking(True)
+        connection.flush_blocking()
+        json_com = JavaTcpJsonCom(JavaChannelNetIo(connection.channel))
+        # e.g. the frames of a custom communicator
+        json_com.attachments = connection.attachments
+        json_com.codec = connection.codec
+        self.json_rpc_server.dispatch(json_com, data)
+
+
+# collects the responses of the requests of a batch, the live frames are
+# forwarded to the client without delay
+class BatchJsonCom:
+    def __init__(self, json_com):
+        self.json_com = json_com
+        self.io = json_com.io
+        self.responses = []
+
+    def set_compression(self, threshold, level):
+        self.json_com.set_compression(threshold, level)
+
+    def set_attachments(self):
+        self.json_com.set_attachments()
+
+    def set_codec(self, codec, response):
+        # the responses of the batch are sent together, after the switch
+        raise ValueError('set_codec is not allowed in a batch')
+
+    def send(self, data):
+        if 'id' in data:
+            self.responses.append(data)
+        else:
+            return self.json_com.send(data)
 
 
 class JsonRpcServer:
     FILE_TRANSFER_FILE_FOUND = b'\x00'
     FILE_TRANSFER_FILE_NOT_FOUND = b'\xff'
-
-    def __init__(self, ip, port, shutdown_callback):
+    # the socket is not given back to the keep-alive loop after these methods
+    CONNECTION_CLOSE_METHODS = ['remote_shutdown', 'execute_custom_communicator']
+    FILE_TRANSFER_METHODS = ['file_transfer_to_client', 'file_transfer_to_server',
+                             'files_transfer_to_client',
+                             'files_transfer_to_server']
+    # hashlib names of the digests computed by get_file_hash
+    HASH_ALGORITHMS = {'md5': 'MD5', 'sha1': 'SHA-1', 'sha256': 'SHA-256'}
+    # frame codecs accepted by set_codec
+    CODECS = ['json', 'msgpack']
+
+    def __init__(self, ip, port, shutdown_callback,
+                 keep_alive_timeout=PIPE_KEEP_ALIVE_TIMEOUT,
+                 rpc_worker_pool=None):
         self.ip = ip
         self.port = port
+        self.keep_alive_timeout = keep_alive_timeout
+        # connections are served by their own thread, the RPC methods are
+        # processed by the worker pool in concurrent mode, else one at a time
+        self._rpc_worker_pool = rpc_worker_pool
+        self._dispatch_lock = threading.Lock()
         self._executor = PythonCodeExecutor()
         self.shutdown_callback = shutdown_callback
         self._custom_communicators = {}
+        # the iterators streamed to the clients, dropped once exhausted,
+        # closed or idle for PIPE_ITER_TIMEOUT seconds
+        self._iterators = {}
+        self._iterators_lock = threading.Lock()
+        # the paged results, kept until released by the clients or idle for
+        # PIPE_ITER_TIMEOUT seconds
+        self._handles = {}
+        self._handles_lock = threading.Lock()
+        # the hash of the source and the object of the names registered with
+        # register_code, a name is registered again once rebound
+        self._registry = {}
+        self._registry_lock = threading.Lock()
+        # the sys.path entry of the packages registered, by package name, the
+        # packages are extracted in the store one at a time
+        self._packages = {}
+        self._package_store_lock = threading.Lock()
         self.rpc_methods = [
             self.code_exec, self.func_exec, self.object_proxy_new,
             self.object_proxy_getattr, self.object_proxy_setattr,
             self.register_custom_communicator, self.get_server_banner,
-            self.remote_shutdown]
+            self.remote_shutdown, self.set_compression, self.set_attachments,
+            self.set_codec, self.get_file_size, self.get_file_hash,
+            self.file_dedup_to_server, self.iter_exec, self.iter_next,
+            self.iter_close, self.handle_page, self.handle_getitem,
+            self.handle_release, self.register_code, self.register_codes,
+            self.register_package]
         self.rpc_notifications = [
             self.execute_custom_communicator, self.file_transfer_to_client,
-            self.file_transfer_to_server]
+            self.file_transfer_to_server, self.files_transfer_to_client,
+            self.files_transfer_to_server]
 
     @staticmethod
-    def stdout_stderr_hooks(json_com, std_client_forward):
+    def stdout_stderr_hooks(json_com, std_client_forward, uid=None):
+        # live frames carry the id of their request, the client routes them to
+        # the right caller on a multiplexed connection
         def _stdout_write_hook(out, stdout):
             if std_client_forward:
-                json_com.send({'live_stdout': out})
+                json_com.send({'live_stdout': out, 'request_id': uid})
             else:
                 stdout.write(out)
 
         def _stderr_write_hook(err, stderr):
             if std_client_forward:
-                json_com.send({'live_stderr': err})
+                json_com.send({'live_stderr': err, 'request_id': uid})
             else:
                 stderr.write(err)
 
         return _stdout_write_hook, _stderr_write_hook
 
+    @staticmethod
+    def is_request(data):
+        # a batch is answered like a request, it never uses the raw stream
+        return type(data) == list or 'id' in data
+
+    @classmethod
+    def is_connection_close(cls, data):
+        return type(data) == dict and \
+            data['method'] in cls.CONNECTION_CLOSE_METHODS
+
+    @classmethod
+    def is_file_transfer(cls, data):
+        return type(data) == dict and \
+            data['method'] in cls.FILE_TRANSFER_METHODS
+
     def _response_error(self, uid, code,  message, data=None):
         response = {'jsonrpc': '2.0', 'id': uid,
                     'error': {'code': code, 'message': message,
@@ -349,13 +1587,69 @@ class JsonRpcServer:
 
     def dispatcher(self, tcp_net_io):
         json_com = JavaTcpJsonCom(tcp_net_io)
-        data = json_com.recv()
+        # in concurrent mode, the RPC requests pipelined on the connection are
+        # processed in parallel, their responses are sent in completion order
+        pending = []
+
+        try:
+            while True:
+                tcp_net_io.set_timeout(self.keep_alive_timeout)
+                try:
+                    data = json_com.recv()
+                except SocketTimeoutException:
+                    if [done for done, _ in pending if not done.is_set()]:
+                        continue
+                    return  # idle keep-alive connection expired
+                except JavaTcpNetIoError:
+                    return  # client gone
+                tcp_net_io.set_timeout(0)
+                pending = [job for job in pending if not job[0].is_set()]
+
+                if self._rpc_worker_pool and self.is_request(data) and \
+                        not self.is_connection_close(data):
+                    pending.append(self._rpc_worker_pool.submit(
+                        self.dispatch, json_com, data))
+                    continue
+
+                # notifications use the raw stream of the connection after
+                # their frame, the pipelined requests are completed first
+                self._wait_pending(pending)
+                pending = []
+                if self._rpc_worker_pool:
+                    self._rpc_worker_pool.execute(self.dispatch, json_com, data)
+                elif self.is_file_transfer(data):
+                    # no shared state, the streams of a parallel file
+                    # transfer are served at the same time
+                    self.dispatch(json_com, data)
+                else:
+                    with self._dispatch_lock:
+                        self.dispatch(json_com, data)
+
+                if self.is_connection_close(data):
+                    return
+        finally:
+            self._wait_pending(pending)
 
-        if 'id' in data:  # RPC request
+    @staticmethod
+    def _wait_pending(pending):
+        for done, status in pending:
+            done.wait()
+            if status:
+                print(status[0])
+
+    def dispatch(self, json_com, data):
+        if type(data) == list:  # RPC batch
+            self.dispatch_batch(json_com, data)
+        elif 'id' in data:  # RPC request
             try:
                 for method in self.rpc_methods:
                     if method.__name__ == data['method']:
                         method(json_com, data['id'], data['params'])
+                        break
+                else:
+                    # e.g. a method of a newer client, the client falls back
+                    json_com.send(self._response_error(
+                        data['id'], -32601, 'Method not found'))
             except Exception as ex:
                 dat = {'stacktrace': traceback.format_exc()}
                 json_com.send(self._response_error(data['id'], -32603, '', dat))
@@ -365,12 +1659,98 @@ class JsonRpcServer:
                 if method.__name__ == data['method']:
                     method(json_com, data['params'])
 
+    def dispatch_batch(self, json_com, batch):
+        if not batch:
+            json_com.send(self._response_error(None, -32600, 'Invalid Request'))
+            return
+
+        batch_json_com = BatchJsonCom(json_com)
+        for data in batch:
+            if type(data) != dict or 'id' not in data:
+                # notifications work on the raw stream, not allowed in a batch
+                batch_json_com.send(
+                    self._response_error(None, -32600, 'Invalid Request'))
+                continue
+            try:
+                self.dispatch(batch_json_com, data)
+            except Exception:
+                print(traceback.format_exc())
+        json_com.send(batch_json_com.responses)
+
     def get_server_banner(self, json_com, uid, args):
         json_com.send(self._response(uid, {'banner': 'PipeServer JSON RPC v2'}))
 
+    def set_compression(self, json_com, uid, args):
+        # the response is sent before the compression of the connection frames
+        # is enabled
+        if args['algorithm'] != 'zlib':
+            json_com.send(self._response(uid, {'algorithm': None}))
+            return
+        json_com.send(self._response(uid, {'algorithm': 'zlib'}))
+        json_com.set_compression(args['threshold'], args['level'])
+
+    def set_attachments(self, json_com, uid, args):
+        # the response is sent before the attachments of the connection frames
+        # are enabled
+        json_com.send(self._response(uid, {'attachments': True}))
+        json_com.set_attachments()
+
+    def set_codec(self, json_com, uid, args):
+        # the first codec of the client preference list known by the server
+        codec = 'json'
+        for name in args['codecs']:
+            if name in self.CODECS:
+                codec = name
+                break
+        json_com.set_codec(codec, self._response(uid, {'codec': codec}))
+
+    def get_file_size(self, json_com, uid, args):
+        size = None
+        if os.path.isfile(args['file']):
+            size = os.path.getsize(args['file'])
+        json_com.send(self._response(uid, {'size': size}))
+
+    def get_file_hash(self, json_com, uid, args):
+        file_hash = None
+        if os.path.isfile(args['file']):
+            file_hash = java_file_digest(
+                args['file'], self.HASH_ALGORITHMS[args['algorithm']])
+        json_com.send(self._response(uid, {'hash': file_hash}))
+
+    def file_dedup_to_server(self, json_com, uid, args):
+        # the upload is skipped if its content is already in the store, the
+        # stored file is copied, never linked, it can not be modified through
+        # the destination file
+        stored = dedup_store_find(args['sha256'])
+        if stored is not None:
+            Files.copy(File(stored).toPath(), File(args['dst_file']).toPath(),
+                       StandardCopyOption.REPLACE_EXISTING)
+        json_com.send(self._response(uid, {'found': stored is not None}))
+
+    @staticmethod
+    def dedup_store_add(filename, sha256):
+        # only a file matching its hash is stored, the copy is renamed once
+        # complete, over an altered stored file
+        if dedup_store_find(sha256) is not None or \
+                java_file_digest(filename, 'SHA-256') != sha256:
+            return
+        stored = dedup_store_path(sha256)
+        if not os.path.isdir(os.path.dirname(stored)):
+            os.makedirs(os.path.dirname(stored))
+        fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(stored))
+        os.close(fd)
+        try:
+            Files.copy(File(filename).toPath(), File(tmp_file).toPath(),
+                       StandardCopyOption.REPLACE_EXISTING)
+            Files.move(File(tmp_file).toPath(), File(stored).toPath(),
+                       StandardCopyOption.ATOMIC_MOVE)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
     def code_exec(self, json_com, uid, args):
         self._executor.register_stdout_stderr_write_hook(
-            *self.stdout_stderr_hooks(json_com, args['std_forward']))
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
         out, trace = self._executor.py_code_exec(args['code'], args['std_cap'])
 
         if trace:
@@ -381,19 +1761,178 @@ class JsonRpcServer:
 
     def func_exec(self, json_com, uid, args):
         self._executor.register_stdout_stderr_write_hook(
-            *self.stdout_stderr_hooks(json_com, args['std_forward']))
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
         ret, _, trace = self._executor.func_exec_wrap(
             args['name'], args['args'], args['kwargs'])
 
         if trace:
             data = self._executor.get_last_err()
             json_com.send(self._response_error(uid, -32000, '', data))
+        elif 'stream' in args and \
+                isinstance(ret, (types.GeneratorType, JavaIterator)):
+            # the client understands the streamed results
+            self._iterator_send(json_com, uid, to_iterator(ret),
+                                args['stream'])
         else:
-            json_com.send(self._response(uid, {'return': ret}))
+            handle = self._handle_new(ret, args.get('handle'))
+            if handle is not None:
+                json_com.send(self._response(uid, {'handle': handle}))
+            else:
+                json_com.send(self._response(uid, {'return': ret}))
+
+    def iter_exec(self, json_com, uid, args):
+        self._executor.register_stdout_stderr_write_hook(
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
+        ret, _, trace = self._executor.func_exec_wrap(
+            args['name'], args['args'], args['kwargs'])
+
+        if not trace:
+            try:
+                iterator = to_iterator(ret)
+            except TypeError:
+                trace = self._executor.last_stacktrace = \
+                    traceback.format_exc()
+        if trace:
+            data = self._executor.get_last_err()
+            json_com.send(self._response_error(uid, -32000, '', data))
+        else:
+            self._iterator_send(json_com, uid, iterator,
+                                args.get('batch_size', PIPE_ITER_BATCH_SIZE))
+
+    def _iterator_send(self, json_com, uid, iterator, batch_size):
+        # the first batch is sent with the id of the iterator
+        code = self._executor.last_exc_code
+        items, done, trace = self._executor.iter_batch(
+            iterator, batch_size, code)
+        if trace:
+            data = self._executor.get_last_err()
+            json_com.send(self._response_error(uid, -32000, '', data))
+            return
+
+        iterator_id = 'iterator_' + binascii.b2a_hex(os.urandom(8))
+        if not done:
+            with self._iterators_lock:
+                self._expire_iterators()
+                self._iterators[iterator_id] = StreamedIterator(iterator, code)
+        json_com.send(self._response(uid, {'iterator': {
+            'id': iterator_id, 'items': items, 'done': done}}))
+
+    def _expire_iterators(self):
+        # the iterators lock is held
+        now = time.time()
+        for iterator_id, streamed in list(self._iterators.items()):
+            if now - streamed.last_used > PIPE_ITER_TIMEOUT and \
+                    not streamed.lock.locked():
+                del self._iterators[iterator_id]
+                try:
+                    streamed.close()
+                except:
+                    print(traceback.format_exc())
+
+    def _iterator_unknown(self, json_com, uid, iterator_id):
+        data = {'stacktrace': 'Unknown iterator {}, exhausted, closed or '
+                              'expired.'.format(iterator_id)}
+        json_com.send(self._response_error(uid, -32603, '', data))
+
+    def iter_next(self, json_com, uid, args):
+        with self._iterators_lock:
+            self._expire_iterators()
+            streamed = self._iterators.get(args['iterator'])
+        if streamed is None:
+            self._iterator_unknown(json_com, uid, args['iterator'])
+            return
+
+        self._executor.register_stdout_stderr_write_hook(
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
+        with streamed.lock:
+            items, done, trace = self._executor.iter_batch(
+                streamed.iterator, args.get('count', PIPE_ITER_BATCH_SIZE),
+                streamed.code)
+            streamed.last_used = time.time()
+        if done or trace:
+            with self._iterators_lock:
+                self._iterators.pop(args['iterator'], None)
+
+        if trace:
+            data = self._executor.get_last_err()
+            json_com.send(self._response_error(uid, -32000, '', data))
+        else:
+            json_com.send(self._response(uid, {'items': items, 'done': done}))
+
+    def iter_close(self, json_com, uid, args):
+        with self._iterators_lock:
+            self._expire_iterators()
+            streamed = self._iterators.pop(args['iterator'], None)
+        if streamed is not None:
+            with streamed.lock:
+                streamed.close()
+        json_com.send(self._response(uid))
+
+    def _handle_new(self, value, threshold):
+        # a sequence or mapping of at least threshold items is returned as a
+        # handle, read by pages with handle_page
+        if threshold is None:
+            return None
+        elif isinstance(value, (list, tuple, JavaList)):
+            handle_type = 'sequence'
+        elif isinstance(value, (dict, JavaMap)):
+            handle_type = 'mapping'
+        else:
+            return None
+
+        length = len(value)
+        if length < threshold:
+            return None
+
+        handle_id = 'handle_' + binascii.b2a_hex(os.urandom(8))
+        with self._handles_lock:
+            self._expire_handles()
+            self._handles[handle_id] = PagedHandle(value)
+        return {'id': handle_id, 'type': handle_type, 'length': length}
+
+    def _expire_handles(self):
+        # the handles lock is held, the handles of the clients gone are
+        # never released
+        now = time.time()
+        for handle_id, handle in list(self._handles.items()):
+            if now - handle.last_used > PIPE_ITER_TIMEOUT:
+                del self._handles[handle_id]
+
+    def _handle_get(self, json_com, uid, handle_id):
+        with self._handles_lock:
+            self._expire_handles()
+            handle = self._handles.get(handle_id)
+            if handle is not None:
+                handle.last_used = time.time()
+        if handle is None:
+            data = {'stacktrace': 'Unknown handle {}, released or '
+                                  'expired.'.format(handle_id)}
+            json_com.send(self._response_error(uid, -32603, '', data))
+        return handle
+
+    def handle_page(self, json_com, uid, args):
+        handle = self._handle_get(json_com, uid, args['handle'])
+        if handle is not None:
+            items = handle.page(args['start'], args['stop'])
+            json_com.send(self._response(uid, {'items': items}))
+
+    def handle_getitem(self, json_com, uid, args):
+        handle = self._handle_get(json_com, uid, args['handle'])
+        if handle is not None:
+            found, value = handle.get(args['key'])
+            json_com.send(self._response(uid, {'found': found,
+                                               'value': value}))
+
+    def handle_release(self, json_com, uid, args):
+        with self._handles_lock:
+            self._expire_handles()
+            for handle_id in args['handles']:
+                self._handles.pop(handle_id, None)
+        json_com.send(self._response(uid))
 
     def object_proxy_new(self, json_com, uid, args):
         self._executor.register_stdout_stderr_write_hook(
-            *self.stdout_stderr_hooks(json_com, args['std_forward']))
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
         ret, _, trace = self._executor.func_exec_wrap(
             args['class_name'], args['args'], args['kwargs'])
 
@@ -411,7 +1950,11 @@ class JsonRpcServer:
         if value_type in ['instancemethod', 'function']:
             value = str(value)
 
-        msg = self._response(uid, {'type': value_type, 'value': value})
+        handle = self._handle_new(value, args.get('handle'))
+        if handle is not None:
+            msg = self._response(uid, {'type': value_type, 'handle': handle})
+        else:
+            msg = self._response(uid, {'type': value_type, 'value': value})
         json_com.send(msg)
 
     def object_proxy_setattr(self, json_com, uid, args):
@@ -419,8 +1962,9 @@ class JsonRpcServer:
         json_com.send(self._response(uid))
 
     def remote_shutdown(self, json_com, uid, args):
-        self.shutdown_callback()
+        # respond first, the server thread may exit as soon as it is stopped
         json_com.send(self._response(uid))
+        self.shutdown_callback()
 
     def register_custom_communicator(self, json_com, uid, args):
         _, trace = self._executor.py_code_exec(args['code'])
@@ -434,6 +1978,93 @@ class JsonRpcServer:
                 {args['communicator_name']: comm_func})
             json_com.send(self._response(uid))
 
+    def _registered(self, name, code_hash, communicator):
+        with self._registry_lock:
+            registered_hash, registered = self._registry.get(
+                name, (None, None))
+        if communicator:
+            current = self._custom_communicators.get(name)
+        else:
+            current = globals().get(name)
+        return registered_hash == code_hash and registered is current and \
+            current is not None
+
+    def _register(self, name, code_hash, code, communicator):
+        _, trace = self._executor.py_code_exec(code)
+        if trace:
+            return trace
+
+        current = globals()[name]
+        if communicator:
+            self._custom_communicators.update({name: current})
+        with self._registry_lock:
+            self._registry[name] = (code_hash, current)
+
+    def register_code(self, json_com, uid, args):
+        name, communicator = args['name'], args.get('communicator', False)
+        if self._registered(name, args['hash'], communicator):
+            json_com.send(self._response(uid, {'registered': True}))
+            return
+        elif args['code'] is None:
+            # the client sends the source
+            json_com.send(self._response(uid, {'registered': False}))
+            return
+
+        self._executor.register_stdout_stderr_write_hook(
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
+        if self._register(name, args['hash'], args['code'], communicator):
+            data = self._executor.get_last_err()
+            json_com.send(self._response_error(uid, -32000, '', data))
+        else:
+            json_com.send(self._response(uid, {'registered': True}))
+
+    def register_codes(self, json_com, uid, args):
+        # register_code of several sources, executed in order
+        self._executor.register_stdout_stderr_write_hook(
+            *self.stdout_stderr_hooks(json_com, args['std_forward'], uid))
+        missing = []
+        for entry in args['codes']:
+            name = entry['name']
+            communicator = entry.get('communicator', False)
+            if self._registered(name, entry['hash'], communicator):
+                continue
+            elif entry['code'] is None:
+                missing.append(name)
+            elif self._register(name, entry['hash'], entry['code'],
+                                communicator):
+                data = self._executor.get_last_err()
+                json_com.send(self._response_error(uid, -32000, '', data))
+                return
+        json_com.send(self._response(uid, {'missing': missing}))
+
+    def register_package(self, json_com, uid, args):
+        # a stored package is verified before it is added to sys.path, after
+        # the existing entries, it never shadows the modules of the server,
+        # the files are verified outside the registry lock, it only guards
+        # sys.path and sys.modules
+        name, path = args['name'], package_store_path(args['hash'])
+        if self._packages.get(name) != path and \
+                not package_store_verify(args['hash']):
+            if args['bundle'] is None:
+                # the client sends the bundle
+                json_com.send(self._response(uid, {'registered': False}))
+                return
+            with self._package_store_lock:
+                package_store_add(args['bundle'], args['hash'])
+
+        with self._registry_lock:
+            previous = self._packages.get(name)
+            if previous != path:
+                # the modules of a previous version are imported again
+                if previous in sys.path:
+                    sys.path.remove(previous)
+                for module in list(sys.modules):
+                    if module == name or module.startswith(name + '.'):
+                        del sys.modules[module]
+                sys.path.append(path)
+                self._packages[name] = path
+        json_com.send(self._response(uid, {'registered': True}))
+
     def execute_custom_communicator(self, json_com, args):
         if args['communicator_name'] in self._custom_communicators:
             json_com.io.sendall(jarray_b(b'\x00'))
@@ -447,53 +2078,203 @@ class JsonRpcServer:
 
     def file_transfer_to_client(self, json_com, args):
         if os.path.exists(args['src_file']) and os.path.isfile(args['src_file']):
-            file_len = struct.pack('!Q', os.path.getsize(args['src_file']))
+            file_size = os.path.getsize(args['src_file'])
+            file_len = struct.pack('!Q', file_size)
             json_com.io.sendall(jarray_b(self.FILE_TRANSFER_FILE_FOUND))
+            if 'offset' in args:
+                # byte range sent as chunks followed by their CRC32
+                offset = min(args['offset'], file_size)
+                data_len = file_size - offset
+                if args.get('length') is not None:
+                    data_len = min(data_len, args['length'])
+                json_com.io.sendall(jarray_b(struct.pack('!Q', data_len)))
+                json_com.io.sendall_from_file_range(
+                    args['src_file'], offset, data_len, args['chunk_size'])
+                return
             json_com.io.sendall(jarray_b(file_len))
+            compression = args.get('compression')
+            if compression:
+                # a flag byte tells the client if the file is compressed
+                compressed = file_size >= compression['threshold']
+                json_com.io.sendall(
+                    jarray_b(b'\x01' if compressed else b'\x00'))
+                if compressed:
+                    json_com.io.sendall_from_file_compressed(
+                        args['src_file'], compression['level'])
+                    return
             json_com.io.sendall_from_file(args['src_file'])
         else:
             json_com.io.sendall(jarray_b(self.FILE_TRANSFER_FILE_NOT_FOUND))
 
     @staticmethod
     def file_transfer_to_server(json_com, args):
-        json_com.io.recvall_to_file(args['data_len'], args['dst_file'])
+        if 'offset' in args:
+            json_com.io.recvall_to_file_range(
+                args['data_len'], args['dst_file'], args['offset'],
+                args['chunk_size'], args.get('truncate', True))
+        elif args.get('compressed'):
+            json_com.io.recvall_to_file_compressed(args['dst_file'])
+        else:
+            json_com.io.recvall_to_file(args['data_len'], args['dst_file'])
+        if args.get('sha256') and 'offset' not in args:
+            JsonRpcServer.dedup_store_add(args['dst_file'], args['sha256'])
+        json_com.io.sendall(jarray_b(b'\xff'))
+
+    def files_transfer_to_client(self, json_com, args):
+        if 'src_dir' in args:
+            found = os.path.isdir(args['src_dir'])
+            entries = dir_entries(args['src_dir'])
+        else:
+            found = all([os.path.isfile(f) for f in args['src_files']])
+            entries = [(os.path.basename(f), f) for f in args['src_files']]
+
+        if found:
+            json_com.io.sendall(jarray_b(self.FILE_TRANSFER_FILE_FOUND))
+            json_com.io.sendall_files(entries)
+        else:
+            json_com.io.sendall(jarray_b(self.FILE_TRANSFER_FILE_NOT_FOUND))
+
+    @staticmethod
+    def files_transfer_to_server(json_com, args):
+        json_com.io.recvall_files(args['dst_dir'])
         json_com.io.sendall(jarray_b(b'\xff'))
 
 
 class PipeServer(threading.Thread):
     def __init__(self, ip_address=PIPE_IP, port=PIPE_PORT, name='',
-                 daemon=False):
+                 daemon=False, backlog=PIPE_BACKLOG, concurrent=PIPE_CONCURRENT,
+                 workers=PIPE_WORKERS, queue_limit=PIPE_QUEUE_LIMIT,
+                 transport=PIPE_TRANSPORT, unix_socket=PIPE_UNIX_SOCKET,
+                 max_connections=PIPE_MAX_CONNECTIONS):
         threading.Thread.__init__(self)
         self.daemon = daemon
         self.name = name
         self.port = port
         self.ip_address = ip_address
+        self.backlog = backlog
+        self.concurrent = concurrent
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.transport = transport
+        # a Unix domain socket path replaces the TCP address, it is always
+        # served by the nio event loop
+        self.unix_socket = unix_socket
+        # connection threads of the blocking transport, the next connections
+        # wait in the backlog of the server socket until a thread ends
+        self.connection_slots = threading.BoundedSemaphore(max_connections)
         self.sock = None
+        self.event_loop = None
         self.is_running = False
 
     def remote_shutdown(self):
         if self.is_running:
             self.is_running = False
+            if self.event_loop:
+                self.event_loop.stop()
             self.sock.close()
             self.sock = None
+            if self.unix_socket and os.path.exists(self.unix_socket):
+                os.remove(self.unix_socket)
             print('[i] {} stop'.format(self.name))
 
     def run(self):
-        inet_addr = InetAddress.getByName(self.ip_address)
-        self.sock = ServerSocket(self.port, 1, inet_addr)
-        self.sock.setReuseAddress(True)
-        self.is_running = True
-        print('[i] {} start'.format(self.name))
+        if self.transport not in ['blocking', 'nio']:
+            raise ValueError("Unknown transport '{}'.".format(self.transport))
+
+        nio = self.transport == 'nio' or self.unix_socket
+        rpc_worker_pool = None
+        if self.concurrent:
+            rpc_worker_pool = RpcWorkerPool(
+                self.workers, self.queue_limit, self.name)
+        elif nio:
+            # requests are never processed by the event loop thread
+            rpc_worker_pool = RpcWorkerPool(1, self.queue_limit, self.name)
         json_rpc_server = JsonRpcServer(
-            self.ip_address, self.port, self.remote_shutdown)
+            self.ip_address, self.port, self.remote_shutdown,
+            rpc_worker_pool=rpc_worker_pool)
 
-        while self.is_running:
-            client_sock = self.sock.accept()
+        # the blocking transport accepts java.net sockets, the reads of a
+        # connection never block its writes
+        if self.unix_socket:
+            self.sock = self.bind_unix_socket()
+        else:
+            inet_addr = InetAddress.getByName(self.ip_address)
+            self.sock = ServerSocketChannel.open() if nio else ServerSocket()
+            server_sock = self.sock.socket() if nio else self.sock
+            server_sock.setReuseAddress(True)
+            set_socket_buffer_size(self.sock, send_buffer=False)
+            server_sock.bind(InetSocketAddress(inet_addr, self.port),
+                             self.backlog)
+        if nio:
+            self.event_loop = NioEventLoop(
+                self.sock, json_rpc_server, rpc_worker_pool)
+
+        self.is_running = True
+        print('[i] {} start'.format(self.name))
 
+        if self.event_loop:
+            self.event_loop.run()
+        else:
+            self.accept_loop(json_rpc_server)
+
+        if rpc_worker_pool:
+            rpc_worker_pool.shutdown()
+
+    def bind_unix_socket(self):
+        try:
+            from java.net import StandardProtocolFamily
+            from java.net import UnixDomainSocketAddress
+        except ImportError:
+            raise ValueError('Unix domain socket requires Java 16 or later.')
+
+        address = UnixDomainSocketAddress.of(self.unix_socket)
+        if os.path.lexists(self.unix_socket):
+            # only the socket left by a server not stopped cleanly is removed,
+            # nobody accepts its connections
+            if not stat.S_ISSOCK(os.lstat(self.unix_socket).st_mode):
+                raise ValueError("'{}' is not a Unix domain socket.".format(
+                    self.unix_socket))
+            probe = SocketChannel.open(StandardProtocolFamily.UNIX)
             try:
-                with JavaTcpNetIo(client_sock) as client_tcp_net_io:
-                    json_rpc_server.dispatcher(client_tcp_net_io)
-            except:
-                print(traceback.format_exc())
+                probe.connect(address)
+            except ConnectException:
+                os.remove(self.unix_socket)
+            else:
+                raise ValueError("'{}' is served by another process.".format(
+                    self.unix_socket))
             finally:
-                client_sock.close()
+                probe.close()
+        server_channel = ServerSocketChannel.open(StandardProtocolFamily.UNIX)
+        server_channel.bind(address, self.backlog)
+        return server_channel
+
+    def accept_loop(self, json_rpc_server):
+        while self.is_running:
+            self.connection_slots.acquire()
+            if not self.is_running:  # shutdown while waiting for a slot
+                self.connection_slots.release()
+                break
+            try:
+                client_sock = self.sock.accept()
+            except IOException:
+                self.connection_slots.release()
+                if not self.is_running:  # server socket closed by shutdown
+                    break
+                raise
+            client_sock.setTcpNoDelay(True)
+            set_socket_buffer_size(client_sock)
+            connection_thread = threading.Thread(
+                target=self.serve_connection,
+                args=(json_rpc_server, client_sock))
+            connection_thread.daemon = True
+            connection_thread.start()
+
+    def serve_connection(self, json_rpc_server, client_sock):
+        try:
+            with JavaTcpNetIo(client_sock) as client_tcp_net_io:
+                json_rpc_server.dispatcher(client_tcp_net_io)
+        except:
+            print(traceback.format_exc())
+        finally:
+            client_sock.close()
+            self.connection_slots.release()
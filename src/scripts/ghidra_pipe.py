@@ -27,6 +27,7 @@ def ghidra_plugin_install(target_path):
     script_dir = os.path.dirname(os.path.realpath(__file__))
     file_list = [
         'pipe_server.py',
+        'pipe_codec.py',
         'pipe_default_conf.py',
         'plugin_ghidra_pipe_server_start.py',
         'plugin_ghidra_pipe_server_stop.py'
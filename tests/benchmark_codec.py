@@ -0,0 +1,117 @@
+################################################################################
+#
+# Copyright 2022 Vincent Dary
+#
+# This file is part of ghidra-pipe.
+#
+# ghidra-pipe is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# ghidra-pipe is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# ghidra-pipe. If not, see <https://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Size and speed benchmark of the JSON and MessagePack frame codecs, runs on
+# the client side and on the server side.
+#
+#   $ python tests/benchmark_codec.py
+#   $ jython tests/benchmark_codec.py
+#   $ CLASSPATH=/path/to/ghidra/Ghidra/Framework/Generic/lib/gson-2.9.0.jar \
+#       jython tests/benchmark_codec.py
+#
+# The Gson backend of the pipe server is benchmarked under Jython when Gson is
+# in the classpath.
+# The bytearrays are base64 encoded in the JSON frames (the client sends them
+# as attachments by default), they are bin values in the MessagePack frames.
+
+import os
+import sys
+import time
+import json
+import base64
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, '..', 'src', 'ghidra_pipe'))
+
+from pipe_codec import msgpack_dumps, msgpack_loads  # noqa: E402
+
+try:
+    from pipe_server import GSON, gson_dumps, gson_loads  # noqa: E402
+except ImportError:  # CPython
+    GSON = None
+
+ROUNDS = 20
+
+
+def json_default(obj):
+    return {'__bytearray__': True,
+            'data': base64.b64encode(bytes(obj)).decode('utf-8')}
+
+
+def json_hook(obj):
+    if '__bytearray__' in obj:
+        return bytearray(base64.b64decode(obj['data']))
+    return obj
+
+
+def json_dumps(data):
+    return json.dumps(data, default=json_default).encode('utf-8')
+
+
+def json_loads(data):
+    return json.loads(data.decode('utf-8'), object_hook=json_hook)
+
+
+def gson_loads_frame(data):
+    return gson_loads(data, 0, len(data))
+
+
+def payloads():
+    request = {'jsonrpc': '2.0', 'id': '1f0e7c4a-6b1d-4e57-a2b3-9c0d8e7f6a5b',
+               'method': 'func_exec',
+               'params': {'func_name': 'get_function', 'std_forward': True,
+                          'args': [4198400], 'kwargs': {}}}
+    functions = [{'name': u'FUN_{:08x}'.format(0x401000 + i * 16),
+                  'entry': 0x401000 + i * 16, 'size': i % 512,
+                  'thunk': i % 7 == 0, 'callers': list(range(i % 8))}
+                 for i in range(2000)]
+    memory = {'address': 0x401000,
+              'bytes': bytearray(os.urandom(1024 * 256))}
+    return [('request', request), ('functions', functions),
+            ('memory', memory)]
+
+
+def bench(func, data):
+    start = time.time()
+    for _ in range(ROUNDS):
+        func(data)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+def main():
+    codecs = [('json', json_dumps, json_loads),
+              ('msgpack', msgpack_dumps, msgpack_loads)]
+    if GSON is not None:
+        codecs.append(('gson', gson_dumps, gson_loads_frame))
+
+    print('{:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+        'payload', 'codec', 'size', 'encode ms', 'decode ms'))
+
+    for name, data in payloads():
+        for codec, dumps, loads in codecs:
+            encoded = dumps(data)
+            assert loads(encoded) == json_loads(json_dumps(data))
+            print('{:>10} {:>8} {:>10} {:>10.3f} {:>10.3f}'.format(
+                name, codec, len(encoded), bench(dumps, data),
+                bench(loads, encoded)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+################################################################################
+#
+# Copyright 2022 Vincent Dary
+#
+# This file is part of ghidra-pipe.
+#
+# ghidra-pipe is free software: you can redistribute it and/or modify it under
+# the terms of the GNU General Public License as published by the Free Software
+# Foundation, either version 3 of the License, or (at your option) any later
+# version.
+#
+# ghidra-pipe is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# ghidra-pipe. If not, see <https://www.gnu.org/licenses/>.
+#
+################################################################################
+
+# Jython micro-benchmark of the jarray <-> str conversions of the pipe server.
+#
+#   $ jython tests/benchmark_jarray_conv.py
+#
+# Compares the in-memory JarrayConvBypass conversion with the previous temp
+# file round trip and with the native jarray methods (skipped above
+# NATIVE_LIMIT, they get stuck on large arrays).
+
+import os
+import sys
+import time
+import tempfile
+
+import jarray
+from java.io import FileOutputStream, FileInputStream
+
+SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, '..', 'src', 'ghidra_pipe'))
+
+from pipe_server import JarrayConvBypass  # noqa: E402
+
+SIZES = [1024, 4096 * 8, 1024 * 256, 1024 * 1024, 1024 * 1024 * 8]
+NATIVE_LIMIT = 1024 * 256
+ROUNDS = 10
+
+
+def temp_file_tostring(jarray_byte):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        out_fstream = FileOutputStream(path)
+        out_fstream.write(jarray_byte)
+        out_fstream.close()
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+
+def temp_file_fromstring(str_bytes):
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        with open(path, 'wb') as f:
+            f.write(str_bytes)
+        in_fstream = FileInputStream(path)
+        buff = jarray.zeros(len(str_bytes), 'b')
+        in_fstream.read(buff)
+        in_fstream.close()
+        return buff
+    finally:
+        os.remove(path)
+
+
+def native_tostring(jarray_byte):
+    return jarray_byte.tostring()
+
+
+def native_fromstring(str_bytes):
+    buff = jarray.zeros(0, 'b')
+    buff.fromstring(str_bytes)
+    return buff
+
+
+def bench(func, data):
+    start = time.time()
+    for _ in range(ROUNDS):
+        func(data)
+    return (time.time() - start) / ROUNDS * 1000
+
+
+def main():
+    methods = [
+        ('in-memory', JarrayConvBypass.tostring, JarrayConvBypass.fromstring),
+        ('temp file', temp_file_tostring, temp_file_fromstring),
+        ('native', native_tostring, native_fromstring)]
+
+    print('{:>10} {:>10} {:>14} {:>14}'.format(
+        'size', 'method', 'tostring ms', 'fromstring ms'))
+
+    for size in SIZES:
+        str_bytes = os.urandom(size)
+        jarray_byte = JarrayConvBypass.fromstring(str_bytes)
+        assert JarrayConvBypass.tostring(jarray_byte) == str_bytes
+        assert list(jarray_byte) == list(native_fromstring(str_bytes))
+
+        for name, tostring, fromstring in methods:
+            if name == 'native' and size > NATIVE_LIMIT:
+                continue
+            print('{:>10} {:>10} {:>14.3f} {:>14.3f}'.format(
+                size, name, bench(tostring, jarray_byte),
+                bench(fromstring, str_bytes)))
+
+
+if __name__ == '__main__':
+    main()
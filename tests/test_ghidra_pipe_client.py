@@ -29,20 +29,38 @@ import hashlib
 import shutil
 import contextlib
 import tempfile
+import threading
+import asyncio
+import socket
+import struct
 
 from ghidra_pipe import PipeClient
+from ghidra_pipe import PIPE_IP, PIPE_PORT
 
 from ghidra_pipe import TcpNetIoError
 from ghidra_pipe import PipeServerRemoteCodeExecErr
 from ghidra_pipe import PipeServerInternalErr
+from ghidra_pipe import PipeServerMethodNotFound
 from ghidra_pipe import PipeFileTransferErr
 
 from ghidra_pipe import PipeClientJsonRpc
 from ghidra_pipe import PipeCustomComNotFound
+from ghidra_pipe import TcpClientPool
+from ghidra_pipe import FileTransferStats
+from ghidra_pipe import AsyncPipeClient
+from ghidra_pipe import RemoteIterator
+from ghidra_pipe import RemoteSequenceProxy, RemoteMappingProxy
+from ghidra_pipe.pipe_client import TcpClient, TcpNetIo, TcpJsonCom
+from ghidra_pipe.pipe_client import PIPE_KEEP_ALIVE_TIMEOUT
+from ghidra_pipe.pipe_client import FRAME_ATTACHMENTS, frame_decode
+from ghidra_pipe.pipe_async_client import AsyncTcpNetIo, AsyncTcpJsonCom
+from ghidra_pipe.pipe_codec import msgpack_dumps, msgpack_loads, MsgPackError
 
 
 JYTHON_BIN = os.getenv('JYTHON_BIN', 'jython')
 PIPE_SERVER_COV = os.getenv('PIPE_SERVER_COV', None)
+# Gson jar of a Ghidra install, e.g. Ghidra/Framework/Generic/lib/gson-*.jar
+GSON_JAR = os.getenv('GSON_JAR', None)
 
 TEST_SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 PIPE_SERVER_START_SCRIPT = os.path.join(
@@ -86,17 +104,24 @@ def setup_module(module):
         popen_cwd = None
         popen_args = [PIPE_SERVER_START_SCRIPT]
 
+    start_pipe_server(popen_args, popen_cwd)
+
+
+def start_pipe_server(popen_args, popen_cwd=None, port=PIPE_PORT,
+                      server_env=None, unix_socket=None):
     env = dict(os.environ)
-    env.update({'DAEMON': 'False'})
+    env.update({'DAEMON': 'False', 'PIPE_PORT': str(port)})
+    env.update(server_env or {})
     subprocess.Popen([JYTHON_BIN, *popen_args], cwd=popen_cwd, env=env)
 
-    pipe_client = PipeClient()
+    pipe_client = PipeClient(port=port, unix_socket=unix_socket)
     while True:
         try:
             banner = pipe_client.get_server_banner()
             if banner:
                 break
-        except (ConnectionRefusedError, ConnectionResetError):
+        except (ConnectionRefusedError, ConnectionResetError,
+                FileNotFoundError):
             time.sleep(2)
 
 
@@ -157,6 +182,227 @@ def test_file_transfer_to_client():
             assert count == int(4096 * 10.5)
 
 
+def test_file_transfer_stats():
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(1024 * 1024 * 4 + 3)
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        pipe_client = PipeClient()
+        up = pipe_client.file_transfer_to_server(local_file, remote_file)
+        os.remove(local_file)
+        down = pipe_client.file_transfer_to_client(remote_file, local_file)
+        with open(local_file, 'rb') as f:
+            assert f.read() == content
+
+    for stats in [up, down]:
+        assert isinstance(stats, FileTransferStats)
+        assert stats == len(content)
+        assert stats.duration > 0
+        assert stats.throughput == len(content) / stats.duration
+
+
+def test_file_range_transfer_to_client():
+    with temp_bin_file() as remote_file, temp_bin_file() as local_file:
+        content = os.urandom(int(1024 * 1024 * 2.5))
+        with open(remote_file, 'wb') as f:
+            f.write(content)
+        pipe_client = PipeClient()
+
+        data = pipe_client.file_bytes_transfer_to_client(
+            remote_file, offset=1000, length=1024 * 1024 + 7)
+        assert data == content[1000:1000 + 1024 * 1024 + 7]
+        data = pipe_client.file_bytes_transfer_to_client(
+            remote_file, offset=len(content) - 5, length=4096)
+        assert data == content[-5:]
+
+        count = pipe_client.file_transfer_to_client(
+            remote_file, local_file, offset=3)
+        assert count == len(content) - 3
+        with open(local_file, 'rb') as f:
+            assert f.read() == content[3:]
+
+
+def test_file_transfer_resume():
+    with temp_bin_file() as remote_file, temp_bin_file() as local_file:
+        content = os.urandom(int(1024 * 1024 * 2.5))
+        with open(remote_file, 'wb') as f:
+            f.write(content)
+        with open(local_file, 'wb') as f:
+            f.write(content[:1024 * 1024 + 10])
+        pipe_client = PipeClient()
+
+        count = pipe_client.file_transfer_to_client(
+            remote_file, local_file, resume=True)
+        assert count == len(content) - (1024 * 1024 + 10)
+        with open(local_file, 'rb') as f:
+            assert f.read() == content
+
+        with open(remote_file, 'wb') as f:
+            f.write(content[:100])
+        assert pipe_client.get_file_size(remote_file) == 100
+        count = pipe_client.file_transfer_to_server(
+            local_file, remote_file, resume=True)
+        assert count == len(content) - 100
+        with open(remote_file, 'rb') as f:
+            assert f.read() == content
+
+    assert pipe_client.get_file_size(remote_file) is None
+
+
+def test_file_transfer_parallel():
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(1024 * 1024 * 5 + 3)
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        with open(remote_file, 'wb') as f:
+            f.write(os.urandom(1024 * 1024 * 7))
+        pipe_client = PipeClient()
+
+        up = pipe_client.file_transfer_to_server(
+            local_file, remote_file, streams=4)
+        assert up == len(content)
+        with open(remote_file, 'rb') as f:
+            assert f.read() == content
+        assert pipe_client.get_file_hash(remote_file) == \
+            hashlib.sha256(content).hexdigest()
+
+        os.remove(local_file)
+        down = pipe_client.file_transfer_to_client(
+            remote_file, local_file, streams=4)
+        assert down == len(content)
+        with open(local_file, 'rb') as f:
+            assert f.read() == content
+
+        with pytest.raises(ValueError):
+            pipe_client.file_transfer_to_client(
+                remote_file, local_file, offset=1, streams=4)
+
+    with pytest.raises(PipeFileTransferErr):
+        pipe_client.file_transfer_to_client(remote_file, local_file, streams=4)
+    assert pipe_client.get_file_hash(remote_file) is None
+
+
+def test_file_transfer_dedup():
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file_1, \
+            temp_bin_file() as remote_file_2:
+        content = os.urandom(1024 * 100)
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        pipe_client = PipeClient()
+
+        first = pipe_client.file_transfer_to_server(
+            local_file, remote_file_1, dedup=True)
+        assert first == len(content) and not first.deduplicated
+        with open(remote_file_1, 'wb') as f:
+            f.write(b'modified')
+
+        second = pipe_client.file_transfer_to_server(
+            local_file, remote_file_2, dedup=True)
+        assert second == len(content) and second.deduplicated
+        with open(remote_file_2, 'rb') as f:
+            assert f.read() == content
+
+        os.remove(remote_file_2)
+        pipe_client.file_bytes_transfer_to_server(
+            content, remote_file_2, dedup=True)
+        with open(remote_file_2, 'rb') as f:
+            assert f.read() == content
+
+
+def test_file_transfer_dedup_store_private():
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(1024 * 10)
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        pipe_client = PipeClient()
+        pipe_client.file_transfer_to_server(local_file, remote_file, dedup=True)
+        assert pipe_client.exec('print(oct(os.stat(dedup_store_root()).st_mode'
+                                ' & 0o777))', std_cap=True) == '0700\n'
+
+        # an altered stored file is never copied, the next upload replaces it
+        sha256 = hashlib.sha256(content).hexdigest()
+        pipe_client.exec('open(dedup_store_path({!r}), "wb").write("x")'.format(
+            sha256))
+        altered = pipe_client.file_transfer_to_server(
+            local_file, remote_file, dedup=True)
+        assert not altered.deduplicated
+        assert pipe_client.file_transfer_to_server(
+            local_file, remote_file, dedup=True).deduplicated
+
+
+@contextlib.contextmanager
+def temp_dir():
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path, ignore_errors=True)
+
+
+def make_tree(root):
+    os.makedirs(os.path.join(root, 'sub', 'deep'))
+    os.makedirs(os.path.join(root, 'empty'))
+    files = {}
+    for i in range(20):
+        files['sub/f{}.bin'.format(i)] = os.urandom(i * 101)
+    files['sub/deep/big.bin'] = os.urandom(1024 * 300)
+    files['top.bin'] = b'\xDE\xAD'
+    for name, content in files.items():
+        with open(os.path.join(root, *name.split('/')), 'wb') as f:
+            f.write(content)
+    return files
+
+
+def check_tree(root, files):
+    for name, content in files.items():
+        with open(os.path.join(root, *name.split('/')), 'rb') as f:
+            assert f.read() == content
+    assert os.path.isdir(os.path.join(root, 'empty'))
+
+
+def test_dir_transfer():
+    with temp_dir() as local_dir, temp_dir() as remote_dir, \
+            temp_dir() as back_dir:
+        files = make_tree(local_dir)
+        size = sum(len(content) for content in files.values())
+        remote_dst = os.path.join(remote_dir, 'copy')
+        pipe_client = PipeClient()
+
+        assert pipe_client.dir_transfer_to_server(
+            local_dir, remote_dst) == size
+        check_tree(remote_dst, files)
+        assert pipe_client.dir_transfer_to_client(
+            remote_dst, back_dir) == size
+        check_tree(back_dir, files)
+
+        with pytest.raises(PipeFileTransferErr):
+            pipe_client.dir_transfer_to_client(
+                os.path.join(remote_dir, 'missing'), back_dir)
+
+
+def test_files_transfer():
+    with temp_dir() as local_dir, temp_dir() as remote_dir, \
+            temp_dir() as back_dir:
+        files = make_tree(local_dir)
+        names = ['top.bin', 'sub/f3.bin', 'sub/deep/big.bin']
+        src_files = [os.path.join(local_dir, *name.split('/'))
+                     for name in names]
+        pipe_client = PipeClient()
+
+        pipe_client.files_transfer_to_server(src_files, remote_dir)
+        remote_files = [os.path.join(remote_dir, os.path.basename(name))
+                        for name in names]
+        count = pipe_client.files_transfer_to_client(remote_files, back_dir)
+        assert count == sum(len(files[name]) for name in names)
+        for name in names:
+            with open(os.path.join(back_dir, os.path.basename(name)),
+                      'rb') as f:
+                assert f.read() == files[name]
+
+        with pytest.raises(PipeFileTransferErr):
+            pipe_client.files_transfer_to_client(
+                remote_files + [os.path.join(remote_dir, 'missing')],
+                back_dir)
+
+
 def test_file_bytes_transfer_to_client_file_not_exit():
     tempf = tempfile.NamedTemporaryFile()
     tempf.close()
@@ -955,6 +1201,1325 @@ def test_object_proxy():
 
     assert proxy.foo() == 100
 
+################################################################################
+# Test Connection Pool
+################################################################################
+
+def test_connection_pool_keep_alive():
+    pool = TcpClientPool(PIPE_IP, PIPE_PORT)
+    pipe_client_rpc = PipeClientJsonRpc(pool=pool)
+    pipe_client_rpc.get_server_banner()
+
+    with pool.connection() as tcp_client:
+        first_sock = tcp_client.sock
+
+    for _ in range(10):
+        assert pipe_client_rpc.get_server_banner()
+
+    with pool.connection() as tcp_client:
+        assert tcp_client.sock is first_sock
+
+    pool.clear()
+
+
+def test_connection_pool_idle_timeout():
+    # the idle connections are dropped before the server keep-alive timeout
+    pool = TcpClientPool(PIPE_IP, PIPE_PORT)
+    assert pool.idle_timeout < PIPE_KEEP_ALIVE_TIMEOUT
+    pool = TcpClientPool(PIPE_IP, PIPE_PORT, idle_timeout=0)
+    with pool.connection() as tcp_client:
+        first_sock = tcp_client.sock
+    with pool.connection() as tcp_client:
+        assert tcp_client.sock is not first_sock
+    pool.clear()
+
+
+def test_connection_pool_drop_connection_on_error():
+    pool = TcpClientPool(PIPE_IP, PIPE_PORT)
+    pipe_client_rpc = PipeClientJsonRpc(pool=pool)
+    pipe_client_rpc.exec('class PoolErr: pass')
+    pipe_client_rpc.exec('pool_err_obj = PoolErr()')
+
+    with pytest.raises(PipeServerInternalErr):
+        pipe_client_rpc.object_proxy_getattr('pool_err_obj', 'not_exist')
+
+    assert pipe_client_rpc.get_server_banner()
+    pool.clear()
+
+
+def test_connection_pool_shared_by_proxies():
+    def pool_shared():
+        return 1
+
+    pipe_client = PipeClient()
+    pool_shared = pipe_client.register_func(pool_shared)
+    assert pool_shared() == 1
+    assert PipeClientJsonRpc().pool is pipe_client.pipe_client_rpc.pool
+    assert PipeClient().pipe_client_rpc.pool is pipe_client.pipe_client_rpc.pool
+
+
+def test_connection_pool_multi_thread():
+    def pool_thread_add(x):
+        return x + 1
+
+    pool_thread_add = PipeClient().register_func(pool_thread_add)
+    results = {}
+
+    def worker(i):
+        results[i] = [pool_thread_add(i) for _ in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: [i + 1] * 20 for i in range(8)}
+
+
+################################################################################
+# Test Concurrent Pipe Server
+################################################################################
+
+@pytest.fixture(scope='module')
+def concurrent_pipe_client():
+    port = PIPE_PORT + 1
+    start_pipe_server([PIPE_SERVER_START_SCRIPT], port=port,
+                      server_env={'PIPE_CONCURRENT': 'True',
+                                  'PIPE_WORKERS': '4'})
+    yield PipeClient(port=port)
+    PipeClient(port=port).server_remote_shutdown()
+
+
+def test_concurrent_server_long_exec_not_blocking(concurrent_pipe_client):
+    long_exec = threading.Thread(
+        target=concurrent_pipe_client.exec, args=('time.sleep(3)',))
+    concurrent_pipe_client.exec('import time')
+    long_exec.start()
+    time.sleep(0.5)
+
+    start = time.time()
+    assert concurrent_pipe_client.get_server_banner()
+    assert time.time() - start < 2
+    long_exec.join()
+
+
+def test_concurrent_server_std_capture_per_request(concurrent_pipe_client):
+    pipe_client = PipeClient(port=concurrent_pipe_client.port,
+                             std_forward=False)
+    outputs = {}
+
+    def worker(char):
+        outputs[char] = pipe_client.exec(
+            'for _ in range(200): sys.stdout.write("{}")'.format(char),
+            std_cap=True)
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in 'abcdef']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outputs == {c: c * 200 for c in 'abcdef'}
+
+
+def test_concurrent_server_func_exec(concurrent_pipe_client):
+    def concurrent_add(x, y=0):
+        return x + y
+
+    concurrent_add = concurrent_pipe_client.register_func(concurrent_add)
+    results = {}
+
+    def worker(i):
+        results[i] = [concurrent_add(i, y=j) for j in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: [i + j for j in range(20)] for i in range(8)}
+
+
+################################################################################
+# Test Multiplexed Connection
+################################################################################
+
+def test_multiplex_shared_connection():
+    def multiplex_add(x, y=0):
+        return x + y
+
+    pipe_client = PipeClient(multiplex=True)
+    multiplex_add = pipe_client.register_func(multiplex_add)
+    connection = pipe_client.pipe_client_rpc._multiplex_connection
+    results = {}
+
+    def worker(i):
+        results[i] = [multiplex_add(i, y=j) for j in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: [i + j for j in range(20)] for i in range(8)}
+    assert pipe_client.pipe_client_rpc._multiplex_connection is connection
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+def test_multiplex_live_output_and_error(capsys):
+    pipe_client = PipeClient(multiplex=True)
+    pipe_client.exec('print("multiplex live")')
+    assert capsys.readouterr().out == 'multiplex live\n'
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        pipe_client.exec('raise ValueError("multiplex")')
+    assert pipe_client.get_server_banner()
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+def test_multiplex_reconnect():
+    pipe_client_rpc = PipeClientJsonRpc(multiplex=True)
+    assert pipe_client_rpc.get_server_banner()
+    connection = pipe_client_rpc._multiplex_connection
+    connection.close()
+    with pytest.raises(TcpNetIoError):
+        connection.request({'id': '0'})
+    assert pipe_client_rpc.get_server_banner()
+    assert pipe_client_rpc._multiplex_connection is not connection
+    pipe_client_rpc.close_multiplex_connection()
+
+
+def test_multiplex_undecodable_frame(monkeypatch):
+    def frame_decode_error(*args):
+        raise KeyError('frame')
+
+    pipe_client_rpc = PipeClientJsonRpc(multiplex=True)
+    assert pipe_client_rpc.get_server_banner()
+    connection = pipe_client_rpc._multiplex_connection
+    monkeypatch.setattr('ghidra_pipe.pipe_client.frame_decode',
+                        frame_decode_error)
+    with pytest.raises(KeyError):
+        pipe_client_rpc.get_server_banner()
+    assert connection.is_closed
+    monkeypatch.undo()
+    assert pipe_client_rpc.get_server_banner()
+    pipe_client_rpc.close_multiplex_connection()
+
+
+def test_multiplex_concurrent_server_out_of_order(concurrent_pipe_client):
+    pipe_client = PipeClient(port=concurrent_pipe_client.port, multiplex=True)
+    pipe_client.exec('import time')
+    long_exec = threading.Thread(
+        target=pipe_client.exec, args=('time.sleep(3)',))
+    long_exec.start()
+    time.sleep(0.5)
+
+    start = time.time()
+    assert pipe_client.get_server_banner()
+    assert time.time() - start < 2
+    long_exec.join()
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+################################################################################
+# Test Batch Requests
+################################################################################
+
+def test_batch_requests():
+    class BatchTestClass:
+        def __init__(self):
+            self.values = list(range(10))
+
+    pipe_client = PipeClient()
+    BatchTestClass = pipe_client.register_class(BatchTestClass)
+    obj = BatchTestClass()
+    obj_name = obj.__PROXY_OBJECT_NAME__
+
+    with pipe_client.batch() as batch:
+        banner = batch.get_server_banner()
+        out = batch.exec('print("batch")', std_cap=True)
+        set_ret = batch.object_proxy_setattr(obj_name, 'x', 42)
+        x = batch.object_proxy_getattr(obj_name, 'x')
+        values = batch.object_proxy_getattr(obj_name, 'values')
+        length = batch.func_exec('len', [[1, 2, 3]], {})
+
+    assert banner.result() == 'PipeServer JSON RPC v2'
+    assert out.result() == 'batch\n'
+    assert set_ret.result() is None
+    assert x.result() == (42, 'int')
+    assert values.result() == (list(range(10)), 'list')
+    assert length.result() == 3
+
+
+def test_batch_requests_executed_in_order():
+    pipe_client = PipeClient()
+    with pipe_client.batch() as batch:
+        batch.exec('batch_seq = []')
+        for i in range(20):
+            batch.exec('batch_seq.append({})'.format(i))
+        seq = batch.exec('print(batch_seq)', std_cap=True)
+    assert seq.result() == str(list(range(20))) + '\n'
+
+
+def test_batch_requests_error():
+    pipe_client = PipeClient()
+    with pipe_client.batch() as batch:
+        err = batch.exec('raise ValueError("batch")')
+        banner = batch.get_server_banner()
+
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        err.result()
+    assert banner.result() == 'PipeServer JSON RPC v2'
+
+
+def test_batch_requests_invalid():
+    with PipeClient().batch() as batch:
+        pass
+    assert batch.requests == []
+
+    pipe_client_rpc = PipeClientJsonRpc()
+    with pipe_client_rpc.pool.connection() as tcp_client:
+        tcp_json_com = TcpJsonCom()
+        tcp_json_com.set_socket(tcp_client.sock)
+        tcp_json_com.send([])
+        assert tcp_json_com.recv()['error']['code'] == -32600
+        tcp_json_com.send([{'jsonrpc': '2.0', 'method': 'get_server_banner',
+                            'params': {}}])
+        assert tcp_json_com.recv()[0]['error']['code'] == -32600
+
+
+def test_method_not_found():
+    pipe_client_rpc = PipeClientJsonRpc()
+    with pytest.raises(PipeServerMethodNotFound):
+        pipe_client_rpc._rpc_request('set_unknown', {})
+
+
+################################################################################
+# Test NIO Pipe Server
+################################################################################
+
+@pytest.fixture(scope='module')
+def nio_pipe_client():
+    port = PIPE_PORT + 2
+    start_pipe_server([PIPE_SERVER_START_SCRIPT], port=port,
+                      server_env={'PIPE_TRANSPORT': 'nio',
+                                  'PIPE_CONCURRENT': 'True',
+                                  'PIPE_WORKERS': '4'})
+    yield PipeClient(port=port)
+    PipeClient(port=port).server_remote_shutdown()
+
+
+def test_nio_server_func_exec_std_capture(nio_pipe_client):
+    def nio_add(x, y=0):
+        print(x + y)
+        return x + y
+
+    nio_add = nio_pipe_client.register_func(nio_add)
+    results = {}
+
+    def worker(i):
+        results[i] = [nio_add(i, y=j) for j in range(20)]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {i: [i + j for j in range(20)] for i in range(8)}
+    assert nio_pipe_client.exec('print("nio")', std_cap=True) == 'nio\n'
+
+
+def test_nio_server_large_frame(nio_pipe_client):
+    def nio_echo(data):
+        return data
+
+    nio_echo = nio_pipe_client.register_func(nio_echo)
+    content = bytearray(os.urandom(4096 * 40))
+    assert nio_echo(content) == content
+
+
+def test_nio_server_file_transfer(nio_pipe_client):
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(int(4096 * 10.5))
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        nio_pipe_client.file_transfer_to_server(local_file, remote_file)
+        assert nio_pipe_client.file_bytes_transfer_to_client(
+            remote_file) == content
+    assert nio_pipe_client.get_server_banner()
+
+
+def test_nio_server_many_idle_connections(nio_pipe_client):
+    idle_clients = []
+    for _ in range(64):
+        tcp_client = TcpClient(PIPE_IP, nio_pipe_client.port)
+        tcp_client.create_connection()
+        idle_clients.append(tcp_client)
+
+    start = time.time()
+    assert nio_pipe_client.get_server_banner()
+    assert time.time() - start < 2
+
+    for tcp_client in idle_clients:
+        tcp_client.close_connection()
+
+
+################################################################################
+# Test Compression
+################################################################################
+
+def test_compression_frames():
+    def compress_echo(data):
+        return data
+
+    pipe_client = PipeClient(compression=True)
+    compress_echo = pipe_client.register_func(compress_echo)
+    with pipe_client.pipe_client_rpc.pool.connection() as tcp_client:
+        assert tcp_client.compress_threshold is not None
+
+    assert compress_echo('small') == 'small'
+    large = 'ghidra' * 100000
+    assert compress_echo(large) == large
+    content = bytearray(os.urandom(4096 * 40))
+    assert compress_echo(content) == content
+    out = pipe_client.exec('print("z" * 20000)', std_cap=True)
+    assert out == 'z' * 20000 + '\n'
+
+
+def test_compression_file_transfer():
+    pipe_client = PipeClient(compression=True)
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        for content in [b'\x00' * 1024 * 1024 + os.urandom(4096), b'tiny']:
+            with open(local_file, 'wb') as f:
+                f.write(content)
+            assert pipe_client.file_transfer_to_server(
+                local_file, remote_file) == len(content)
+            with open(remote_file, 'rb') as f:
+                assert f.read() == content
+            assert pipe_client.file_bytes_transfer_to_client(
+                remote_file) == content
+            os.remove(local_file)
+            assert pipe_client.file_transfer_to_client(
+                remote_file, local_file) == len(content)
+            with open(local_file, 'rb') as f:
+                assert f.read() == content
+            pipe_client.file_bytes_transfer_to_server(content, remote_file)
+            with open(remote_file, 'rb') as f:
+                assert f.read() == content
+
+
+def test_compression_multiplex():
+    pipe_client = PipeClient(compression=True, multiplex=True)
+    large = 'x' * 100000
+    assert pipe_client.exec('print("{}")'.format(large), std_cap=True) == \
+        large + '\n'
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+################################################################################
+# Test Client Socket IO
+################################################################################
+
+def test_tcp_net_io_buffers():
+    sock_a, sock_b = socket.socketpair()
+    io_a, io_b = TcpNetIo(sock_a), TcpNetIo(sock_b)
+    content = os.urandom(4096 * 300)
+
+    sender = threading.Thread(target=io_a.sendall_buffers,
+                              args=(b'\xDE\xAD', content))
+    sender.start()
+    data = io_b.recvall(2 + len(content))
+    sender.join()
+
+    assert data == b'\xDE\xAD' + content
+    data.extend(b'\x00')  # no view left on the received buffer
+    sock_a.close()
+    with pytest.raises(TcpNetIoError):
+        io_b.recvall(1)
+    sock_b.close()
+
+
+def test_tcp_net_io_checked_chunks():
+    sock_a, sock_b = socket.socketpair()
+    io_a, io_b = TcpNetIo(sock_a), TcpNetIo(sock_b)
+    content = os.urandom(4096 * 3 + 1)
+
+    with temp_bin_file() as tmp_file:
+        with open(tmp_file, 'wb') as f:
+            f.write(content)
+        io_a.sendall_checked_chunks(tmp_file, 1, len(content) - 1, 4096)
+    assert b''.join(io_b.recv_checked_chunks(len(content) - 1, 4096)) == \
+        content[1:]
+
+    io_a.sendall(content[:4096] + struct.pack('!I', 0xdeadc0de))
+    with pytest.raises(TcpNetIoError):
+        list(io_b.recv_checked_chunks(4096, 4096))
+    sock_a.close()
+    sock_b.close()
+
+
+################################################################################
+# Test Unix Domain Socket Pipe Server
+################################################################################
+
+@pytest.fixture(scope='module')
+def unix_pipe_client():
+    unix_socket = os.path.join(tempfile.gettempdir(), 'ghidra_pipe_test.sock')
+    start_pipe_server([PIPE_SERVER_START_SCRIPT], port=PIPE_PORT + 3,
+                      server_env={'PIPE_UNIX_SOCKET': unix_socket},
+                      unix_socket=unix_socket)
+    yield PipeClient(unix_socket=unix_socket)
+    PipeClient(unix_socket=unix_socket).server_remote_shutdown()
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='AF_UNIX client')
+def test_unix_socket_server(unix_pipe_client):
+    def unix_add(x, y=0):
+        print(x + y)
+        return x + y
+
+    unix_add = unix_pipe_client.register_func(unix_add)
+    assert [unix_add(i, y=i) for i in range(10)] == list(range(0, 20, 2))
+    assert unix_pipe_client.exec('print("unix")', std_cap=True) == 'unix\n'
+    assert os.path.exists(unix_pipe_client.pipe_client_rpc.unix_socket)
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='AF_UNIX client')
+def test_unix_socket_server_file_transfer(unix_pipe_client):
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(int(4096 * 10.5))
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        unix_pipe_client.file_transfer_to_server(local_file, remote_file)
+        assert unix_pipe_client.file_bytes_transfer_to_client(
+            remote_file) == content
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='AF_UNIX client')
+def test_unix_socket_async_pipe_client(unix_pipe_client):
+    async def scenario():
+        pipe_client = AsyncPipeClient(
+            unix_socket=unix_pipe_client.pipe_client_rpc.unix_socket)
+        return await pipe_client.exec('print("async unix")', std_cap=True)
+
+    assert run_async(scenario()) == 'async unix\n'
+
+
+################################################################################
+# Test Async Pipe Client
+################################################################################
+
+def run_async(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def test_async_pipe_client_exec(capsys):
+    async def scenario():
+        pipe_client = AsyncPipeClient()
+        assert await pipe_client.get_server_banner()
+        await pipe_client.exec('print("async live")')
+        return await pipe_client.exec('print("async cap")', std_cap=True)
+
+    assert run_async(scenario()) == 'async cap\n'
+    assert capsys.readouterr().out.startswith('async live\n')
+
+
+def test_async_pipe_client_concurrent_func_exec():
+    def async_add(x, y=0):
+        return x + y
+
+    async def scenario():
+        pipe_client = AsyncPipeClient()
+        add = await pipe_client.register_func(async_add)
+        return await asyncio.gather(*[add(i, y=i) for i in range(200)])
+
+    assert run_async(scenario()) == [i * 2 for i in range(200)]
+
+
+def test_async_pipe_client_remote_exec_error():
+    async def scenario():
+        await AsyncPipeClient().exec('raise ValueError("async")')
+
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        run_async(scenario())
+
+
+def test_async_pipe_client_class_proxy():
+    class AsyncTestClass:
+        count = 10
+
+        def __init__(self, value):
+            self.value = value
+
+        def add(self, x):
+            return self.value + x
+
+    async def scenario():
+        pipe_client = AsyncPipeClient()
+        cls_proxy = await pipe_client.register_class(AsyncTestClass)
+        obj = await cls_proxy(5)
+        await obj.value.set(7)
+        return await cls_proxy.count, await obj.value, await obj.add(3)
+
+    assert run_async(scenario()) == (10, 7, 10)
+
+
+def test_async_pipe_client_file_transfer():
+    async def scenario(local_file, remote_file):
+        pipe_client = AsyncPipeClient()
+        await pipe_client.file_transfer_to_server(local_file, remote_file)
+        return await pipe_client.file_bytes_transfer_to_client(remote_file)
+
+    with temp_bin_file() as local_file, temp_bin_file() as remote_file:
+        content = os.urandom(int(4096 * 10.5))
+        with open(local_file, 'wb') as f:
+            f.write(content)
+        assert run_async(scenario(local_file, remote_file)) == content
+
+    with pytest.raises(PipeFileTransferErr):
+        run_async(AsyncPipeClient().file_bytes_transfer_to_client(
+            '/this/file/not/exist'))
+
+
+def test_async_json_com_frame_too_large(monkeypatch):
+    async def scenario():
+        sock_a, sock_b = socket.socketpair()
+        reader, writer = await asyncio.open_connection(sock=sock_a)
+        json_com = AsyncTcpJsonCom(AsyncTcpNetIo(reader, writer))
+        try:
+            await json_com.send({'data': 'x' * 64})
+        finally:
+            writer.close()
+            sock_b.close()
+
+    monkeypatch.setattr('ghidra_pipe.pipe_async_client.FRAME_LENGTH_MASK', 32)
+    with pytest.raises(TcpNetIoError):
+        run_async(scenario())
+
+
+def test_async_pipe_client_custom_communicator():
+    def async_echo_communicator(tcp_json_com):
+        tcp_json_com.send(tcp_json_com.recv())
+
+    async def scenario():
+        pipe_client = AsyncPipeClient()
+        communicator = await pipe_client.register_custom_communicator(
+            async_echo_communicator, com_type='json')
+        tcp_json_com = await communicator()
+        await tcp_json_com.send({'data': 'C0FEBAB1'})
+        return await tcp_json_com.recv()
+
+    assert run_async(scenario()) == {'data': 'C0FEBAB1'}
+
+
+################################################################################
+# Test Binary Attachments
+################################################################################
+
+@pytest.fixture
+def attach_pipe_client(monkeypatch):
+    # the attachments are negotiated on the new multiplexed connection
+    monkeypatch.setattr('ghidra_pipe.pipe_client.PIPE_ATTACHMENTS', True)
+    pipe_client = PipeClient(multiplex=True)
+    yield pipe_client
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+def test_attachments_func_exec(attach_pipe_client):
+    def attach_echo(data, prefix=None):
+        return {'data': data, 'prefix': prefix, 'len': len(data)}
+
+    attach_echo = attach_pipe_client.register_func(attach_echo)
+    content = bytearray(os.urandom(4096 * 100))
+    ret = attach_echo(content, prefix=bytearray(b'\xDE\xAD'))
+    assert ret == {'data': content, 'prefix': bytearray(b'\xDE\xAD'),
+                   'len': len(content)}
+
+
+def test_attachments_byte_jarray(attach_pipe_client):
+    def attach_jarray(size):
+        import jarray
+        buff = jarray.zeros(size, 'b')
+        buff[0] = -1
+        return buff
+
+    attach_jarray = attach_pipe_client.register_func(attach_jarray)
+    assert attach_jarray(4096) == bytearray(b'\xff' + b'\x00' * 4095)
+
+
+def test_attachments_object_proxy_setattr(attach_pipe_client):
+    class AttachHolder:
+        def __init__(self):
+            self.data = None
+
+    holder = attach_pipe_client.register_class(AttachHolder)()
+    content = bytearray(os.urandom(4096 * 10))
+    holder.data = content
+    assert holder.data == content
+
+
+def test_attachments_frames():
+    sock_a, sock_b = socket.socketpair()
+    com_a, com_b = TcpJsonCom(), TcpJsonCom()
+    com_a.set_socket(sock_a)
+    com_b.set_socket(sock_b)
+    data = {'a': bytearray(b'\x00\x01'), 'b': [bytearray(4096 * 3), 'x']}
+
+    com_a.attachments = True
+    com_a.send(data)
+    assert com_a.flags & FRAME_ATTACHMENTS
+    assert com_b.recv() == data
+    com_a.send({'a': 1})
+    assert not com_a.flags
+    assert com_b.recv() == {'a': 1}
+    com_a.attachments = False
+    com_a.send(data)
+    assert not com_a.flags
+    assert com_b.recv() == data
+    sock_a.close()
+    sock_b.close()
+
+
+def test_attachments_negotiate():
+    with TcpClient(PIPE_IP, PIPE_PORT) as tcp_client:
+        assert not tcp_client.attachments
+        tcp_client.negotiate_attachments()
+        assert tcp_client.attachments
+
+
+################################################################################
+# Test Client Frame Decoding
+################################################################################
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_frame_decode_json(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip('orjson')
+    monkeypatch.setattr('ghidra_pipe.pipe_client.PIPE_ORJSON', use_orjson)
+    text = b'{"a": [1, 2.5, null, "x", {"b": true}], ' \
+        b'"big": 18446744073709551616}'
+    assert frame_decode(bytearray(text), 0) == {
+        'a': [1, 2.5, None, 'x', {'b': True}], 'big': 2 ** 64}
+    nan = frame_decode(bytearray(b'[NaN]'), 0)
+    assert nan[0] != nan[0]
+
+    text = b'[{"__bytearray__": true, "data": "3q0="}, ' \
+        b'{"k": [{"__bytearray__": true, "offset": 1, "length": 2}]}]'
+    body = struct.pack('!I', len(text)) + text + b'\x00\x01\x02'
+    assert frame_decode(bytearray(body), FRAME_ATTACHMENTS) == [
+        bytearray(b'\xde\xad'), {'k': [bytearray(b'\x01\x02')]}]
+
+
+def test_frame_decode_large_result():
+    def decode_records(count):
+        return [{'name': 'FUN_{:08x}'.format(i), 'entry': i, 'thunk': False}
+                for i in range(count)]
+
+    records = PipeClient().register_func(decode_records)(100000)
+    assert len(records) == 100000
+    assert records[-1] == {'name': 'FUN_0001869f', 'entry': 99999,
+                           'thunk': False}
+
+
+################################################################################
+# Test MessagePack Codec
+################################################################################
+
+def test_msgpack_codec_func_exec(capsys):
+    def msgpack_echo(data):
+        print('msgpack')
+        return data
+
+    pipe_client = PipeClient(codec='msgpack')
+    with pipe_client.pipe_client_rpc.pool.connection() as tcp_client:
+        assert tcp_client.codec == 'msgpack'
+    msgpack_echo = pipe_client.register_func(msgpack_echo)
+    data = {'int': [0, -1, 2 ** 40, -2 ** 63, 2 ** 80], 'float': 1.5,
+            'str': 'gh\xefdra', 'none': None, 'bool': [True, False],
+            'bytes': bytearray(os.urandom(4096 * 10)), 1: 'int key'}
+    assert msgpack_echo(data) == data
+    assert capsys.readouterr().out == 'msgpack\n'
+    assert pipe_client.exec('print("x" * 20000)', std_cap=True) == \
+        'x' * 20000 + '\n'
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        pipe_client.exec('1 / 0')
+
+
+def test_msgpack_codec_byte_jarray():
+    def msgpack_jarray(size):
+        import jarray
+        return jarray.zeros(size, 'b')
+
+    msgpack_jarray = PipeClient(codec='msgpack').register_func(msgpack_jarray)
+    assert msgpack_jarray(4096) == bytearray(4096)
+
+
+def test_msgpack_codec_compression_multiplex():
+    pipe_client = PipeClient(codec='msgpack', compression=True,
+                             multiplex=True)
+    large = 'z' * 100000
+    assert pipe_client.exec('print("{}")'.format(large), std_cap=True) == \
+        large + '\n'
+    with temp_bin_file() as remote_file:
+        pipe_client.file_bytes_transfer_to_server(b'msgpack', remote_file)
+        assert pipe_client.file_bytes_transfer_to_client(
+            remote_file) == b'msgpack'
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+def test_msgpack_codec_nio_server(nio_pipe_client):
+    def nio_msgpack_echo(data):
+        return data
+
+    pipe_client = PipeClient(port=nio_pipe_client.port, codec='msgpack')
+    content = bytearray(os.urandom(4096 * 40))
+    assert pipe_client.exec('print("nio")', std_cap=True) == 'nio\n'
+    nio_echo = pipe_client.register_func(nio_msgpack_echo)
+    assert nio_echo(content) == content
+
+
+def test_msgpack_codec_unknown():
+    with TcpClient(PIPE_IP, PIPE_PORT) as tcp_client:
+        tcp_client.negotiate_codec('cbor')
+        assert tcp_client.codec == 'json'
+
+
+def test_msgpack_codec_frames():
+    sock_a, sock_b = socket.socketpair()
+    com_a, com_b = TcpJsonCom(), TcpJsonCom()
+    com_a.set_socket(sock_a)
+    com_b.set_socket(sock_b)
+    com_a.codec = com_b.codec = 'msgpack'
+    data = {'a': bytearray(b'\x00\x01'), 'b': [bytearray(4096 * 3), 'x']}
+
+    com_a.send(data)
+    assert not com_a.flags
+    assert com_b.recv() == data
+    sock_a.close()
+    sock_b.close()
+
+
+def test_msgpack_codec_encoding():
+    for data in [None, True, 0, 127, -32, -33, 255, 2 ** 64 - 1, 2 ** 64,
+                 -2 ** 63 - 1, 0.25, '', 'x' * 32, '\u00e9' * 70000, [],
+                 list(range(16)), {str(i): i for i in range(16)},
+                 bytearray(70000)]:
+        assert msgpack_loads(msgpack_dumps(data)) == data
+    assert msgpack_dumps([1, 'a']) == b'\x92\x01\xa1a'
+    assert msgpack_loads(msgpack_dumps((1, b'a'))) == [1, bytearray(b'a')]
+    with pytest.raises(TypeError):
+        msgpack_dumps(object())
+    for invalid in [b'\xc1', b'\xa2a', b'\x01\x02']:
+        with pytest.raises(MsgPackError):
+            msgpack_loads(invalid)
+
+
+################################################################################
+# Test Gson Codec
+################################################################################
+
+@pytest.fixture(scope='module')
+def gson_pipe_client():
+    if not GSON_JAR:
+        pytest.skip('GSON_JAR not set')
+    port = PIPE_PORT + 4
+    classpath = os.pathsep.join(
+        filter(None, [GSON_JAR, os.getenv('CLASSPATH')]))
+    start_pipe_server([PIPE_SERVER_START_SCRIPT], port=port,
+                      server_env={'CLASSPATH': classpath})
+    yield PipeClient(port=port)
+    PipeClient(port=port).server_remote_shutdown()
+
+
+def test_gson_codec_func_exec(gson_pipe_client):
+    def gson_echo(data):
+        import pipe_server
+        return {'gson': pipe_server.GSON is not None, 'data': data,
+                'keys': {1: 'int', None: 'none', 2.5: 'float'},
+                'tuple': (1, 'x'), 'big': 2 ** 70, 'str': 'caf\xc3\xa9'}
+
+    gson_echo = gson_pipe_client.register_func(gson_echo)
+    data = {'list': [1, -2.5, None, True, 'gh\u00efdra <&>'], 'nested': {}}
+    assert gson_echo(data) == {
+        'gson': True, 'data': data,
+        'keys': {'1': 'int', 'null': 'none', '2.5': 'float'},
+        'tuple': [1, 'x'], 'big': 2 ** 70, 'str': 'caf\u00e9'}
+
+
+def test_gson_codec_bytearray(gson_pipe_client, monkeypatch):
+    def gson_bytes(data):
+        import jarray
+        return [data, jarray.zeros(16, 'b')]
+
+    content = bytearray(os.urandom(4096 * 10))
+    gson_bytes = gson_pipe_client.register_func(gson_bytes)
+    assert gson_bytes(content) == [content, bytearray(16)]
+
+    # raw attachments, on a new connection negotiating them
+    monkeypatch.setattr('ghidra_pipe.pipe_client.PIPE_ATTACHMENTS', True)
+    pipe_client = PipeClient(port=gson_pipe_client.port, multiplex=True)
+    gson_bytes = pipe_client.register_func(gson_bytes)
+    assert gson_bytes(content) == [content, bytearray(16)]
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+################################################################################
+# Test Streamed Iterators
+################################################################################
+
+def test_iter_func_exec_generator(capsys):
+    def iter_squares(n):
+        for i in range(n):
+            print('square {}'.format(i))
+            yield i * i
+
+    pipe_client = PipeClient()
+    iter_squares = pipe_client.register_func(iter_squares)
+    squares = iter_squares(2500)
+    assert isinstance(squares, RemoteIterator)
+    assert list(squares) == [i * i for i in range(2500)]
+    assert capsys.readouterr().out == ''.join(
+        'square {}\n'.format(i) for i in range(2500))
+    assert list(iter_squares(0)) == []
+
+
+def test_iter_exec_java_iterator():
+    def iter_java(n):
+        from java.util import ArrayList
+        return ArrayList(range(n)).iterator()
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(iter_java)
+    items = pipe_client.iter_exec('iter_java', (1000,), batch_size=64)
+    assert list(items) == list(range(1000))
+    assert list(pipe_client.iter_exec(
+        'sorted', ('cab',), batch_size=2)) == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('batch_size', [1, 7, 100])
+def test_iter_exec_batch_size(batch_size):
+    items = PipeClient().iter_exec('range', (100,), batch_size=batch_size)
+    assert list(items) == list(range(100))
+
+
+def test_iter_exec_error():
+    def iter_error(n):
+        for i in range(n):
+            yield i
+        raise ValueError('iter_error')
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(iter_error)
+    items = pipe_client.iter_exec('iter_error', (10,), batch_size=4)
+    assert [next(items) for _ in range(8)] == list(range(8))
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        list(items)
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        pipe_client.iter_exec('len', (1,))
+
+
+def test_iter_exec_close():
+    def iter_closed():
+        global iter_closed_done
+        iter_closed_done = False
+        try:
+            for i in range(1000):
+                yield i
+        finally:
+            iter_closed_done = True
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(iter_closed)
+    with pipe_client.iter_exec('iter_closed', batch_size=10) as items:
+        assert next(items) == 0
+        iterator_id = items.iterator_id
+    assert pipe_client.exec('print(iter_closed_done)', std_cap=True) == \
+        'True\n'
+    assert list(items) == []
+    with pytest.raises(PipeServerInternalErr):
+        pipe_client.pipe_client_rpc._rpc_request(
+            'iter_next', {'iterator': iterator_id, 'count': 1,
+                          'std_forward': False})
+
+
+def test_iter_exec_multiplex(capsys):
+    def iter_multiplex(n):
+        for i in range(n):
+            print(i)
+            yield str(i)
+
+    pipe_client = PipeClient(multiplex=True)
+    iter_multiplex = pipe_client.register_func(iter_multiplex)
+    streams = [iter_multiplex(300) for _ in range(4)]
+    assert [list(items) for items in streams] == \
+        [[str(i) for i in range(300)]] * 4
+    assert capsys.readouterr().out.count('\n') == 1200
+    pipe_client.pipe_client_rpc.close_multiplex_connection()
+
+
+################################################################################
+# Test Paged Results
+################################################################################
+
+def test_paged_sequence_func_exec():
+    def paged_range(n):
+        return list(range(n))
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(paged_range)
+    results = pipe_client.handle_exec('paged_range', (100000,))
+    assert isinstance(results, RemoteSequenceProxy)
+    assert len(results) == 100000
+    assert results[5000:5100] == list(range(5000, 5100))
+    assert results[-1] == 99999
+    assert results[::-9999] == list(range(100000))[::-9999]
+    assert list(results) == list(range(100000))
+    with pytest.raises(IndexError):
+        results[100000]
+    results.close()
+    with pytest.raises(PipeServerInternalErr):
+        results[50]
+
+
+def test_paged_mapping_func_exec():
+    def paged_dict(n):
+        return dict((i, str(i)) for i in range(n))
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(paged_dict)
+    with pipe_client.handle_exec('paged_dict', (5000,)) as results:
+        assert isinstance(results, RemoteMappingProxy)
+        assert len(results) == 5000
+        assert results[42] == '42'
+        assert 4999 in results and 5000 not in results
+        with pytest.raises(KeyError):
+            results[-1]
+        assert dict(results.items()) == paged_dict(5000)
+
+
+def test_paged_java_collections():
+    def paged_java_list(n):
+        from java.util import ArrayList
+        return ArrayList(range(n))
+
+    def paged_java_map(n):
+        from java.util import HashMap
+        mapping = HashMap()
+        for i in range(n):
+            mapping.put('k{}'.format(i), i)
+        return mapping
+
+    pipe_client = PipeClient()
+    pipe_client.register_func(paged_java_list)
+    pipe_client.register_func(paged_java_map)
+    items = pipe_client.handle_exec('paged_java_list', (3000,))
+    assert isinstance(items, RemoteSequenceProxy)
+    assert items[2500:] == list(range(2500, 3000))
+    assert list(items) == list(range(3000))
+    mapping = pipe_client.handle_exec('paged_java_map', (3000,))
+    assert isinstance(mapping, RemoteMappingProxy)
+    assert mapping['k1234'] == 1234
+    assert dict(mapping.items()) == {'k{}'.format(i): i for i in range(3000)}
+
+
+def test_paged_threshold(monkeypatch):
+    class PagedRecords:
+        def __init__(self):
+            self.records = list(range(20000))
+            self.small = [1, 2]
+
+    monkeypatch.setattr(PipeClientJsonRpc.func_exec, '__defaults__',
+                        (True, 10000))
+    monkeypatch.setattr(PipeClientJsonRpc.object_proxy_getattr,
+                        '__defaults__', (10000,))
+    pipe_client = PipeClient()
+    records = pipe_client.register_class(PagedRecords)()
+    assert isinstance(records.records, RemoteSequenceProxy)
+    assert records.records[19999] == 19999
+    assert records.small == [1, 2]
+    assert pipe_client.pipe_client_rpc.func_exec(
+        'range', (10,), {}) == list(range(10))
+    assert isinstance(pipe_client.pipe_client_rpc.func_exec(
+        'range', (10000,), {}), RemoteSequenceProxy)
+
+
+def test_paged_release():
+    pipe_client = PipeClient()
+    pipe_client_rpc = pipe_client.pipe_client_rpc
+    results = pipe_client.handle_exec('range', (10,))
+    handle_id = results.handle_id
+    del results
+    assert pipe_client_rpc._released_handles == [handle_id]
+    assert pipe_client.exec('print(1)', std_cap=True) == '1\n'
+    assert pipe_client_rpc._released_handles == []
+    with pytest.raises(PipeServerInternalErr):
+        pipe_client_rpc._rpc_request(
+            'handle_page', {'handle': handle_id, 'start': 0, 'stop': 1})
+
+
+################################################################################
+# Test Code Cache
+################################################################################
+
+def test_code_cache_func_exec_direct_call():
+    def cached_call(a, b=1, *args, **kwargs):
+        return [a, b, list(args), sorted(kwargs.items())]
+
+    pipe_client = PipeClient()
+    cached_call = pipe_client.register_func(cached_call)
+    assert cached_call(1) == [1, 1, [], []]
+    assert cached_call(1, 2, 3, c=4) == [1, 2, [3], [['c', 4]]]
+    assert pipe_client.exec(
+        'print(sorted(n for n in globals() if n.startswith("__arg") or '
+        'n.startswith("__kwarg") or n.startswith("__ret")))',
+        std_cap=True) == '[]\n'
+    assert pipe_client.pipe_client_rpc.func_exec(
+        '"-".join', (['a', 'b'],), {}) == 'a-b'
+
+
+def test_code_cache_rebound_name():
+    def cached_rebound():
+        return 1
+
+    pipe_client = PipeClient()
+    cached_rebound = pipe_client.register_func(cached_rebound)
+    assert cached_rebound() == 1
+    pipe_client.exec('def cached_rebound():\n    return 2')
+    assert cached_rebound() == 2
+
+
+def test_code_cache_errors():
+    pipe_client = PipeClient()
+    with pytest.raises(PipeServerRemoteCodeExecErr) as ex:
+        pipe_client.pipe_client_rpc.func_exec('cached_not_exist', (), {})
+    assert ex.value.code == 'cached_not_exist(*args, **kwargs)'
+    assert 'NameError' in ex.value.stacktrace
+    for _ in range(2):
+        with pytest.raises(PipeServerRemoteCodeExecErr) as ex:
+            pipe_client.exec('1 +')
+        assert 'SyntaxError' in ex.value.stacktrace
+    pipe_client.exec('cached_counter = 0')
+    for _ in range(3):
+        pipe_client.exec('cached_counter += 1')
+    assert pipe_client.exec('print(cached_counter)', std_cap=True) == '3\n'
+    assert pipe_client.exec(
+        'print((\'exec\', \'cached_counter += 1\') in CODE_CACHE.codes)',
+        std_cap=True) == 'True\n'
+
+
+################################################################################
+# Test Idempotent Registration
+################################################################################
+
+def test_register_code_skipped():
+    def reg_once():
+        return 'once'
+
+    pipe_client = PipeClient()
+    reg_once_proxy = pipe_client.register_func(reg_once)
+    pipe_client.exec('reg_once_first = reg_once')
+    assert PipeClient().register_func(reg_once)() == 'once'
+    assert reg_once_proxy() == 'once'
+    assert pipe_client.exec('print(reg_once_first is reg_once)',
+                            std_cap=True) == 'True\n'
+    assert pipe_client.pipe_client_rpc._rpc_request('register_code', {
+        'name': 'reg_once', 'hash': '0', 'code': None,
+        'std_forward': False}) == {'registered': False}
+
+
+def test_register_code_changed_or_rebound():
+    pipe_client_rpc = PipeClientJsonRpc()
+    pipe_client_rpc.register_code('reg_changed', 'def reg_changed():\n'
+                                                 '    return 1\n')
+    assert pipe_client_rpc.func_exec('reg_changed', (), {}) == 1
+    pipe_client_rpc.register_code('reg_changed', 'def reg_changed():\n'
+                                                 '    return 2\n')
+    assert pipe_client_rpc.func_exec('reg_changed', (), {}) == 2
+    pipe_client_rpc.exec('reg_changed = len')
+    pipe_client_rpc.register_code('reg_changed', 'def reg_changed():\n'
+                                                 '    return 2\n')
+    assert pipe_client_rpc.func_exec('reg_changed', (), {}) == 2
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        pipe_client_rpc.register_code('reg_error', 'reg_error = 1 +')
+
+
+def test_register_code_older_server(monkeypatch):
+    # the registration falls back to code_exec against a server without
+    # register_code, see dispatch
+    pipe_client_rpc = PipeClientJsonRpc()
+    rpc_request = pipe_client_rpc._rpc_request
+
+    def older_rpc_request(method, args):
+        if method in ['register_code', 'register_codes']:
+            return rpc_request('register_' + method, args)
+        return rpc_request(method, args)
+
+    monkeypatch.setattr(pipe_client_rpc, '_rpc_request', older_rpc_request)
+    pipe_client_rpc.register_code('reg_older', 'def reg_older():\n'
+                                               '    return 1\n')
+    assert pipe_client_rpc.func_exec('reg_older', (), {}) == 1
+    pipe_client_rpc.register_codes([('reg_older', 'def reg_older():\n'
+                                                  '    return 2\n')])
+    assert pipe_client_rpc.func_exec('reg_older', (), {}) == 2
+
+
+def test_register_code_class_and_communicator():
+    class RegClass:
+        COUNT = 0
+
+    def reg_communicator(tcp_net_io):
+        buff = jarray.zeros(0, 'b')
+        buff.fromstring(b'reg')
+        tcp_net_io.sendall(buff)
+
+    pipe_client = PipeClient()
+    RegClassProxy = pipe_client.register_class(RegClass)
+    RegClassProxy.COUNT = 1
+    # the class is not defined again, its attributes are kept
+    assert pipe_client.register_class(RegClass).COUNT == 1
+    for _ in range(2):
+        reg_com = pipe_client.register_custom_communicator(reg_communicator)
+        assert reg_com().recvall(3) == b'reg'
+
+
+################################################################################
+# Test Bulk Registration
+################################################################################
+
+def test_register_many():
+    def many_add(a, b):
+        return a + b
+
+    class ManyCounter:
+        def __init__(self, start):
+            self.value = start
+
+        def incr(self):
+            self.value += 1
+            return self.value
+
+    pipe_client = PipeClient()
+    many_add, ManyCounter = pipe_client.register_many(many_add, ManyCounter)
+    assert many_add(1, 2) == 3
+    assert ManyCounter(41).incr() == 42
+    with pytest.raises(ValueError):
+        pipe_client.register_many(many_add, 'not a function')
+
+
+def test_register_many_defer():
+    pipe_client = PipeClient()
+
+    @pipe_client.remote
+    def deferred_double(x):
+        return many_helper(x) * 2
+
+    @pipe_client.remote
+    def many_helper(x):
+        return x + 1
+
+    pipe_client_rpc = pipe_client.pipe_client_rpc
+    assert [name for name, _ in pipe_client_rpc._deferred_codes] == \
+        ['deferred_double', 'many_helper']
+    assert deferred_double(1) == 4
+    assert pipe_client_rpc._deferred_codes == []
+    assert many_helper.__PROXY_SRC__.startswith('def many_helper(x):')
+
+
+def test_register_many_error():
+    pipe_client = PipeClient()
+
+    @pipe_client.remote
+    def deferred_error():
+        return not_exist  # noqa: F821
+
+    # the failed registration is raised once, by the next request
+    pipe_client.pipe_client_rpc.defer_codes([('many_error', '1 +')])
+    with pytest.raises(PipeServerRemoteCodeExecErr):
+        pipe_client.get_server_banner()
+    assert pipe_client.get_server_banner() == 'PipeServer JSON RPC v2'
+    with pytest.raises(PipeServerRemoteCodeExecErr) as ex:
+        deferred_error()
+    assert 'NameError' in ex.value.stacktrace
+
+
+def test_register_many_clear_deferred():
+    pipe_client = PipeClient()
+
+    @pipe_client.remote
+    def deferred_dropped():
+        return 1
+
+    assert pipe_client.clear_deferred() == ['deferred_dropped']
+    assert pipe_client.clear_deferred() == []
+
+
+################################################################################
+# Test Package Registration
+################################################################################
+
+def write_package(root, version):
+    package = os.path.join(root, 'pipe_test_pkg')
+    os.makedirs(os.path.join(package, 'sub'), exist_ok=True)
+    with open(os.path.join(package, '__init__.py'), 'w') as f:
+        f.write('from pipe_test_pkg.sub.helpers import version\n')
+    with open(os.path.join(package, 'sub', '__init__.py'), 'w') as f:
+        f.write('')
+    with open(os.path.join(package, 'sub', 'helpers.py'), 'w') as f:
+        f.write('def version():\n    return {}\n'.format(version))
+
+
+def test_register_package(tmp_path, monkeypatch):
+    write_package(str(tmp_path), 1)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    pipe_client = PipeClient()
+    pipe_client.register_package('pipe_test_pkg')
+    assert pipe_client.exec('import pipe_test_pkg\n'
+                            'print(pipe_test_pkg.version())',
+                            std_cap=True) == '1\n'
+
+    import pipe_test_pkg
+    from ghidra_pipe.pipe_client import _package_bundle
+    bundle = _package_bundle(pipe_test_pkg)
+    assert pipe_client.pipe_client_rpc._rpc_request('register_package', {
+        'name': 'pipe_test_pkg', 'bundle': None,
+        'hash': hashlib.sha256(bundle).hexdigest()}) == {'registered': True}
+    assert pipe_client.pipe_client_rpc._rpc_request('register_package', {
+        'name': 'pipe_test_pkg', 'bundle': None,
+        'hash': hashlib.sha256(b'').hexdigest()}) == {'registered': False}
+
+    write_package(str(tmp_path), 2)
+    pipe_client.register_package(pipe_test_pkg)
+    assert pipe_client.exec('import pipe_test_pkg\n'
+                            'print(pipe_test_pkg.version())',
+                            std_cap=True) == '2\n'
+
+    # an altered stored package is sent again by the client
+    bundle_hash = hashlib.sha256(bundle).hexdigest()
+    pipe_client.exec('open(os.path.join(package_store_path({!r}), '
+                     '"pipe_test_pkg", "sub", "helpers.py"), "w").write("")'
+                     .format(bundle_hash))
+    assert pipe_client.pipe_client_rpc._rpc_request('register_package', {
+        'name': 'pipe_test_pkg', 'bundle': None,
+        'hash': bundle_hash}) == {'registered': False}
+
+
+def test_register_package_errors():
+    pipe_client = PipeClient()
+    with pytest.raises(ValueError):
+        pipe_client.register_package('email.mime')
+    with pytest.raises(PipeServerInternalErr):
+        pipe_client.pipe_client_rpc._rpc_request('register_package', {
+            'name': 'pipe_test_bad', 'hash': '0' * 64,
+            'bundle': bytearray(b'not a zip')})
+
+
 ################################################################################
 # Test remote shutdown
 ################################################################################